@@ -0,0 +1,1026 @@
+import random
+import string
+import time
+
+from index import ArticleIndex, KeywordIndex
+import dump
+import fuzzy
+import loader
+import mapped_index
+import normalize
+import os
+import postings
+import query
+import ranking
+import search
+import segments
+import snapshot
+import table
+import tempfile
+import threading
+import title_index
+import tracemalloc
+import vocabulary
+import wal
+
+
+def _random_word(rng, length=8):
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(length))
+
+
+def _vocabulary(size, seed=0):
+    rng = random.Random(seed)
+    keyword_to_titles = {}
+    while len(keyword_to_titles) < size:
+        keyword_to_titles[_random_word(rng)] = [
+            "Article " + str(len(keyword_to_titles))
+        ]
+    return keyword_to_titles
+
+
+def _corpus(articles, vocabulary_size=50_000, keywords_per_article=40, seed=0):
+    # Synthetic metadata shaped like wiki.METADATA, with Zipf-ish keyword usage
+    rng = random.Random(seed)
+    vocabulary = [_random_word(rng, rng.randint(3, 10)) for _ in range(vocabulary_size)]
+    authors = [_random_word(rng, 6).title() for _ in range(max(1, articles // 50))]
+    metadata = []
+    for article in range(articles):
+        keywords = set()
+        while len(keywords) < keywords_per_article:
+            keywords.add(vocabulary[int(vocabulary_size * rng.random() ** 3)])
+        metadata.append(
+            [
+                "Article %d %s" % (article, _random_word(rng, 12)),
+                rng.choice(authors),
+                rng.randint(1_000_000_000, 1_700_000_000),
+                rng.randint(100, 100_000),
+                list(keywords),
+            ]
+        )
+    return metadata
+
+
+def _linear_search(keyword, keyword_to_titles):
+    # The original implementation of search(), kept here for comparison
+    for key_word in keyword_to_titles:
+        if keyword == key_word:
+            return keyword_to_titles[key_word]
+    return []
+
+
+def _remove_filter_out(keyword, article_titles, keyword_to_titles):
+    # The original list.remove based filter_out, kept here for comparison
+    does_not_contain_keyword = article_titles.copy()
+    for article in keyword_to_titles.get(keyword, ()):
+        if article in article_titles:
+            does_not_contain_keyword.remove(article)
+    return does_not_contain_keyword
+
+
+def _time_per_call(function, arguments, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for argument in arguments:
+            function(argument)
+    return (time.perf_counter() - start) / (repeat * len(arguments))
+
+
+def bench_keyword_lookup(sizes=(1_000, 10_000, 100_000, 1_000_000), queries=200):
+    """Prints per-query latency of linear scan vs KeywordIndex as vocabulary grows"""
+    print("keyword lookup (microseconds per query)")
+    print("%10s %14s %14s" % ("vocabulary", "linear scan", "KeywordIndex"))
+    for size in sizes:
+        keyword_to_titles = _vocabulary(size)
+        index = KeywordIndex(keyword_to_titles)
+        rng = random.Random(size)
+        keywords = rng.sample(list(keyword_to_titles), queries // 2)
+        keywords += [_random_word(rng, 9) for _ in range(queries // 2)]  # misses
+
+        # Linear scan gets a handful of queries, it is far too slow for more
+        linear = _time_per_call(
+            lambda keyword: _linear_search(keyword, keyword_to_titles), keywords[:5]
+        )
+        hashed = _time_per_call(index.lookup, keywords, repeat=50)
+        print("%10d %14.2f %14.3f" % (size, linear * 1e6, hashed * 1e6))
+
+
+def bench_index_cache(queries=1_000):
+    """Prints the one-off index build cost against the per-query cost"""
+    search.invalidate_indexes()
+    before = search.index_timings()
+    search.load_indexes()
+    build = search.index_timings()["build_seconds"] - before["build_seconds"]
+
+    keywords = list(search.load_indexes()[0])[:queries]
+    start = time.perf_counter()
+    for keyword in keywords:
+        search.filter_to_author("Burna Boy", search.search(keyword))
+    per_query = (time.perf_counter() - start) / len(keywords)
+
+    print("index cache")
+    print("  build once:     %10.2f ms" % (build * 1e3))
+    print("  per query:      %10.2f ms" % (per_query * 1e3))
+    print("  old per query:  %10.2f ms (rebuild + query)" % ((build + per_query) * 1e3))
+
+
+def bench_snapshot(articles=100_000):
+    """Prints index build time from metadata against snapshot load time"""
+    metadata = _corpus(articles)
+    start = time.perf_counter()
+    keyword_to_titles = search.keyword_to_titles(metadata)
+    title_to_info = search.title_to_info(metadata)
+    build = time.perf_counter() - start
+    start = time.perf_counter()
+    article_index = ArticleIndex.from_metadata(metadata)
+    build_index = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "indexes.snapshot")
+        snapshot.write_snapshot(path, keyword_to_titles, title_to_info)
+        size = os.path.getsize(path)
+        start = time.perf_counter()
+        snapshot.load_snapshot(path)
+        load = time.perf_counter() - start
+        start = time.perf_counter()
+        snapshot.write_snapshot(path, article_index)
+        write_index = time.perf_counter() - start
+        start = time.perf_counter()
+        snapshot.load_snapshot_index(path)
+        load_index = time.perf_counter() - start
+
+    print("snapshot (%d articles)" % articles)
+    print("  build from metadata: %8.1f ms" % (build * 1e3))
+    print("  load snapshot:       %8.1f ms" % (load * 1e3))
+    print("  snapshot size:       %8.1f MB" % (size / 1e6))
+    print("  build ArticleIndex:  %8.1f ms" % (build_index * 1e3))
+    print("  write ArticleIndex:  %8.1f ms" % (write_index * 1e3))
+    print("  load ArticleIndex:   %8.1f ms" % (load_index * 1e3))
+
+
+def bench_mapped_index(articles=100_000, queries=1_000):
+    """Prints open and query cost of a mapped index against a snapshot load"""
+    metadata = _corpus(articles)
+    keyword_to_titles = search.keyword_to_titles(metadata)
+    title_to_info = search.title_to_info(metadata)
+    keywords = random.Random(0).sample(list(keyword_to_titles), queries)
+    del metadata
+
+    with tempfile.TemporaryDirectory() as directory:
+        snapshot_path = os.path.join(directory, "indexes.snapshot")
+        mapped_path = os.path.join(directory, "indexes.mapped")
+        snapshot.write_snapshot(snapshot_path, keyword_to_titles, title_to_info)
+        mapped_index.write_mapped_index(mapped_path, keyword_to_titles, title_to_info)
+        del keyword_to_titles, title_to_info
+
+        start = time.perf_counter()
+        snapshot.load_snapshot(snapshot_path)
+        load = time.perf_counter() - start
+
+        start = time.perf_counter()
+        index = mapped_index.MappedIndex(mapped_path)
+        opened = time.perf_counter() - start
+        start = time.perf_counter()
+        for keyword in keywords:
+            with index.lookup_ids(keyword) as title_ids:
+                len(title_ids)
+        lookup = (time.perf_counter() - start) / queries
+        start = time.perf_counter()
+        for keyword in keywords:
+            search.search(keyword, index)
+        titles = (time.perf_counter() - start) / queries
+        size = os.path.getsize(mapped_path)
+        index.close()
+
+    print("mapped index (%d articles)" % articles)
+    print("  load snapshot:        %8.1f ms" % (load * 1e3))
+    print("  open mapped index:    %8.3f ms" % (opened * 1e3))
+    print("  id lookup per query:  %8.3f ms" % (lookup * 1e3))
+    print("  search() per query:   %8.3f ms" % (titles * 1e3))
+    print("  file size:            %8.1f MB" % (size / 1e6))
+
+
+def _allocated(build):
+    tracemalloc.start()
+    result = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+def bench_article_ids(articles=100_000):
+    """Prints memory and filter cost of title keyed dictionaries vs ArticleIndex"""
+    metadata = _corpus(articles)
+    (keyword_to_titles, title_to_info), dictionaries = _allocated(
+        lambda: (search.keyword_to_titles(metadata), search.title_to_info(metadata))
+    )
+    index, ids = _allocated(lambda: ArticleIndex.from_metadata(metadata))
+
+    keyword = max(
+        keyword_to_titles, key=lambda keyword: len(keyword_to_titles[keyword])
+    )
+    titles = keyword_to_titles[keyword]
+    start = time.perf_counter()
+    search.filter_to_author(metadata[0][1], set(titles), title_to_info)
+    by_title = time.perf_counter() - start
+    start = time.perf_counter()
+    index.titles_for_ids(index.filter_author(index.lookup_ids(keyword), metadata[0][1]))
+    by_id = time.perf_counter() - start
+
+    print("article ids (%d articles)" % articles)
+    print("  title keyed dictionaries: %8.1f MB" % (dictionaries / 1e6))
+    print("  ArticleIndex:             %8.1f MB" % (ids / 1e6))
+    print("  author filter over %d titles:" % len(titles))
+    print("    by title: %8.2f ms" % (by_title * 1e3))
+    print("    by id:    %8.2f ms" % (by_id * 1e3))
+
+
+def bench_compressed_postings(articles=100_000, queries=200):
+    """Prints bytes per posting, decode throughput and lookup latency"""
+    metadata = _corpus(articles)
+    index = ArticleIndex.from_metadata(metadata)
+    compressed = ArticleIndex.from_metadata(metadata, compress=True)
+    del metadata
+
+    total = sum(len(ids) for ids in index.postings.values())
+    packed = sum(len(data) for data in compressed.postings.values())
+    start = time.perf_counter()
+    for data in compressed.postings.values():
+        postings.decode_postings(data)
+    decode = time.perf_counter() - start
+
+    # The most frequent keywords, the ones compression matters most for
+    keywords = sorted(index.postings, key=lambda keyword: -len(index.postings[keyword]))
+    keywords = keywords[:queries]
+    plain = _time_per_call(index.lookup_ids, keywords, repeat=5)
+    cold = ArticleIndex.from_metadata(_corpus(articles), compress=True)
+    cold.decoded_cache_size = 0
+    uncached = _time_per_call(cold.lookup_ids, keywords, repeat=5)
+    unpacked = _time_per_call(compressed.lookup_ids, keywords, repeat=5)
+    common = keywords[0]
+    search_plain = _time_per_call(lambda k: search.search(k, index), [common], 20)
+    search_packed = _time_per_call(lambda k: search.search(k, compressed), [common], 20)
+
+    print("compressed postings (%d articles, %d postings)" % (articles, total))
+    print("  bytes per posting:  %6.2f (array('I'): %d)" % (packed / total, 4))
+    print("  decode throughput:  %6.1f M postings/s" % (total / decode / 1e6))
+    print("  lookup_ids on the %d most frequent keywords:" % queries)
+    print("    array:            %8.3f ms" % (plain * 1e3))
+    print(
+        "    compressed:       %8.3f ms (uncached %.3f ms)"
+        % (unpacked * 1e3, uncached * 1e3)
+    )
+    print("  search() for %r (%d titles):" % (common, len(index.postings[common])))
+    print("    array:            %8.3f ms" % (search_plain * 1e3))
+    print("    compressed:       %8.3f ms" % (search_packed * 1e3))
+
+
+def bench_article_table(articles=100_000):
+    """Prints memory and filter cost of title_to_info vs ArticleTable"""
+    metadata = _corpus(articles)
+    title_to_info, dictionary = _allocated(lambda: search.title_to_info(metadata))
+    articles_table, columns = _allocated(
+        lambda: table.ArticleTable.from_metadata(metadata)
+    )
+    titles = set(article[0] for article in metadata[::2])
+    ids = articles_table.ids_for_titles(titles)
+    author = metadata[0][1]
+
+    print("article table (%d articles, %d candidates)" % (articles, len(titles)))
+    print("  title_to_info:  %6.1f MB" % (dictionary / 1e6))
+    print("  ArticleTable:   %6.1f MB" % (columns / 1e6))
+    print("  %-10s %12s %12s %12s" % ("", "dictionary", "array scan", "numpy"))
+    for name, by_dictionary, by_table in [
+        (
+            "length",
+            lambda: search.article_length(5000, titles, title_to_info),
+            lambda: articles_table.filter_length(ids, 5000),
+        ),
+        (
+            "author",
+            lambda: search.filter_to_author(author, titles, title_to_info),
+            lambda: articles_table.filter_author(ids, author),
+        ),
+        (
+            "year",
+            lambda: search.articles_from_year(2009, titles, title_to_info),
+            lambda: articles_table.filter_year(ids, 2009),
+        ),
+    ]:
+        numpy = table.numpy
+        timings = [_time_per_call(lambda _: by_dictionary(), [None])]
+        table.numpy = None
+        timings.append(_time_per_call(lambda _: by_table(), [None], 5))
+        table.numpy = numpy
+        if numpy is not None:
+            timings.append(_time_per_call(lambda _: by_table(), [None], 5))
+        print("  %-10s" % name + "".join("%10.2f ms" % (t * 1e3) for t in timings))
+
+
+def bench_length_index(articles=100_000):
+    """Prints length filter cost over a common keyword's results by range width"""
+    metadata = _corpus(articles)
+    title_to_info = search.title_to_info(metadata)
+    index = ArticleIndex.from_metadata(metadata)
+    keyword = max(index.postings, key=lambda keyword: len(index.postings[keyword]))
+    ids = index.lookup_ids(keyword)
+    titles = index.titles_for_ids(ids)
+    del metadata
+
+    print("length index (%d articles, %d candidates)" % (articles, len(ids)))
+    print("  %-18s %10s %12s %12s" % ("range", "matches", "dictionary", "index"))
+    for low, high in [(None, 150), (None, 1_000), (50_000, 51_000), (None, 50_000)]:
+        by_dictionary = _time_per_call(
+            lambda _: search.article_length(high, titles, title_to_info, low), [None]
+        )
+        by_index = _time_per_call(
+            lambda _: index.filter_length(ids, high, low), [None], repeat=20
+        )
+        matches = len(index.filter_length(ids, high, low))
+        print(
+            "  %-18s %10d %9.2f ms %9.3f ms"
+            % (
+                "%s..%s" % (low or "", high),
+                matches,
+                by_dictionary * 1e3,
+                by_index * 1e3,
+            )
+        )
+
+
+def bench_author_index(articles=100_000):
+    """Prints author filter and grouping cost over a common keyword's results"""
+    metadata = _corpus(articles)
+    title_to_info = search.title_to_info(metadata)
+    index = ArticleIndex.from_metadata(metadata)
+    keyword = max(index.postings, key=lambda keyword: len(index.postings[keyword]))
+    ids = index.lookup_ids(keyword)
+    titles = index.titles_for_ids(ids)
+    author = metadata[0][1]
+    del metadata
+
+    print("author index (%d articles, %d candidates)" % (articles, len(ids)))
+    print("  %-16s %12s %12s" % ("", "dictionary", "index"))
+    for name, by_dictionary, by_index in [
+        (
+            "filter_to_author",
+            lambda _: search.filter_to_author(author, titles, title_to_info),
+            lambda _: index.filter_author(ids, author),
+        ),
+        (
+            "key_by_author",
+            lambda _: search.key_by_author(titles, title_to_info),
+            lambda _: index.key_by_author(ids),
+        ),
+    ]:
+        print(
+            "  %-16s %9.2f ms %9.3f ms"
+            % (
+                name,
+                _time_per_call(by_dictionary, [None]) * 1e3,
+                _time_per_call(by_index, [None], repeat=10) * 1e3,
+            )
+        )
+
+
+def bench_filter_out(sizes=(10_000, 100_000, 1_000_000)):
+    """Prints filter_out cost by candidate count, excluding half the candidates"""
+    print("filter_out, excluding every other candidate (milliseconds)")
+    print("%10s %14s %12s %12s" % ("candidates", "list.remove", "set", "ids"))
+    for size in sizes:
+        metadata = [
+            [
+                "Article %d" % n,
+                "Author",
+                1_000_000_000,
+                1_000,
+                ["all"] + ["even"] * (n % 2 == 0),
+            ]
+            for n in range(size)
+        ]
+        keyword_to_titles = search.keyword_to_titles(metadata)
+        index = ArticleIndex.from_metadata(metadata)
+        titles = keyword_to_titles["all"]
+        del metadata
+        if size <= 10_000:
+            removal = "%11.1f ms" % (
+                _time_per_call(
+                    lambda _: _remove_filter_out("even", titles, keyword_to_titles),
+                    [None],
+                )
+                * 1e3
+            )
+        else:
+            removal = "%14s" % "(too slow)"
+        by_set = _time_per_call(
+            lambda _: search.filter_out("even", titles, keyword_to_titles), [None]
+        )
+        by_ids = _time_per_call(
+            lambda _: index.exclude(index.lookup_ids("all"), "even"), [None]
+        )
+        print("%10d %s %9.1f ms %9.1f ms" % (size, removal, by_set * 1e3, by_ids * 1e3))
+
+
+def bench_boolean_query(articles=100_000, queries=100):
+    """Prints boolean query latency against set operations over title lists"""
+    metadata = _corpus(articles)
+    keyword_to_titles = search.keyword_to_titles(metadata)
+    index = ArticleIndex.from_metadata(metadata)
+    del metadata
+    by_frequency = sorted(
+        index.postings, key=lambda keyword: len(index.postings[keyword])
+    )
+    common = by_frequency[-1]
+    rare = by_frequency[: len(by_frequency) // 2][-queries:]
+    middling = by_frequency[len(by_frequency) * 9 // 10 :][:queries]
+
+    def titles(keyword):
+        return set(keyword_to_titles[keyword])
+
+    print(
+        "boolean queries (%d articles, %d articles contain the common keyword)"
+        % (articles, len(index.postings[common]))
+    )
+    print("  %-26s %12s %12s" % ("query", "title sets", "postings"))
+    for name, operator, pairs, by_sets in [
+        ("rare AND common", "AND", [(k, common) for k in rare], set.intersection),
+        (
+            "middling AND common",
+            "AND",
+            [(k, common) for k in middling],
+            set.intersection,
+        ),
+        ("rare OR middling", "OR", list(zip(rare, middling)), set.union),
+        ("common NOT middling", "NOT", [(common, k) for k in middling], set.difference),
+    ]:
+        texts = ["%s %s %s" % (first, operator, second) for first, second in pairs]
+        by_sets = _time_per_call(
+            lambda pair: by_sets(titles(pair[0]), titles(pair[1])), pairs
+        )
+        by_postings = _time_per_call(
+            lambda text: query.evaluate(query.parse_query(text), index), texts
+        )
+        print("  %-26s %9.3f ms %9.3f ms" % (name, by_sets * 1e3, by_postings * 1e3))
+
+
+def bench_query_pipeline(articles=100_000):
+    """Prints chained filter cost: one scan per filter against a fused query"""
+    metadata = _corpus(articles)
+    keyword_to_titles = search.keyword_to_titles(metadata)
+    title_to_info = search.title_to_info(metadata)
+    index = ArticleIndex.from_metadata(metadata)
+    author = metadata[0][1]
+    del metadata
+    keyword = max(index.postings, key=lambda keyword: len(index.postings[keyword]))
+    excluded = sorted(index.postings, key=lambda keyword: len(index.postings[keyword]))[
+        -2
+    ]
+
+    def chained(_):
+        titles = search.search(keyword, keyword_to_titles)
+        titles = search.article_length(50_000, titles, title_to_info)
+        titles = search.filter_to_author(author, titles, title_to_info)
+        titles = search.filter_out(excluded, titles, keyword_to_titles)
+        return search.articles_from_year(2009, titles, title_to_info)
+
+    def fused(_):
+        query = search.Query(keyword, index).max_length(50_000).author(author)
+        return query.exclude(excluded).year(2009).titles()
+
+    assert chained(None) == fused(None)
+    print("query pipeline, length + author + exclude + year (%d articles)" % articles)
+    print(
+        "  chained over dictionaries: %8.2f ms"
+        % (_time_per_call(chained, [None], 3) * 1e3)
+    )
+    print(
+        "  fused over ArticleIndex:   %8.3f ms"
+        % (_time_per_call(fused, [None], 20) * 1e3)
+    )
+
+
+def bench_query_planner(articles=100_000):
+    """Prints a rare author plus common keyword query, planned against fixed order"""
+    metadata = _corpus(articles)
+    index = ArticleIndex.from_metadata(metadata)
+    del metadata
+    keyword = max(index.postings, key=lambda keyword: len(index.postings[keyword]))
+    author = min(
+        index.table.author_names,
+        key=lambda author: index.table.author_count(author),
+    )
+
+    def fixed_order(_):
+        # Keyword postings first, then each filter in the order it was given
+        ids = index.lookup_ids(keyword)
+        ids = index.filter_length(ids, 50_000, None)
+        ids = index.filter_year(ids, 2009)
+        return index.filter_author(ids, author)
+
+    query = search.Query(keyword, index).max_length(50_000).year(2009).author(author)
+    assert list(fixed_order(None)) == list(query.ids())
+    print(
+        "query planner, common keyword + length + year + rare author (%d articles)"
+        % articles
+    )
+    print(query.explain())
+    print("  fixed order:   %8.3f ms" % (_time_per_call(fixed_order, [None], 20) * 1e3))
+    print(
+        "  planned:       %8.3f ms"
+        % (_time_per_call(lambda _: query.ids(), [None], 20) * 1e3)
+    )
+
+
+def bench_ranked_search(articles=100_000, k=10):
+    """Prints top-k BM25 ranking through a bounded heap against a full sort"""
+    metadata = _corpus(articles)
+    index = ArticleIndex.from_metadata(metadata)
+    del metadata
+    by_frequency = sorted(
+        index.postings, key=lambda keyword: len(index.postings[keyword])
+    )
+    keywords = by_frequency[-3:]
+
+    def full_sort(_):
+        scores = ranking.bm25_scores(
+            [index.lookup_ids(keyword) for keyword in keywords],
+            index.table.lengths,
+            index.table.average_length(),
+            articles,
+        )
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:k]
+
+    def bounded(_):
+        return ranking.rank_ids(index, keywords, k)
+
+    assert full_sort(None) == bounded(None)
+    matches = len(set().union(*(index.lookup_ids(keyword) for keyword in keywords)))
+    print("ranked search, top %d of %d matches (%d articles)" % (k, matches, articles))
+    print("  full sort:     %8.2f ms" % (_time_per_call(full_sort, [None], 5) * 1e3))
+    print("  bounded heap:  %8.2f ms" % (_time_per_call(bounded, [None], 5) * 1e3))
+
+
+def bench_block_max(articles=100_000, k=10):
+    """Prints top-k multi-keyword ranking with block-max WAND against exhaustive"""
+    metadata = _corpus(articles)
+    index = ArticleIndex.from_metadata(metadata)
+    del metadata
+    by_frequency = sorted(
+        index.postings, key=lambda keyword: len(index.postings[keyword])
+    )
+    rng = random.Random(0)
+    # Mixes a frequent keyword with rarer ones, the usual shape of a query
+    queries = [
+        [by_frequency[-1 - rng.randrange(20)]] + rng.sample(by_frequency[-5000:-100], 2)
+        for _ in range(20)
+    ]
+    start = time.perf_counter()
+    scorer = index.block_max()
+    for keywords in queries:
+        for keyword in keywords:
+            scorer.blocks(keyword)
+    print("block-max WAND, top %d of 3 keyword queries (%d articles)" % (k, articles))
+    print(
+        "  block metadata, first use:  %8.2f ms" % ((time.perf_counter() - start) * 1e3)
+    )
+
+    def exhaustive(keywords):
+        return ranking.bm25_top_k(
+            [index.lookup_ids(keyword) for keyword in keywords],
+            index.table.lengths,
+            index.table.average_length(),
+            articles,
+            k,
+        )
+
+    def block_max(keywords):
+        return scorer.top_k(keywords, k)
+
+    for keywords in queries:
+        assert exhaustive(keywords) == block_max(keywords)
+    print(
+        "  exhaustive scoring:         %8.2f ms"
+        % (_time_per_call(exhaustive, queries) * 1e3)
+    )
+    print(
+        "  block-max WAND:             %8.2f ms"
+        % (_time_per_call(block_max, queries) * 1e3)
+    )
+
+
+def bench_prefix_search(sizes=(10_000, 100_000, 1_000_000), queries=200):
+    """Prints prefix expansion over a sorted vocabulary against a scan of the keys"""
+    print("prefix expansion, 3 letter prefixes")
+    for size in sizes:
+        keywords = list(_vocabulary(size))
+        rng = random.Random(1)
+        prefixes = [rng.choice(keywords)[:3] for _ in range(queries)]
+        start = time.perf_counter()
+        words = vocabulary.Vocabulary(keywords)
+        build = time.perf_counter() - start
+
+        def scan(prefix):
+            return sorted(keyword for keyword in keywords if keyword.startswith(prefix))
+
+        for prefix in prefixes[:5]:
+            assert words.complete(prefix) == scan(prefix)
+        print(
+            "  %9d keywords  scan %8.3f ms  sorted %7.4f ms  (sorting %6.1f ms once)"
+            % (
+                size,
+                _time_per_call(scan, prefixes[:10]) * 1e3,
+                _time_per_call(words.complete, prefixes) * 1e3,
+                build * 1e3,
+            )
+        )
+
+
+def bench_fuzzy_lookup(sizes=(10_000, 100_000), queries=50):
+    """Prints fuzzy keyword lookup with a BK-tree and a delete index against a scan"""
+    print("fuzzy lookup, one typo per query")
+    for size in sizes:
+        keywords = list(_vocabulary(size))
+        rng = random.Random(2)
+        typos = []
+        for _ in range(queries):
+            keyword = rng.choice(keywords)
+            position = rng.randrange(len(keyword))
+            typos.append(
+                keyword[:position]
+                + rng.choice(string.ascii_lowercase)
+                + keyword[position + 1 :]
+            )
+
+        def scan(keyword, max_distance):
+            return sorted(
+                (distance, candidate)
+                for candidate in keywords
+                for distance in [fuzzy.edit_distance(keyword, candidate, max_distance)]
+                if distance <= max_distance
+            )
+
+        print("  %d keywords" % size)
+        for name, build in [
+            ("BK-tree", lambda: fuzzy.BKTree(keywords)),
+            ("delete index", lambda: fuzzy.DeleteIndex(keywords)),
+        ]:
+            start = time.perf_counter()
+            index = build()
+            seconds = time.perf_counter() - start
+            memory = _allocated(build)[1] if size <= 10_000 else None
+            for keyword in typos[:3]:
+                assert index.lookup(keyword, 2) == scan(keyword, 2)
+            print(
+                "    %-13s build %7.2f s%s  distance 1 %8.3f ms  distance 2 %8.3f ms"
+                % (
+                    name,
+                    seconds,
+                    "" if memory is None else "  %6.1f MB" % (memory / 1e6),
+                    _time_per_call(lambda keyword: index.lookup(keyword, 1), typos)
+                    * 1e3,
+                    _time_per_call(lambda keyword: index.lookup(keyword, 2), typos)
+                    * 1e3,
+                )
+            )
+        print(
+            "    %-13s distance 2 %8.3f ms"
+            % (
+                "scan",
+                _time_per_call(lambda keyword: scan(keyword, 2), typos[:5]) * 1e3,
+            )
+        )
+
+
+def bench_title_search(articles=100_000, queries=200):
+    """Prints substring title search through trigram postings against a title scan"""
+    metadata = _corpus(articles)
+    titles = [article[0] for article in metadata]
+    del metadata
+    rng = random.Random(3)
+    substrings = []
+    for _ in range(queries):
+        # From the random word ending each title, "Article N" is in all of them
+        word = rng.choice(titles).split()[-1]
+        start = rng.randrange(len(word) - 4)
+        substrings.append(word[start : start + rng.randint(4, 8)])
+
+    start = time.perf_counter()
+    index = title_index.TitleIndex(titles)
+    build = time.perf_counter() - start
+
+    def scan(text):
+        folded = text.casefold()
+        return [i for i, title in enumerate(titles) if folded in title.casefold()]
+
+    for text in substrings[:5]:
+        assert list(index.match(text)) == scan(text)
+    print("title search, 4 to 8 character substrings (%d titles)" % articles)
+    print("  build title index:  %8.1f ms" % (build * 1e3))
+    print(
+        "  scan titles:        %8.3f ms" % (_time_per_call(scan, substrings[:10]) * 1e3)
+    )
+    print(
+        "  trigram postings:   %8.3f ms"
+        % (_time_per_call(index.match, substrings) * 1e3)
+    )
+
+
+def bench_normalized_search(articles=20_000, queries=200):
+    """Prints case-insensitive keyword lookup with a normalized index against a scan"""
+    metadata = _corpus(articles)
+    rng = random.Random(4)
+    for article in metadata:
+        # Capitalized variants, as titles and sentence starts produce them
+        article[4] = [
+            keyword.title() if rng.random() < 0.2 else keyword for keyword in article[4]
+        ]
+    keywords = [rng.choice(rng.choice(metadata)[4]).upper() for _ in range(queries)]
+
+    start = time.perf_counter()
+    plain = ArticleIndex.from_metadata(metadata)
+    plain_build = time.perf_counter() - start
+    start = time.perf_counter()
+    normalized = ArticleIndex.from_metadata(metadata, normalized=True)
+    normalized_build = time.perf_counter() - start
+
+    def scan(keyword):
+        # Folds every stored keyword on every query
+        folded = normalize.normalize(keyword)
+        return postings.union_all(
+            [
+                plain.lookup_ids(stored)
+                for stored in plain.postings
+                if normalize.normalize(stored) == folded
+            ]
+        )
+
+    for keyword in keywords[:5]:
+        assert list(scan(keyword)) == list(normalized.lookup_ids(keyword))
+    print(
+        "case-insensitive lookup (%d articles, %d vs %d keywords)"
+        % (articles, len(plain.postings), len(normalized.postings))
+    )
+    print("  build exact index:      %8.1f ms" % (plain_build * 1e3))
+    print("  build normalized index: %8.1f ms" % (normalized_build * 1e3))
+    print(
+        "  fold keywords per query: %7.3f ms"
+        % (_time_per_call(scan, keywords[:10]) * 1e3)
+    )
+    print(
+        "  normalized lookup:      %8.3f ms"
+        % (_time_per_call(normalized.lookup_ids, keywords) * 1e3)
+    )
+
+
+def bench_incremental_updates(articles=50_000, edits=1_000):
+    """Prints per-article add, update and remove cost against a full rebuild"""
+    metadata = _corpus(articles + edits)
+    metadata, extra = metadata[:articles], metadata[articles:]
+    rng = random.Random(5)
+    start = time.perf_counter()
+    index = ArticleIndex.from_metadata(metadata)
+    rebuild = time.perf_counter() - start
+    index.block_max()
+
+    updates = []
+    for article in rng.sample(metadata, edits):
+        keywords = article[4][5:] + [rng.choice(extra)[4][0] for _ in range(5)]
+        updates.append([article[0], article[1], article[2], article[3] + 1, keywords])
+    removals = [article[0] for article in rng.sample(metadata, edits)]
+
+    print("incremental index maintenance (%d articles)" % articles)
+    print("  full rebuild:       %10.1f ms" % (rebuild * 1e3))
+    print(
+        "  add_article:        %10.3f ms"
+        % (_time_per_call(lambda article: index.add_article(*article), extra) * 1e3)
+    )
+    print(
+        "  update_article:     %10.3f ms"
+        % (
+            _time_per_call(lambda article: index.update_article(*article), updates)
+            * 1e3
+        )
+    )
+    print(
+        "  remove_article:     %10.3f ms"
+        % (_time_per_call(index.remove_article, removals) * 1e3)
+    )
+
+
+def bench_segmented_index(articles=50_000, updates=20_000, queries=2_000):
+    """Prints ingestion rate and query latency of a SegmentedIndex under writes"""
+    metadata = _corpus(articles)
+    rng = random.Random(6)
+    keywords = [rng.choice(rng.choice(metadata)[4]) for _ in range(queries)]
+    edits = []
+    for _ in range(updates):
+        article = list(rng.choice(metadata))
+        article[3] += 1
+        edits.append(article)
+
+    def latencies(index, stop=None):
+        timings = []
+        for keyword in keywords:
+            if stop is not None and stop.is_set():
+                break
+            start = time.perf_counter()
+            index.get(keyword)
+            timings.append(time.perf_counter() - start)
+        timings.sort()
+        return timings[len(timings) // 2], timings[int(len(timings) * 0.99)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        index = segments.SegmentedIndex.from_indexes(
+            directory,
+            search.keyword_to_titles(metadata),
+            search.title_to_info(metadata),
+            memtable_limit=2_000,
+        )
+        idle = latencies(index)
+        done = threading.Event()
+        timings = []
+
+        def query():
+            timings.append(latencies(index, done))
+
+        reader = threading.Thread(target=query)
+        reader.start()
+        start = time.perf_counter()
+        for article in edits:
+            index.add_article(*article)
+        elapsed = time.perf_counter() - start
+        done.set()
+        reader.join()
+        busy = timings[0]
+        print("segmented index (%d articles, %d updates)" % (articles, updates))
+        print("  ingestion:            %8.0f updates/s" % (updates / elapsed))
+        print("  segments afterwards:  %8d" % len(index.segments))
+        print(
+            "  query p50/p99 idle:   %8.3f / %.3f ms" % (idle[0] * 1e3, idle[1] * 1e3)
+        )
+        print(
+            "  query p50/p99 busy:   %8.3f / %.3f ms" % (busy[0] * 1e3, busy[1] * 1e3)
+        )
+        index.close()
+
+
+def bench_write_ahead_log(records=2_000, thread_counts=(1, 4, 16)):
+    """Prints durable appends per second as concurrent writers share fsyncs"""
+    metadata = _corpus(records)
+    print("write-ahead log (%d durable records)" % records)
+    for threads in thread_counts:
+        with tempfile.TemporaryDirectory() as directory:
+            log = wal.WriteAheadLog(os.path.join(directory, "index.log"))
+            shares = [metadata[i::threads] for i in range(threads)]
+
+            def write(share):
+                for article in share:
+                    log.append(["add"] + article)
+
+            workers = [threading.Thread(target=write, args=(s,)) for s in shares]
+            start = time.perf_counter()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - start
+            log.close()
+            print(
+                "  %2d writers: %8.0f records/s, %5.1f records per fsync"
+                % (threads, records / elapsed, records / log.commits)
+            )
+
+
+def bench_streaming_load(articles=100_000):
+    """Prints rows per second and raw record memory of streaming metadata files"""
+    metadata = _corpus(articles)
+    print("streaming metadata load (%d records)" % articles)
+    with tempfile.TemporaryDirectory() as directory:
+        for name in ("articles.jsonl", "articles.tsv"):
+            path = os.path.join(directory, name)
+            loader.write_metadata(path, metadata)
+
+            start = time.perf_counter()
+            records = list(loader.read_metadata(path))
+            whole = time.perf_counter() - start
+            del records
+            start = time.perf_counter()
+            for chunk in loader.read_chunks(path):
+                pass
+            streamed = time.perf_counter() - start
+
+            # Traced separately, tracing slows the reads down
+            tracemalloc.start()
+            records = list(loader.read_metadata(path))
+            whole_peak = tracemalloc.get_traced_memory()[1]
+            del records
+            tracemalloc.stop()
+            tracemalloc.start()
+            for chunk in loader.read_chunks(path):
+                pass
+            streamed_peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            start = time.perf_counter()
+            loader.load_index(path)
+            built = time.perf_counter() - start
+            print("  %s" % name)
+            print(
+                "    whole list:   %8.0f rows/s, %6.1f MB peak"
+                % (articles / whole, whole_peak / 1e6)
+            )
+            print(
+                "    chunks:       %8.0f rows/s, %6.1f MB peak"
+                % (articles / streamed, streamed_peak / 1e6)
+            )
+            print("    index build:  %8.0f rows/s" % (articles / built))
+
+
+def _write_dump(path, pages, seed=0):
+    # Synthetic pages-articles dump, each page a few hundred words of
+    # wikitext with links, templates and references
+    rng = random.Random(seed)
+    vocabulary = [_random_word(rng, rng.randint(3, 10)) for _ in range(20_000)]
+    with open(path, "w", encoding="utf-8") as dump_file:
+        dump_file.write(
+            '<mediawiki xmlns="http://www.mediawiki.org/xml/export-0.10/">\n'
+        )
+        for page in range(pages):
+            words = [vocabulary[int(20_000 * rng.random() ** 3)] for _ in range(400)]
+            for position in range(0, len(words), 40):
+                words[position] = "[[%s|%s]]" % (
+                    words[position].title(),
+                    words[position],
+                )
+            text = "{{Infobox|name=%s}} %s <ref>%s</ref>" % (
+                words[0],
+                " ".join(words),
+                words[1],
+            )
+            dump_file.write(
+                "<page><title>Article %d</title><ns>0</ns><revision>"
+                "<timestamp>2009-05-01T12:00:00Z</timestamp>"
+                "<contributor><username>%s</username></contributor>"
+                '<text xml:space="preserve">%s</text></revision></page>\n'
+                % (page, rng.choice(vocabulary), text.replace("<", "&lt;"))
+            )
+        dump_file.write("</mediawiki>\n")
+
+
+def bench_dump_parser(page_counts=(5_000, 20_000)):
+    """Prints MediaWiki dump parsing and indexing in pages per second"""
+    print("MediaWiki dump parser")
+    with tempfile.TemporaryDirectory() as directory:
+        for pages in page_counts:
+            path = os.path.join(directory, "dump-%d.xml" % pages)
+            _write_dump(path, pages)
+            start = time.perf_counter()
+            for record in dump.read_dump(path):
+                pass
+            parsed = time.perf_counter() - start
+            start = time.perf_counter()
+            loader.load_index(path)
+            built = time.perf_counter() - start
+            # Traced separately, tracing slows parsing down
+            tracemalloc.start()
+            for record in dump.read_dump(path):
+                pass
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(
+                "  %6d pages (%5.1f MB): parse %6.0f pages/s, parse + index %6.0f"
+                " pages/s, parser peak %.1f MB"
+                % (
+                    pages,
+                    os.path.getsize(path) / 1e6,
+                    pages / parsed,
+                    pages / built,
+                    peak / 1e6,
+                )
+            )
+
+
+if __name__ == "__main__":
+    bench_keyword_lookup()
+    bench_index_cache()
+    bench_snapshot()
+    bench_mapped_index()
+    bench_article_ids()
+    bench_compressed_postings()
+    bench_article_table()
+    bench_length_index()
+    bench_author_index()
+    bench_filter_out()
+    bench_boolean_query()
+    bench_query_pipeline()
+    bench_query_planner()
+    bench_ranked_search()
+    bench_block_max()
+    bench_prefix_search()
+    bench_fuzzy_lookup()
+    bench_title_search()
+    bench_normalized_search()
+    bench_incremental_updates()
+    bench_segmented_index()
+    bench_write_ahead_log()
+    bench_streaming_load()
+    bench_dump_parser()
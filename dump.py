@@ -0,0 +1,148 @@
+import bz2
+from calendar import timegm
+from collections import Counter
+import gzip
+import re
+import time
+import xml.etree.ElementTree as ElementTree
+
+# MediaWiki XML dumps (pages-articles or pages-meta-history, optionally
+# .bz2 or .gz compressed) turned into [title, author, timestamp, length,
+# keywords] records. Only the latest revision of each page counts: its
+# contributor, its timestamp as Unix seconds and its wikitext length in
+# characters. Keywords are the words of the text, markup stripped, that
+# are at least MIN_KEYWORD_LENGTH letters long and occur MIN_OCCURRENCES
+# times or more, most frequent first and at most MAX_KEYWORDS of them.
+MIN_KEYWORD_LENGTH = 3
+MIN_OCCURRENCES = 2
+MAX_KEYWORDS = 200
+# Main namespace, other namespaces hold talk, user and project pages
+ARTICLE_NAMESPACE = 0
+
+_COMMENTS = re.compile(r"<!--.*?-->", re.S)
+_REFERENCES = re.compile(r"<ref[^>/]*/>|<ref[^>]*>.*?</ref>", re.S | re.I)
+_TAGS = re.compile(r"<[^>]*>")
+_TEMPLATES = re.compile(r"\{\{[^{}]*\}\}|\{\|[^{}]*?\|\}", re.S)
+_FILE_LINKS = re.compile(r"\[\[(?:File|Image|Category):[^\[\]]*\]\]", re.I)
+# [[target|label]] keeps label, [[target]] keeps target
+_LINKS = re.compile(r"\[\[(?:[^\[\]|]*\|)?([^\[\]]*)\]\]")
+# [http://example.org label] keeps label
+_EXTERNAL_LINKS = re.compile(r"\[[a-z]+://[^\s\]]*\s*([^\]]*)\]", re.I)
+_ENTITIES = re.compile(r"&[a-z]+;|&#\d+;", re.I)
+_WORDS = re.compile(r"[^\W\d_]{%d,}" % MIN_KEYWORD_LENGTH)
+
+
+def strip_markup(text):
+    """Returns wikitext with comments, references, templates, tables and tags removed"""
+    text = _COMMENTS.sub(" ", text)
+    text = _REFERENCES.sub(" ", text)
+    # Templates nest, so innermost ones go first until none are left
+    while True:
+        stripped = _TEMPLATES.sub(" ", text)
+        if stripped == text:
+            break
+        text = stripped
+    text = _FILE_LINKS.sub(" ", text)
+    text = _LINKS.sub(r"\1", text)
+    text = _EXTERNAL_LINKS.sub(r"\1", text)
+    text = _TAGS.sub(" ", text)
+    return _ENTITIES.sub(" ", text)
+
+
+def extract_keywords(text):
+    """Returns the keywords of an article's wikitext, most frequent first"""
+    counts = Counter(_WORDS.findall(strip_markup(text).lower()))
+    keywords = [word for word, count in counts.items() if count >= MIN_OCCURRENCES]
+    # A stable sort keeps first appearance order among equal counts
+    keywords.sort(key=counts.__getitem__, reverse=True)
+    return keywords[:MAX_KEYWORDS]
+
+
+def parse_timestamp(timestamp):
+    """Returns the Unix time of a dump timestamp such as 2007-06-12T04:42:20Z"""
+    return timegm(time.strptime(timestamp, "%Y-%m-%dT%H:%M:%SZ"))
+
+
+def _open(path):
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rb")
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+
+def _local(tag):
+    # Dumps put every element in a versioned export namespace
+    return tag.rpartition("}")[2]
+
+
+def _child(element, name):
+    for child in element:
+        if _local(child.tag) == name:
+            return child
+    return None
+
+
+def _text(element, name):
+    child = None if element is None else _child(element, name)
+    if child is None or child.text is None:
+        return ""
+    return child.text
+
+
+def read_dump(path, namespaces=(ARTICLE_NAMESPACE,), redirects=False):
+    """
+    Yields the metadata record of each page in a MediaWiki XML dump
+
+    Pages are parsed one at a time with iterparse and cleared once read,
+    so memory stays flat however large the dump is. In history dumps each
+    revision drops the one before it, only the latest is kept. Only pages in
+    namespaces are read, and redirects are skipped unless redirects is set.
+    """
+    with _open(path) as dump_file:
+        events = ElementTree.iterparse(dump_file, events=("start", "end"))
+        _, root = next(events)
+        page = revision = None
+        for event, element in events:
+            tag = _local(element.tag)
+            if event == "start":
+                if tag == "page":
+                    page, revision = element, None
+                continue
+            if tag == "revision" and page is not None:
+                if revision is not None:
+                    page.remove(revision)
+                revision = element
+                continue
+            if tag != "page":
+                continue
+            record = _page_record(element, namespaces, redirects)
+            # Drops the page and everything parsed before it
+            root.clear()
+            if record is not None:
+                yield record
+
+
+def _page_record(page, namespaces, redirects):
+    namespace = _text(page, "ns")
+    if namespace and int(namespace) not in namespaces:
+        return None
+    if not redirects and _child(page, "redirect") is not None:
+        return None
+    # History dumps list revisions oldest first
+    revision = None
+    for child in page:
+        if _local(child.tag) == "revision":
+            revision = child
+    if revision is None:
+        return None
+    contributor = _child(revision, "contributor")
+    author = _text(contributor, "username") or _text(contributor, "ip")
+    text = _text(revision, "text")
+    return [
+        _text(page, "title"),
+        author,
+        parse_timestamp(_text(revision, "timestamp")),
+        len(text),
+        extract_keywords(text),
+    ]
@@ -0,0 +1,190 @@
+# Typo tolerant keyword lookup. Both indexes answer "which keywords are
+# within max_distance edits of this one", with edits being Levenshtein
+# insertions, deletions and substitutions of one character.
+MAX_DISTANCE = 2
+
+
+def edit_distance(first, second, limit=None):
+    """
+    Returns the Levenshtein distance between two strings
+
+    Uses Myers' bit-parallel algorithm, as adapted to edit distance by
+    Hyyro: the shorter string's DP column is held in the bits of two
+    integers, which advance one character of the longer string at a time.
+    With a limit, any distance above it is returned as limit + 1.
+    """
+    if len(first) < len(second):
+        first, second = second, first
+    if limit is not None and len(first) - len(second) > limit:
+        return limit + 1
+    if not second:
+        return len(first)
+    matches = {}
+    bit = 1
+    for character in second:
+        matches[character] = matches.get(character, 0) | bit
+        bit <<= 1
+    mask = bit - 1
+    last = bit >> 1
+    positive = mask
+    negative = 0
+    distance = len(second)
+    for character in first:
+        equal = matches.get(character, 0)
+        vertical = equal | negative
+        horizontal = (((equal & positive) + positive) ^ positive) | equal
+        horizontal_positive = negative | ~(horizontal | positive)
+        horizontal_negative = positive & horizontal
+        if horizontal_positive & last:
+            distance += 1
+        elif horizontal_negative & last:
+            distance -= 1
+        horizontal_positive = (horizontal_positive << 1) | 1
+        horizontal_negative <<= 1
+        positive = (horizontal_negative | ~(vertical | horizontal_positive)) & mask
+        negative = horizontal_positive & vertical & mask
+    return distance if limit is None or distance <= limit else limit + 1
+
+
+def deletes(word, distance):
+    """Returns every string made by deleting up to distance characters of word"""
+    variants = {word}
+    level = variants
+    for _ in range(distance):
+        level = {
+            variant[:i] + variant[i + 1 :]
+            for variant in level
+            for i in range(len(variant))
+        }
+        variants |= level
+    return variants
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over keywords.
+
+    Each node's children are keyed by their edit distance to it. By the
+    triangle inequality, only children whose key lies within max_distance of
+    the query's distance to the node can hold matches, so a lookup visits a
+    fraction of the tree. Compact, one node per keyword, but lookups compute
+    a full edit distance at every visited node.
+    """
+
+    def __init__(self, keywords=()):
+        self._root = None
+        self._size = 0
+        for keyword in keywords:
+            self.add(keyword)
+
+    def add(self, keyword):
+        if self._root is None:
+            self._root = (keyword, {})
+            self._size = 1
+            return
+        node = self._root
+        while True:
+            distance = edit_distance(keyword, node[0])
+            if distance == 0:
+                return
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = (keyword, {})
+                self._size += 1
+                return
+            node = child
+
+    def lookup(self, keyword, max_distance=MAX_DISTANCE):
+        """Returns (distance, keyword) pairs within max_distance, closest first"""
+        if self._root is None:
+            return []
+        found = []
+        nodes = [self._root]
+        while nodes:
+            word, children = nodes.pop()
+            distance = edit_distance(keyword, word)
+            if distance <= max_distance:
+                found.append((distance, word))
+            for edge in range(distance - max_distance, distance + max_distance + 1):
+                child = children.get(edge)
+                if child is not None:
+                    nodes.append(child)
+        return sorted(found)
+
+    def __len__(self):
+        return self._size
+
+
+class DeleteIndex:
+    """
+    Symmetric delete index over keywords, as in SymSpell.
+
+    Two words are within n edits only if deleting at most n characters from
+    each can make them equal, so every keyword is stored under each of its
+    deletion variants. A lookup generates the query's own variants, gathers
+    the keywords stored under them and verifies each with a bounded edit
+    distance. Lookups are a few dictionary probes, paid for by storing
+    around len(keyword) ** max_distance / max_distance! variants per keyword.
+    """
+
+    def __init__(self, keywords=(), max_distance=MAX_DISTANCE):
+        self.max_distance = max_distance
+        self._variants = {}
+        self._keywords = set()
+        for keyword in keywords:
+            self.add(keyword)
+
+    def add(self, keyword):
+        if keyword in self._keywords:
+            return
+        self._keywords.add(keyword)
+        variants = self._variants
+        for variant in deletes(keyword, self.max_distance):
+            stored = variants.get(variant)
+            # Most variants belong to a single keyword, stored without a list
+            if stored is None:
+                variants[variant] = keyword
+            elif isinstance(stored, list):
+                stored.append(keyword)
+            else:
+                variants[variant] = [stored, keyword]
+
+    def remove(self, keyword):
+        """Drops keyword from each of its variants, others are untouched"""
+        if keyword not in self._keywords:
+            return
+        self._keywords.remove(keyword)
+        variants = self._variants
+        for variant in deletes(keyword, self.max_distance):
+            stored = variants[variant]
+            if not isinstance(stored, list):
+                del variants[variant]
+                continue
+            stored.remove(keyword)
+            if len(stored) == 1:
+                variants[variant] = stored[0]
+
+    def lookup(self, keyword, max_distance=MAX_DISTANCE):
+        """Returns (distance, keyword) pairs within max_distance, closest first"""
+        if max_distance > self.max_distance:
+            raise ValueError(
+                "index was built for distances up to %d" % self.max_distance
+            )
+        candidates = set()
+        for variant in deletes(keyword, max_distance):
+            stored = self._variants.get(variant)
+            if stored is None:
+                continue
+            if isinstance(stored, list):
+                candidates.update(stored)
+            else:
+                candidates.add(stored)
+        found = []
+        for candidate in candidates:
+            distance = edit_distance(keyword, candidate, max_distance)
+            if distance <= max_distance:
+                found.append((distance, candidate))
+        return sorted(found)
+
+    def __len__(self):
+        return len(self._keywords)
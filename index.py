@@ -0,0 +1,471 @@
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from itertools import chain
+from postings import decode_postings, encode_postings
+from fuzzy import DeleteIndex
+from normalize import normalize
+from ranking import BlockMaxScorer
+from table import ArticleTable
+from title_index import TitleIndex
+from vocabulary import Vocabulary
+
+
+class KeywordIndex:
+    """
+    Constant-time keyword lookup over the output of keyword_to_titles.
+
+    Behaves like a read-only dictionary of keyword -> list of titles, so it can
+    be passed anywhere keyword_to_titles' dictionary is accepted. A normalized
+    index stores its keywords NFKC casefolded and normalizes each lookup.
+    Keywords that normalize alike have their titles merged once each, put
+    back in article order when title_to_info is given.
+    """
+
+    def __init__(self, keyword_to_titles, normalized=False, title_to_info=None):
+        self.normalized = normalized
+        if not normalized:
+            self._postings = dict(keyword_to_titles)
+            return
+        variants = {}
+        for keyword, titles in keyword_to_titles.items():
+            variants.setdefault(normalize(keyword), []).append(titles)
+        self._postings = {}
+        positions = None
+        for keyword, title_lists in variants.items():
+            if len(title_lists) == 1:
+                self._postings[keyword] = title_lists[0]
+                continue
+            merged = list(dict.fromkeys(chain.from_iterable(title_lists)))
+            if title_to_info is not None:
+                if positions is None:
+                    positions = {title: n for n, title in enumerate(title_to_info)}
+                # Titles without info go last, sort() is stable
+                merged.sort(key=lambda title: positions.get(title, len(positions)))
+            self._postings[keyword] = merged
+
+    def _key(self, keyword):
+        return normalize(keyword) if self.normalized else keyword
+
+    def lookup(self, keyword):
+        """Returns the titles containing keyword, or an empty list on a miss"""
+        titles = self._postings.get(self._key(keyword))
+        if titles is None:
+            return []
+        return titles
+
+    def get(self, keyword, default=None):
+        return self._postings.get(self._key(keyword), default)
+
+    def keys(self):
+        return self._postings.keys()
+
+    def values(self):
+        return self._postings.values()
+
+    def items(self):
+        return self._postings.items()
+
+    def __getitem__(self, keyword):
+        return self._postings[self._key(keyword)]
+
+    def __contains__(self, keyword):
+        return self._key(keyword) in self._postings
+
+    def __iter__(self):
+        return iter(self._postings)
+
+    def __len__(self):
+        return len(self._postings)
+
+
+class ArticleIndex:
+    """
+    Keyword and article index over integer article ids.
+
+    Article info lives in a columnar ArticleTable indexed by id, and each
+    keyword maps to an ascending array('I') of ids, or to its delta + varint
+    encoded bytes once the index is compressed. Filters work on id arrays and
+    titles are only looked up when results are returned. A normalized index
+    stores keywords and authors NFKC casefolded and normalizes each query
+    term once, in lookup_ids and the other keyword accessors.
+
+    Articles can be added, updated and removed in place. Each article's
+    keywords are kept, as the same string objects the postings are keyed
+    by, so an edit only touches the postings it changes, and removed
+    articles keep their ids, which are never reused. A compressed index
+    decodes and re-encodes each posting list an edit touches.
+    """
+
+    def __init__(self, decoded_cache_size=1 << 20, normalized=False):
+        self.normalized = normalized
+        self.compressed = False
+        # Recently decoded posting lists of a compressed index, bounded by
+        # their total number of ids, so hot keywords are not decoded per query
+        self.decoded_cache_size = decoded_cache_size
+        self._decoded = OrderedDict()
+        self._decoded_ids = 0
+        self.table = ArticleTable(normalized)
+        self.postings = {}
+        # Stored keywords of each article id, for updates and removals, or
+        # None until first needed by an index loaded from its postings
+        self._article_keywords = []
+        # keyword -> the one string object every reference to it shares, so
+        # articles do not keep their callers' copies of each keyword alive
+        self._keywords = {}
+        # Number of articles per keyword, kept for query planning
+        self.frequencies = {}
+        # Built on the first ranked query, dropped whenever the index changes
+        self._block_max = None
+        # Built on the first wildcard query, then kept up to date
+        self._vocabulary = None
+        # Built on the first fuzzy lookup, then kept up to date
+        self._fuzzy = None
+        # Built on the first title search, then kept up to date
+        self._title_index = None
+
+    @property
+    def titles(self):
+        return self.table.titles
+
+    @property
+    def title_ids(self):
+        return self.table.title_ids
+
+    @property
+    def title_count(self):
+        return len(self.table.titles)
+
+    @property
+    def article_keywords(self):
+        if self._article_keywords is None:
+            keywords = [[] for _ in self.table.titles]
+            for keyword, postings in self.postings.items():
+                if self.compressed:
+                    postings = decode_postings(postings)
+                for title_id in postings:
+                    keywords[title_id].append(keyword)
+            self._article_keywords = [tuple(k) for k in keywords]
+        return self._article_keywords
+
+    @classmethod
+    def from_table(cls, table, postings, compress=False):
+        """
+        Builds an index over an ArticleTable and keyword -> ascending id arrays
+
+        Keywords are taken as stored, already normalized for a normalized
+        table. Each article's keywords are only gathered on its first edit.
+        """
+        index = cls(normalized=table.normalized)
+        index.table = table
+        index.postings = postings
+        index.frequencies = {keyword: len(ids) for keyword, ids in postings.items()}
+        index._keywords = {keyword: keyword for keyword in postings}
+        index._article_keywords = None
+        if compress:
+            index.compress()
+        return index
+
+    @classmethod
+    def from_metadata(cls, metadata, compress=False, normalized=False):
+        index = cls(normalized=normalized)
+        index.extend(metadata)
+        if compress:
+            index.compress()
+        return index
+
+    @classmethod
+    def from_indexes(
+        cls, keyword_to_titles, title_to_info, compress=False, normalized=False
+    ):
+        """Builds an index from keyword_to_titles' and title_to_info's dictionaries"""
+        index = cls(normalized=normalized)
+        keywords = {title: [] for title in title_to_info}
+        for keyword, titles in keyword_to_titles.items():
+            for title in titles:
+                keywords.setdefault(title, []).append(keyword)
+        for title, info in title_to_info.items():
+            index._add(
+                title,
+                info["author"],
+                info["timestamp"],
+                info["length"],
+                keywords[title],
+            )
+        for title, title_keywords in keywords.items():
+            if title not in title_to_info:
+                index._add(title, "", 0, 0, title_keywords)
+        if compress:
+            index.compress()
+        return index
+
+    def compress(self):
+        """Packs every posting list with delta + varint encoding"""
+        if not self.compressed:
+            for keyword, postings in self.postings.items():
+                self.postings[keyword] = encode_postings(postings)
+            self.compressed = True
+
+    def extend(self, metadata):
+        """Indexes metadata records in turn, metadata may be any iterable"""
+        for article in metadata:
+            self._add(article[0], article[1], article[2], article[3], article[4])
+
+    def _add(self, title, author, timestamp, length, keywords):
+        self._block_max = None
+        # Gathered before the table grows, for an index loaded from postings
+        article_keywords = self.article_keywords
+        title_id = self.table.append(title, author, timestamp, length)
+        if self._title_index is not None and title_id == len(self._title_index):
+            self._title_index.add(title)
+        keywords = self._stored_keywords(keywords)
+        if title_id == len(article_keywords):
+            article_keywords.append(keywords)
+        else:
+            # A repeated title gains its new keywords, like keyword_to_titles
+            keywords = article_keywords[title_id] + tuple(
+                keyword
+                for keyword in keywords
+                if keyword not in article_keywords[title_id]
+            )
+            article_keywords[title_id] = keywords
+        for keyword in keywords:
+            self._post(keyword, title_id)
+        return title_id
+
+    def _stored_keywords(self, keywords):
+        if self.normalized:
+            keywords = [normalize(keyword) for keyword in keywords]
+        canonical = self._keywords
+        return tuple(canonical.setdefault(k, k) for k in dict.fromkeys(keywords))
+
+    def add_article(self, title, author, timestamp, length, keywords):
+        """
+        Indexes a new article and returns its id
+
+        Raises ValueError when title is already indexed, update_article
+        replaces an indexed article.
+        """
+        if title in self.table.title_ids:
+            raise ValueError("article %r is already indexed" % title)
+        return self._add(title, author, timestamp, length, keywords)
+
+    def update_article(self, title, author, timestamp, length, keywords):
+        """
+        Replaces an indexed article's info and keywords, keeping its id
+
+        Only the postings of keywords it gained or lost are touched. Raises
+        KeyError when title is not indexed.
+        """
+        title_id = self.table.title_ids[title]
+        old = self.article_keywords[title_id]
+        new = self._stored_keywords(keywords)
+        kept = set(new)
+        for keyword in old:
+            if keyword not in kept:
+                self._unpost(keyword, title_id)
+        kept = set(old)
+        for keyword in new:
+            if keyword not in kept:
+                self._post(keyword, title_id)
+        self.article_keywords[title_id] = new
+        self.table.append(title, author, timestamp, length)
+        self._block_max = None
+        return title_id
+
+    def remove_article(self, title):
+        """Removes an indexed article, raising KeyError when it is not indexed"""
+        title_id = self.table.title_ids[title]
+        for keyword in self.article_keywords[title_id]:
+            self._unpost(keyword, title_id)
+        self.article_keywords[title_id] = ()
+        self.table.remove(title_id)
+        if self._title_index is not None:
+            self._title_index.remove(title_id)
+        self._block_max = None
+
+    def _post(self, keyword, title_id):
+        # keyword is in stored form, see normalize_keyword
+        self._forget_decoded(keyword)
+        self._block_max = None
+        if keyword not in self.postings:
+            if self._vocabulary is not None:
+                self._vocabulary.add(keyword)
+            if self._fuzzy is not None:
+                self._fuzzy.add(keyword)
+            postings = array("I", (title_id,))
+        else:
+            postings = self._ids(keyword)
+            if postings[-1] < title_id:
+                postings.append(title_id)
+            else:
+                position = bisect_left(postings, title_id)
+                if position == len(postings) or postings[position] != title_id:
+                    postings.insert(position, title_id)
+        self.postings[keyword] = (
+            encode_postings(postings) if self.compressed else postings
+        )
+        self.frequencies[keyword] = len(postings)
+
+    def _unpost(self, keyword, title_id):
+        self._forget_decoded(keyword)
+        self._block_max = None
+        postings = self._ids(keyword)
+        position = bisect_left(postings, title_id)
+        if position == len(postings) or postings[position] != title_id:
+            return
+        if len(postings) == 1:
+            del self.postings[keyword]
+            del self.frequencies[keyword]
+            del self._keywords[keyword]
+            if self._vocabulary is not None:
+                self._vocabulary.remove(keyword)
+            if self._fuzzy is not None:
+                self._fuzzy.remove(keyword)
+            return
+        del postings[position]
+        self.postings[keyword] = (
+            encode_postings(postings) if self.compressed else postings
+        )
+        self.frequencies[keyword] = len(postings)
+
+    def normalize_keyword(self, keyword):
+        """Returns the form keyword is stored under"""
+        return normalize(keyword) if self.normalized else keyword
+
+    def lookup_ids(self, keyword):
+        """Returns the ascending ids of articles containing keyword"""
+        if self.normalized:
+            keyword = normalize(keyword)
+        return self._ids(keyword)
+
+    def _ids(self, keyword):
+        postings = self.postings.get(keyword)
+        if postings is None:
+            return array("I")
+        if self.compressed:
+            return self._decode(keyword, postings)
+        return postings
+
+    def _decode(self, keyword, data):
+        ids = self._decoded.get(keyword)
+        if ids is not None:
+            self._decoded.move_to_end(keyword)
+            return ids
+        ids = decode_postings(data)
+        if len(ids) <= self.decoded_cache_size:
+            self._decoded[keyword] = ids
+            self._decoded_ids += len(ids)
+            while self._decoded_ids > self.decoded_cache_size:
+                self._decoded_ids -= len(self._decoded.popitem(last=False)[1])
+        return ids
+
+    def _forget_decoded(self, keyword):
+        ids = self._decoded.pop(keyword, None)
+        if ids is not None:
+            self._decoded_ids -= len(ids)
+
+    def document_frequency(self, keyword):
+        """Returns how many articles contain keyword, without decoding postings"""
+        return self.frequencies.get(self.normalize_keyword(keyword), 0)
+
+    def vocabulary(self):
+        """Returns the sorted Vocabulary of this index's keywords"""
+        if self._vocabulary is None:
+            self._vocabulary = Vocabulary(self.postings)
+        return self._vocabulary
+
+    def fuzzy_index(self):
+        """Returns the DeleteIndex of this index's keywords for fuzzy lookups"""
+        if self._fuzzy is None:
+            self._fuzzy = DeleteIndex(self.postings)
+        return self._fuzzy
+
+    def title_index(self):
+        """Returns the TitleIndex of this index's titles, under the same ids"""
+        if self._title_index is None:
+            # Removed ids are indexed blank, so later ids stay aligned
+            removed = self.table.removed
+            self._title_index = TitleIndex(
+                "" if title_id in removed else title
+                for title_id, title in enumerate(self.table.titles)
+            )
+        return self._title_index
+
+    def block_max(self):
+        """Returns the BlockMaxScorer ranking this index's current contents"""
+        if self._block_max is None:
+            self._block_max = BlockMaxScorer(self)
+        return self._block_max
+
+    def all_ids(self):
+        """Returns the ascending ids of every indexed article"""
+        return self.table.all_ids()
+
+    def ids_for_titles(self, titles):
+        return self.table.ids_for_titles(titles)
+
+    def titles_for_ids(self, ids):
+        return self.table.titles_for_ids(ids)
+
+    def filter_length(self, ids, max_length, min_length=None):
+        return self.table.filter_length(ids, max_length, min_length)
+
+    def filter_author(self, ids, author):
+        return self.table.filter_author(ids, author)
+
+    def filter_year(self, ids, year):
+        return self.table.filter_year(ids, year)
+
+    def excluded_ids(self, keywords):
+        """Returns the set of ids containing any of keywords"""
+        excluded = set()
+        for keyword in keywords:
+            excluded.update(self.lookup_ids(keyword))
+        return excluded
+
+    def exclude(self, ids, keywords):
+        """Returns ids, in order, without those containing any of keywords"""
+        if isinstance(keywords, str):
+            keywords = [keywords]
+        excluded = self.excluded_ids(keywords)
+        return array("I", [i for i in ids if i not in excluded])
+
+    def key_by_author(self, ids):
+        return self.table.key_by_author(ids)
+
+    def info(self):
+        """Returns a read-only title_to_info style view over the index"""
+        return self.table.info()
+
+    def get(self, keyword, default=None):
+        keyword = self.normalize_keyword(keyword)
+        if keyword not in self.postings:
+            return default
+        return self.titles_for_ids(self.lookup_ids(keyword))
+
+    def __getitem__(self, keyword):
+        keyword = self.normalize_keyword(keyword)
+        if keyword not in self.postings:
+            raise KeyError(keyword)
+        return self.titles_for_ids(self.lookup_ids(keyword))
+
+    def __contains__(self, keyword):
+        return self.normalize_keyword(keyword) in self.postings
+
+    def __iter__(self):
+        return iter(self.postings)
+
+    def keys(self):
+        return self.postings.keys()
+
+    def values(self):
+        return [
+            self.titles_for_ids(self.lookup_ids(keyword)) for keyword in self.postings
+        ]
+
+    def items(self):
+        return zip(self.postings.keys(), self.values())
+
+    def __len__(self):
+        return len(self.postings)
@@ -0,0 +1,124 @@
+import bz2
+import gzip
+import json
+import time
+
+from dump import read_dump
+from index import ArticleIndex
+
+# Streaming metadata files, one [title, author, timestamp, length, keywords]
+# record per line, read in chunks so only CHUNK_SIZE records are held at
+# once. The formats are told apart by extension, optionally .gz or .bz2
+# compressed:
+#   .jsonl  a JSON list per line, or an object with those five keys
+#   .tsv    five tab separated columns, keywords separated by spaces
+#   .xml    a MediaWiki XML dump, read only, see dump.py
+CHUNK_SIZE = 10_000
+_FIELDS = ("title", "author", "timestamp", "length", "keywords")
+
+
+def _open(path, mode):
+    if path.endswith(".bz2"):
+        return bz2.open(path, mode + "t", encoding="utf-8", newline="\n")
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8", newline="\n")
+    return open(path, mode, encoding="utf-8", newline="\n")
+
+
+def _format(path):
+    name = path
+    for suffix in (".gz", ".bz2"):
+        if name.endswith(suffix):
+            name = name[: -len(suffix)]
+    for extension in ("jsonl", "tsv", "xml"):
+        if name.endswith("." + extension):
+            return extension
+    raise ValueError("cannot tell the format of %s, use .jsonl, .tsv or .xml" % path)
+
+
+def _jsonl_record(line):
+    record = json.loads(line)
+    if isinstance(record, dict):
+        record = [record[field] for field in _FIELDS]
+    if len(record) != len(_FIELDS):
+        raise ValueError("expected 5 fields, got %d" % len(record))
+    return record
+
+
+def _tsv_record(line):
+    fields = line.split("\t")
+    if len(fields) != len(_FIELDS):
+        raise ValueError("expected 5 fields, got %d" % len(fields))
+    title, author, timestamp, length, keywords = fields
+    return [title, author, int(timestamp), int(length), keywords.split()]
+
+
+def read_metadata(path):
+    """Yields the metadata records of a .jsonl, .tsv or .xml file, one at a time"""
+    if _format(path) == "xml":
+        yield from read_dump(path)
+        return
+    parse = _jsonl_record if _format(path) == "jsonl" else _tsv_record
+    with _open(path, "r") as metadata_file:
+        for number, line in enumerate(metadata_file, 1):
+            line = line.rstrip("\n")
+            if not line:
+                continue
+            try:
+                yield parse(line)
+            except (ValueError, KeyError) as error:
+                raise ValueError("%s, line %d: %s" % (path, number, error)) from None
+
+
+def read_chunks(path, chunk_size=CHUNK_SIZE):
+    """Yields lists of up to chunk_size metadata records from a file"""
+    chunk = []
+    for record in read_metadata(path):
+        chunk.append(record)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def write_metadata(path, metadata):
+    """Writes metadata records to a .jsonl or .tsv file"""
+    if _format(path) == "xml":
+        raise ValueError("metadata cannot be written as a MediaWiki dump")
+    tsv = _format(path) == "tsv"
+    with _open(path, "w") as metadata_file:
+        for title, author, timestamp, length, keywords in metadata:
+            if tsv:
+                fields = [title, author, str(timestamp), str(length)]
+                if any(c in field for field in fields for c in "\t\n") or any(
+                    len(keyword.split()) != 1 for keyword in keywords
+                ):
+                    raise ValueError("%r cannot be written as TSV" % title)
+                line = "\t".join(fields + [" ".join(keywords)])
+            else:
+                line = json.dumps(
+                    [title, author, timestamp, length, keywords], ensure_ascii=False
+                )
+            metadata_file.write(line + "\n")
+
+
+def load_index(path, chunk_size=CHUNK_SIZE, report=None, compress=False, **options):
+    """
+    Builds an ArticleIndex from a metadata file, chunk by chunk
+
+    report, if given, is called after each chunk with the number of records
+    loaded so far and the records per second since the start. options are
+    passed on to ArticleIndex.
+    """
+    index = ArticleIndex(**options)
+    rows = 0
+    start = time.perf_counter()
+    for chunk in read_chunks(path, chunk_size):
+        index.extend(chunk)
+        rows += len(chunk)
+        if report is not None:
+            report(rows, rows / max(time.perf_counter() - start, 1e-9))
+    if compress:
+        index.compress()
+    return index
@@ -0,0 +1,408 @@
+from collections.abc import Mapping, Sequence
+import mmap
+import struct
+import sys
+
+from fuzzy import DeleteIndex
+from normalize import normalize
+from storage import packed, write_atomically
+from title_index import TitleIndex
+from vocabulary import Vocabulary
+
+# Read-only index file, queried in place through mmap so that every process
+# opening the same file shares one page cache copy. Layout (little endian,
+# every section aligned to 8 bytes):
+#   header:   magic, version, flags, title/keyword/author/posting counts,
+#             then the byte offset of each section below
+#   titles:   offsets (u64, count + 1) into a UTF-8 blob, in title id order
+#   order:    title ids (u32) sorted by title, for title -> id lookups
+#   authors:  offsets (u64, count + 1) into a UTF-8 blob
+#   columns:  author id (u32), timestamp (i64), length (i64) per title id
+#   keywords: offsets (u64, count + 1) into a UTF-8 blob, sorted by keyword
+#   postings: offsets (u64, count + 1) into packed title ids (u32)
+MAGIC = b"ASEM"
+VERSION = 1
+_SECTIONS = (
+    "title_offsets",
+    "title_blob",
+    "title_order",
+    "author_offsets",
+    "author_blob",
+    "author_column",
+    "timestamp_column",
+    "length_column",
+    "keyword_offsets",
+    "keyword_blob",
+    "posting_offsets",
+    "postings",
+)
+# Set in the header's flags when keywords are stored NFKC casefolded
+FLAG_NORMALIZED = 1
+_HEADER = struct.Struct("<4sHHIIIQ" + "Q" * len(_SECTIONS))
+
+
+def _blob(strings):
+    encoded = [string.encode("utf-8") for string in strings]
+    offsets = [0]
+    for string in encoded:
+        offsets.append(offsets[-1] + len(string))
+    return packed("Q", offsets), b"".join(encoded)
+
+
+def _padded(section):
+    return section + b"\0" * (-len(section) % 8)
+
+
+def dumps(keyword_to_titles, title_to_info, normalized=False):
+    """Serializes both indexes to the memory-mappable file format"""
+    titles = list(title_to_info)
+    title_ids = {title: title_id for title_id, title in enumerate(titles)}
+    for postings in keyword_to_titles.values():
+        for title in postings:
+            if title not in title_ids:
+                title_ids[title] = len(titles)
+                titles.append(title)
+
+    authors = []
+    author_ids = {}
+    author_column = []
+    timestamp_column = []
+    length_column = []
+    for title in titles:
+        info = title_to_info.get(title, {"author": "", "timestamp": 0, "length": 0})
+        if info["author"] not in author_ids:
+            author_ids[info["author"]] = len(authors)
+            authors.append(info["author"])
+        author_column.append(author_ids[info["author"]])
+        timestamp_column.append(info["timestamp"])
+        length_column.append(info["length"])
+
+    keyword_ids = {}
+    for keyword, keyword_titles in keyword_to_titles.items():
+        ids = [title_ids[title] for title in keyword_titles]
+        if normalized:
+            # Keywords that only differ in case or compatibility form merge
+            keyword = normalize(keyword)
+            if keyword in keyword_ids:
+                ids = sorted(set(keyword_ids[keyword]).union(ids))
+        keyword_ids[keyword] = ids
+    keywords = sorted(keyword_ids, key=lambda keyword: keyword.encode("utf-8"))
+    posting_offsets = [0]
+    postings = []
+    for keyword in keywords:
+        postings.extend(keyword_ids[keyword])
+        posting_offsets.append(len(postings))
+
+    title_offsets, title_blob = _blob(titles)
+    author_offsets, author_blob = _blob(authors)
+    keyword_offsets, keyword_blob = _blob(keywords)
+    title_order = sorted(range(len(titles)), key=lambda i: titles[i].encode("utf-8"))
+    sections = [
+        title_offsets,
+        title_blob,
+        packed("I", title_order),
+        author_offsets,
+        author_blob,
+        packed("I", author_column),
+        packed("q", timestamp_column),
+        packed("q", length_column),
+        keyword_offsets,
+        keyword_blob,
+        packed("Q", posting_offsets),
+        packed("I", postings),
+    ]
+
+    offsets = []
+    position = _HEADER.size + (-_HEADER.size % 8)
+    for section in sections:
+        offsets.append(position)
+        position += len(_padded(section))
+    header = _HEADER.pack(
+        MAGIC,
+        VERSION,
+        FLAG_NORMALIZED if normalized else 0,
+        len(titles),
+        len(keywords),
+        len(authors),
+        len(postings),
+        *offsets
+    )
+    return _padded(header) + b"".join(_padded(section) for section in sections)
+
+
+def write_mapped_index(path, keyword_to_titles, title_to_info, normalized=False):
+    """Atomically writes both indexes to a memory-mappable file at path"""
+    write_atomically(path, dumps(keyword_to_titles, title_to_info, normalized))
+
+
+class MappedIndex:
+    """
+    Read-only keyword and article index queried directly from a mapped file.
+
+    Behaves like keyword_to_titles' dictionary for search(), and info()
+    returns a view that behaves like title_to_info's dictionary. Files
+    written normalized have their keyword lookups normalized too.
+    """
+
+    def __init__(self, path):
+        if sys.byteorder != "little":
+            raise ValueError("mapped indexes can only be opened on little endian hosts")
+        with open(path, "rb") as index_file:
+            self._map = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._buffer = memoryview(self._map)
+        if len(self._buffer) < _HEADER.size:
+            self.close()
+            raise ValueError("mapped index is truncated")
+        header = _HEADER.unpack_from(self._buffer)
+        magic, version, flags, titles, keywords, authors, postings = header[:7]
+        if magic != MAGIC:
+            self.close()
+            raise ValueError("not a mapped index")
+        if version != VERSION:
+            self.close()
+            raise ValueError("unsupported mapped index version %d" % version)
+
+        starts = dict(zip(_SECTIONS, header[7:]))
+        sizes = {
+            "title_offsets": (titles + 1) * 8,
+            "title_order": titles * 4,
+            "author_offsets": (authors + 1) * 8,
+            "author_column": titles * 4,
+            "timestamp_column": titles * 8,
+            "length_column": titles * 8,
+            "keyword_offsets": (keywords + 1) * 8,
+            "posting_offsets": (keywords + 1) * 8,
+            "postings": postings * 4,
+        }
+        self._title_offsets = self._section(starts, sizes, "title_offsets", "Q")
+        self._title_order = self._section(starts, sizes, "title_order", "I")
+        self._author_offsets = self._section(starts, sizes, "author_offsets", "Q")
+        self._authors = self._section(starts, sizes, "author_column", "I")
+        self._timestamps = self._section(starts, sizes, "timestamp_column", "q")
+        self._lengths = self._section(starts, sizes, "length_column", "q")
+        self._keyword_offsets = self._section(starts, sizes, "keyword_offsets", "Q")
+        self._posting_offsets = self._section(starts, sizes, "posting_offsets", "Q")
+        self._postings = self._section(starts, sizes, "postings", "I")
+        self._title_blob = self._buffer[starts["title_blob"] :]
+        self._author_blob = self._buffer[starts["author_blob"] :]
+        self._keyword_blob = self._buffer[starts["keyword_blob"] :]
+        self.title_count = titles
+        self.keyword_count = keywords
+        self.normalized = bool(flags & FLAG_NORMALIZED)
+        # Built from the keyword table on the first fuzzy lookup
+        self._fuzzy = None
+        # Built from the titles on the first title search
+        self._title_index = None
+        # Summed over the length column on the first ranked query
+        self._average_length = None
+
+    def _section(self, starts, sizes, name, typecode):
+        start = starts[name]
+        end = start + sizes[name]
+        if end > len(self._buffer):
+            self.close()
+            raise ValueError("mapped index is truncated")
+        return self._buffer[start:end].cast(typecode)
+
+    def close(self):
+        # Views into the map have to be released before the map itself
+        for name, value in list(vars(self).items()):
+            if isinstance(value, memoryview) and name != "_buffer":
+                value.release()
+        if hasattr(self, "_buffer"):
+            self._buffer.release()
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _keyword(self, position):
+        offsets = self._keyword_offsets
+        return bytes(self._keyword_blob[offsets[position] : offsets[position + 1]])
+
+    def _find_keyword(self, keyword):
+        # Binary search over the sorted keyword table, nothing is deserialized
+        target = self.normalize_keyword(keyword).encode("utf-8")
+        low, high = 0, self.keyword_count
+        while low < high:
+            middle = (low + high) // 2
+            if self._keyword(middle) < target:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.keyword_count and self._keyword(low) == target:
+            return low
+        return None
+
+    def all_ids(self):
+        """Returns the ascending ids of every article"""
+        return range(self.title_count)
+
+    def normalize_keyword(self, keyword):
+        """Returns the form keyword is stored under"""
+        return normalize(keyword) if self.normalized else keyword
+
+    def _ids_at(self, position):
+        offsets = self._posting_offsets
+        return self._postings[offsets[position] : offsets[position + 1]]
+
+    def lookup_ids(self, keyword):
+        """
+        Returns a zero-copy view of the title ids containing keyword
+
+        The view has to be released before the index is closed.
+        """
+        position = self._find_keyword(keyword)
+        if position is None:
+            return self._postings[0:0]
+        return self._ids_at(position)
+
+    def title(self, title_id):
+        offsets = self._title_offsets
+        return str(self._title_blob[offsets[title_id] : offsets[title_id + 1]], "utf-8")
+
+    def titles_for_ids(self, ids):
+        return [self.title(title_id) for title_id in ids]
+
+    def author(self, title_id):
+        author_id = self._authors[title_id]
+        offsets = self._author_offsets
+        return str(
+            self._author_blob[offsets[author_id] : offsets[author_id + 1]], "utf-8"
+        )
+
+    def timestamp(self, title_id):
+        return self._timestamps[title_id]
+
+    def length(self, title_id):
+        return self._lengths[title_id]
+
+    @property
+    def lengths(self):
+        """The length column, a view indexed by title id"""
+        return self._lengths
+
+    def average_length(self):
+        if self._average_length is None:
+            self._average_length = (
+                sum(self._lengths) / self.title_count if self.title_count else 0.0
+            )
+        return self._average_length
+
+    def title_id(self, title):
+        """Returns the id of title, or None if it is not in the index"""
+        target = title.encode("utf-8")
+        offsets = self._title_offsets
+        order = self._title_order
+        low, high = 0, self.title_count
+        while low < high:
+            middle = (low + high) // 2
+            title_id = order[middle]
+            if (
+                bytes(self._title_blob[offsets[title_id] : offsets[title_id + 1]])
+                < target
+            ):
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.title_count and self.title(order[low]) == title:
+            return order[low]
+        return None
+
+    def vocabulary(self):
+        """Returns a Vocabulary searching the sorted keyword table in place"""
+        return Vocabulary(_KeywordTable(self), presorted=True)
+
+    def fuzzy_index(self):
+        """Returns a DeleteIndex over the keywords, built on first use"""
+        if self._fuzzy is None:
+            self._fuzzy = DeleteIndex(self)
+        return self._fuzzy
+
+    def title_index(self):
+        """Returns a TitleIndex over the titles, built on first use"""
+        if self._title_index is None:
+            self._title_index = TitleIndex(
+                self.title(title_id) for title_id in range(self.title_count)
+            )
+        return self._title_index
+
+    def info(self):
+        """Returns a read-only title_to_info style view over the mapped columns"""
+        return MappedInfo(self)
+
+    def get(self, keyword, default=None):
+        position = self._find_keyword(keyword)
+        if position is None:
+            return default
+        with self._ids_at(position) as title_ids:
+            return [self.title(title_id) for title_id in title_ids]
+
+    def __getitem__(self, keyword):
+        titles = self.get(keyword)
+        if titles is None:
+            raise KeyError(keyword)
+        return titles
+
+    def __contains__(self, keyword):
+        return self._find_keyword(keyword) is not None
+
+    def __iter__(self):
+        for position in range(self.keyword_count):
+            yield str(self._keyword(position), "utf-8")
+
+    def keys(self):
+        return list(self)
+
+    def __len__(self):
+        return self.keyword_count
+
+
+class _KeywordTable(Sequence):
+    # UTF-8 byte order is code point order, so the table is sorted as str too
+    def __init__(self, index):
+        self._index = index
+
+    def __getitem__(self, position):
+        if not 0 <= position < self._index.keyword_count:
+            raise IndexError(position)
+        return str(self._index._keyword(position), "utf-8")
+
+    def __len__(self):
+        return self._index.keyword_count
+
+
+class MappedInfo(Mapping):
+    """title -> {"author", "timestamp", "length"} view over a MappedIndex"""
+
+    def __init__(self, index):
+        self._index = index
+
+    def _info(self, title_id):
+        return {
+            "author": self._index.author(title_id),
+            "timestamp": self._index.timestamp(title_id),
+            "length": self._index.length(title_id),
+        }
+
+    def __getitem__(self, title):
+        title_id = self._index.title_id(title)
+        if title_id is None:
+            raise KeyError(title)
+        return self._info(title_id)
+
+    def title_index(self):
+        return self._index.title_index()
+
+    def titles_for_ids(self, ids):
+        return self._index.titles_for_ids(ids)
+
+    def __iter__(self):
+        for title_id in range(self._index.title_count):
+            yield self._index.title(title_id)
+
+    def __len__(self):
+        return self._index.title_count
@@ -0,0 +1,13 @@
+import unicodedata
+
+# Normalized indexes store keywords and authors in this form and apply it to
+# each query term once, so matching is case and compatibility insensitive
+# ("Music", "MUSIC" and "ｍｕｓｉｃ" all match "music") without lowering
+# anything per comparison.
+
+
+def normalize(text):
+    """Returns text NFKC normalized and casefolded"""
+    # Casefolding can leave text that is no longer NFKC, e.g. for "ß" + a
+    # combining mark, hence the second pass
+    return unicodedata.normalize("NFKC", unicodedata.normalize("NFKC", text).casefold())
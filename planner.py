@@ -0,0 +1,197 @@
+from array import array
+from math import log2
+
+from postings import difference, intersect, union_all
+from query import evaluate, is_boolean_query, parse_query
+from vocabulary import is_wildcard
+import table
+
+# Rough cost, in Python level operations per id, of testing a candidate
+# against a column: far cheaper once NumPy evaluates the test vectorized
+_SCAN_COST = 1.0
+_VECTORIZED_SCAN_COST = 0.05
+
+
+def _intersect_cost(first, second):
+    # Mirrors postings.intersect: galloping when one side is much shorter,
+    # otherwise a set probe over both
+    small, large = sorted((first, second))
+    if small * 8 < large:
+        return small * (1 + log2(large / max(small, 1)))
+    return small + large
+
+
+def _sort_cost(count):
+    return count * log2(count + 1)
+
+
+class Predicate:
+    """One condition of a query with its index and scan access paths"""
+
+    def __init__(self, description, count, fetch, scan=None, fetch_cost=0):
+        self.description = description
+        self.count = count
+        self.fetch = fetch
+        self.scan = scan
+        # Stored postings are handed out as they are, compressed ones are
+        # decoded and length ranges sorted by id first
+        self.fetch_cost = fetch_cost
+        self.excluding = False
+
+
+class Step:
+    def __init__(self, action, predicate, access, rows, cost):
+        self.action = action
+        self.predicate = predicate
+        self.access = access
+        self.rows = rows
+        self.cost = cost
+
+
+def _predicates(index, keyword, filters):
+    articles = index.table
+    if is_boolean_query(keyword) or is_wildcard(keyword):
+        # Boolean and wildcard queries are evaluated up front, their count is
+        # then exact
+        ids = evaluate(parse_query(keyword), index)
+        predicates = [Predicate("query %r" % keyword, len(ids), lambda: ids)]
+    else:
+        predicates = [
+            Predicate(
+                "keyword %r" % keyword,
+                index.document_frequency(keyword),
+                lambda: index.lookup_ids(keyword),
+                fetch_cost=index.document_frequency(keyword) if index.compressed else 0,
+            )
+        ]
+    for kind, value in filters:
+        if kind == "author":
+            predicates.append(
+                Predicate(
+                    "author = %r" % value,
+                    articles.author_count(value),
+                    lambda value=value: articles.ids_by_author(value),
+                    lambda ids, value=value: articles.scan_author(ids, value),
+                )
+            )
+        elif kind == "year":
+            predicates.append(
+                Predicate(
+                    "year = %r" % (value,),
+                    len(articles.year_ids.get(value, ())),
+                    lambda value=value: articles.year_ids.get(value, array("I")),
+                    lambda ids, value=value: articles.scan_year(ids, value),
+                )
+            )
+        elif kind == "length":
+            min_length, max_length = value
+            count = articles.length_count(min_length, max_length)
+            predicates.append(
+                Predicate(
+                    "%slength%s"
+                    % (
+                        "" if min_length is None else "%d <= " % min_length,
+                        "" if max_length is None else " <= %d" % max_length,
+                    ),
+                    count,
+                    lambda value=value: articles.length_range(*value),
+                    lambda ids, value=value: articles.scan_length(
+                        ids, value[1], value[0]
+                    ),
+                    fetch_cost=_sort_cost(count),
+                )
+            )
+        else:
+            keywords = []
+            for term in value:
+                if is_wildcard(term):
+                    pattern = index.normalize_keyword(term)
+                    keywords.extend(index.vocabulary().expand(pattern))
+                else:
+                    keywords.append(term)
+            excluded = sum(index.document_frequency(term) for term in keywords)
+            predicate = Predicate(
+                "NOT keyword in %r" % (list(value),),
+                min(len(index.table), excluded),
+                lambda keywords=keywords: union_all(
+                    [index.lookup_ids(keyword) for keyword in keywords]
+                ),
+                fetch_cost=0 if len(keywords) == 1 else excluded,
+            )
+            predicate.excluding = True
+            predicates.append(predicate)
+    return predicates
+
+
+class QueryPlan:
+    """
+    Evaluation order and access paths chosen for one query.
+
+    The included predicate matching the fewest articles is fetched from its
+    index first. The others follow from most to least selective, each either
+    intersected with its index or tested per candidate against its column,
+    whichever the estimated cost favours. Estimates use keyword document
+    frequencies, author and year posting counts and exact length range
+    counts from the length index, assuming independent predicates.
+    """
+
+    def __init__(self, index, keyword, filters=()):
+        self.total = len(index.table)
+        scan_cost = _VECTORIZED_SCAN_COST if table.numpy is not None else _SCAN_COST
+        predicates = _predicates(index, keyword, filters)
+        included = [p for p in predicates if not p.excluding]
+        driver = min(included, key=lambda p: (p.count, p.fetch_cost))
+        self.steps = [Step("fetch", driver, "index", driver.count, driver.fetch_cost)]
+
+        def kept(predicate):
+            fraction = predicate.count / self.total if self.total else 0
+            return 1 - fraction if predicate.excluding else fraction
+
+        rows = driver.count
+        for predicate in sorted((p for p in predicates if p is not driver), key=kept):
+            index_cost = predicate.fetch_cost + _intersect_cost(rows, predicate.count)
+            if predicate.excluding:
+                action, access, cost = "exclude", "index", index_cost
+            elif predicate.scan is not None and rows * scan_cost < index_cost:
+                action, access, cost = "filter", "scan", rows * scan_cost
+            else:
+                action, access, cost = "filter", "index", index_cost
+            rows = rows * kept(predicate)
+            self.steps.append(Step(action, predicate, access, rows, cost))
+
+    def execute(self):
+        """Returns the ascending ids of the matching articles, a new array"""
+        ids = fetched = self.steps[0].predicate.fetch()
+        for step in self.steps[1:]:
+            if not len(ids):
+                break
+            predicate = step.predicate
+            if step.action == "exclude":
+                ids = difference(ids, predicate.fetch())
+            elif step.access == "scan":
+                ids = predicate.scan(ids)
+            else:
+                ids = intersect(ids, predicate.fetch())
+        # Unfiltered, or with nothing excluded, ids can still be an index's
+        # own posting list, which callers must not be able to change
+        if ids is fetched or not isinstance(ids, array):
+            return array("I", ids)
+        return ids
+
+    def explain(self):
+        """Returns a readable description of the plan, one line per step"""
+        lines = ["plan over %d articles:" % self.total]
+        for number, step in enumerate(self.steps, 1):
+            lines.append(
+                "  %d. %-7s %-40s via %-5s  matches %-7d est. rows %-9.1f cost %.1f"
+                % (
+                    number,
+                    step.action,
+                    step.predicate.description,
+                    step.access,
+                    step.predicate.count,
+                    step.rows,
+                    step.cost,
+                )
+            )
+        return "\n".join(lines)
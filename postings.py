@@ -0,0 +1,135 @@
+from array import array
+from bisect import bisect_left
+from itertools import accumulate
+
+# Posting lists of ascending article ids, stored as the gaps between
+# consecutive ids in variable-byte form: 7 bits per byte, least significant
+# group first, with the high bit set on every byte but the last of a gap.
+
+
+def encode_postings(ids):
+    """Returns ascending ids delta encoded and variable-byte packed"""
+    encoded = bytearray()
+    previous = 0
+    for title_id in ids:
+        gap = title_id - previous
+        if gap < 0:
+            raise ValueError("posting ids must be ascending")
+        previous = title_id
+        while gap >= 0x80:
+            encoded.append((gap & 0x7F) | 0x80)
+            gap >>= 7
+        encoded.append(gap)
+    return bytes(encoded)
+
+
+def decode_postings(data):
+    """Returns the array('I') of ids packed by encode_postings"""
+    if not data:
+        return array("I")
+    if max(data) < 0x80:
+        # Every gap fits in one byte, the common case for frequent keywords
+        return array("I", list(accumulate(data)))
+    ids = array("I")
+    append = ids.append
+    title_id = gap = shift = 0
+    for byte in data:
+        if byte & 0x80:
+            gap |= (byte & 0x7F) << shift
+            shift += 7
+        else:
+            title_id += gap | (byte << shift)
+            append(title_id)
+            gap = shift = 0
+    return ids
+
+
+def gallop(ids, target, low=0):
+    """
+    Returns the first position at or after low whose id is >= target
+
+    Probes low + 1, low + 3, low + 7, ... before binary searching the last
+    step, so skipping k ids costs O(log k) rather than O(log len(ids)).
+    """
+    end = len(ids)
+    if low >= end or ids[low] >= target:
+        return low
+    step = 1
+    high = low + 1
+    while high < end and ids[high] < target:
+        low = high
+        step *= 2
+        high = low + step
+    return bisect_left(ids, target, low + 1, min(high, end))
+
+
+def intersect(first, second):
+    """Returns the ascending ids present in both ascending id sequences"""
+    if len(first) > len(second):
+        first, second = second, first
+    if not first:
+        return array("I")
+    if len(first) * 8 < len(second):
+        # Much shorter first list, gallop through the second for each of its ids
+        found = array("I")
+        position = 0
+        end = len(second)
+        for title_id in first:
+            position = gallop(second, title_id, position)
+            if position == end:
+                break
+            if second[position] == title_id:
+                found.append(title_id)
+        return found
+    wanted = set(first)
+    return array("I", [title_id for title_id in second if title_id in wanted])
+
+
+def intersect_all(id_lists):
+    """Intersects ascending id sequences, shortest first"""
+    id_lists = sorted(id_lists, key=len)
+    if not id_lists:
+        return array("I")
+    result = _id_array(id_lists[0])
+    for ids in id_lists[1:]:
+        if not result:
+            break
+        result = intersect(result, ids)
+    return result
+
+
+def union_all(id_lists):
+    """Returns the ascending ids present in any of the ascending id sequences"""
+    id_lists = [ids for ids in id_lists if len(ids)]
+    if len(id_lists) == 1:
+        return _id_array(id_lists[0])
+    merged = set()
+    for ids in id_lists:
+        merged.update(ids)
+    return array("I", sorted(merged))
+
+
+def difference(ids, excluded):
+    """Returns the ascending ids in ids but not in the ascending excluded"""
+    if not excluded or not ids:
+        return _id_array(ids)
+    if len(excluded) * 8 < len(ids):
+        # Few exclusions, gallop to each one and copy the runs between them
+        result = array("I")
+        start = 0
+        for title_id in excluded:
+            position = gallop(ids, title_id, start)
+            result.extend(ids[start:position])
+            start = position
+            if start < len(ids) and ids[start] == title_id:
+                start += 1
+        result.extend(ids[start:])
+        return result
+    excluded = set(excluded)
+    return array("I", [title_id for title_id in ids if title_id not in excluded])
+
+
+def _id_array(ids):
+    if isinstance(ids, array) and ids.typecode == "I":
+        return ids
+    return array("I", ids)
@@ -0,0 +1,123 @@
+from array import array
+import re
+
+from postings import difference, intersect_all, union_all
+from vocabulary import is_wildcard
+
+# Boolean keyword queries such as "music AND jazz", "pop OR rock" and
+# "music NOT dance". Operators are upper case, so the lower case keywords
+# "and", "or" and "not" can still be searched. AND binds tighter than OR,
+# adjacent keywords are ANDed, and parentheses group. A keyword with "*",
+# such as "canad*", stands for every keyword it matches.
+OPERATORS = ("AND", "OR", "NOT")
+_TOKENS = re.compile(r"\(|\)|[^\s()]+")
+
+
+def is_boolean_query(text):
+    """Returns whether text uses any boolean operator or parenthesis"""
+    return any(
+        token in OPERATORS or token in ("(", ")") for token in _TOKENS.findall(text)
+    )
+
+
+def parse_query(text):
+    """
+    Returns the parse tree of a boolean query
+
+    Trees are ("term", keyword), ("not", tree), ("and", [trees]) and
+    ("or", [trees]). Raises ValueError on a malformed query.
+    """
+    tokens = _TOKENS.findall(text)
+    tree, position = _parse_or(tokens, 0)
+    if position != len(tokens):
+        raise ValueError("unexpected %r in query" % tokens[position])
+    return tree
+
+
+def _parse_or(tokens, position):
+    children = []
+    tree, position = _parse_and(tokens, position)
+    children.append(tree)
+    while position < len(tokens) and tokens[position] == "OR":
+        tree, position = _parse_and(tokens, position + 1)
+        children.append(tree)
+    return (children[0] if len(children) == 1 else ("or", children)), position
+
+
+def _parse_and(tokens, position):
+    children = []
+    tree, position = _parse_unary(tokens, position)
+    children.append(tree)
+    while position < len(tokens) and tokens[position] not in ("OR", ")"):
+        if tokens[position] == "AND":
+            position += 1
+        tree, position = _parse_unary(tokens, position)
+        children.append(tree)
+    return (children[0] if len(children) == 1 else ("and", children)), position
+
+
+def _parse_unary(tokens, position):
+    if position == len(tokens):
+        raise ValueError("query ends where a keyword was expected")
+    token = tokens[position]
+    if token == "NOT":
+        tree, position = _parse_unary(tokens, position + 1)
+        return ("not", tree), position
+    if token == "(":
+        tree, position = _parse_or(tokens, position + 1)
+        if position == len(tokens) or tokens[position] != ")":
+            raise ValueError("unbalanced parenthesis in query")
+        return tree, position + 1
+    if token in ("AND", "OR", ")"):
+        raise ValueError("unexpected %r in query" % token)
+    return ("term", token), position + 1
+
+
+def positive_terms(tree):
+    """Returns the keywords of a parse tree that are not under a NOT, in order"""
+    kind = tree[0]
+    if kind == "term":
+        return [tree[1]]
+    if kind == "not":
+        return []
+    return [keyword for child in tree[1] for keyword in positive_terms(child)]
+
+
+def wildcard_ids(pattern, index):
+    """Returns the ascending ids containing any keyword matching pattern"""
+    keywords = index.vocabulary().expand(index.normalize_keyword(pattern))
+    return union_all([index.lookup_ids(keyword) for keyword in keywords])
+
+
+def evaluate(tree, index):
+    """
+    Returns the ascending ids matching a parse tree
+
+    AND intersects its positive operands smallest first, galloping through
+    the longer lists, then removes its NOT operands. A bare NOT is taken
+    against every article.
+    """
+    kind = tree[0]
+    if kind == "term":
+        if is_wildcard(tree[1]):
+            return wildcard_ids(tree[1], index)
+        return index.lookup_ids(tree[1])
+    if kind == "or":
+        return union_all([evaluate(child, index) for child in tree[1]])
+    if kind == "not":
+        return difference(index.all_ids(), evaluate(tree[1], index))
+
+    included = [child for child in tree[1] if child[0] != "not"]
+    excluded = [child[1] for child in tree[1] if child[0] == "not"]
+    if included:
+        ids = intersect_all([evaluate(child, index) for child in included])
+    else:
+        ids = index.all_ids()
+    if excluded and len(ids):
+        ids = difference(ids, union_all([evaluate(child, index) for child in excluded]))
+    return ids if isinstance(ids, array) else array("I", ids)
+
+
+def boolean_search(text, index):
+    """Returns the titles matching a boolean query, in article id order"""
+    return index.titles_for_ids(evaluate(parse_query(text), index))
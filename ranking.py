@@ -0,0 +1,238 @@
+from array import array
+from heapq import heappush, heapreplace
+from math import log
+from postings import gallop
+
+# BM25 scoring. Keywords are a set per article, so every matched keyword
+# counts once and an article's score grows with how many query keywords it
+# matches, how rare each of them is and how short the article is relative
+# to the average length.
+K1 = 1.2
+B = 0.75
+# Ids per block of a posting list in block-max WAND
+BLOCK_SIZE = 64
+# Score upper bounds are padded by this relative margin, so rounding in their
+# sums can never prune an article that belongs in the top k
+_BOUND_MARGIN = 1 + 1e-9
+
+
+def idf(document_frequency, total):
+    """Returns the BM25 weight of a keyword found in document_frequency articles"""
+    return log(1 + (total - document_frequency + 0.5) / (document_frequency + 0.5))
+
+
+def length_weight(length, average_length):
+    """Returns the BM25 factor of an article's length, multiplied by idf per keyword"""
+    return (K1 + 1) / (1 + K1 * (1 - B + B * length / (average_length or 1)))
+
+
+def top_k(scores, k):
+    """
+    Returns the k best (id, score) pairs of an iterable of them, best first
+
+    Keeps a heap of at most k entries, so the scores are never all sorted.
+    Equal scores rank the lower id first.
+    """
+    heap = []
+    if k <= 0:
+        return []
+    for title_id, score in scores:
+        entry = (score, -title_id)
+        if len(heap) < k:
+            heappush(heap, entry)
+        elif entry > heap[0]:
+            heapreplace(heap, entry)
+    return _best_first(heap)
+
+
+def _best_first(heap):
+    return [(-negated_id, score) for score, negated_id in sorted(heap, reverse=True)]
+
+
+def bm25_top_k(postings, lengths, average_length, total, k, candidates=None):
+    """Returns the k best scoring (id, score) pairs, best first"""
+    return top_k(
+        bm25_scores(postings, lengths, average_length, total, candidates).items(), k
+    )
+
+
+def bm25_scores(postings, lengths, average_length, total, candidates=None):
+    """
+    Returns a dictionary of id -> BM25 score over the articles matching any keyword
+
+    Args:
+      postings - one ascending id sequence per query keyword
+      lengths - article length by id
+      average_length - mean article length over the whole collection
+      total - number of articles in the collection
+      candidates - optional set of ids the results are restricted to
+    """
+    scores = {}
+    for ids in postings:
+        if not len(ids):
+            continue
+        weight = idf(len(ids), total)
+        for title_id in ids:
+            if candidates is not None and title_id not in candidates:
+                continue
+            scores[title_id] = scores.get(title_id, 0.0) + weight * length_weight(
+                lengths[title_id], average_length
+            )
+    return scores
+
+
+def rank_ids(index, keywords, k, ids=None):
+    """
+    Returns the k best (id, score) pairs of an ArticleIndex for keywords
+
+    Articles matching any keyword are ranked through the index's block-max
+    scorer, or only those in ids, scored exhaustively, if given.
+    """
+    # Variants of one stored keyword count once, like a repeated keyword
+    keywords = list(dict.fromkeys(index.normalize_keyword(k) for k in keywords))
+    if ids is None:
+        return index.block_max().top_k(keywords, k)
+    articles = index.table
+    return bm25_top_k(
+        [index.lookup_ids(keyword) for keyword in keywords],
+        articles.lengths,
+        articles.average_length(),
+        len(articles),
+        k,
+        set(ids),
+    )
+
+
+class _Cursor:
+    def __init__(self, order, ids, weight, last_ids, max_weights):
+        self.order = order
+        self.ids = ids
+        self.position = 0
+        self.title_id = ids[0]
+        self.weight = weight
+        self.max_score = weight * max(max_weights) * _BOUND_MARGIN
+        self.last_ids = last_ids
+        self.max_weights = max_weights
+        self.block = 0
+
+    def advance(self, target):
+        """Moves to the first id >= target, returns False once exhausted"""
+        self.position = gallop(self.ids, target, self.position)
+        if self.position == len(self.ids):
+            return False
+        self.title_id = self.ids[self.position]
+        return True
+
+    def block_max(self, target):
+        """Returns the highest score in the block that would hold target"""
+        self.block = gallop(self.last_ids, target, self.block)
+        if self.block == len(self.last_ids):
+            # The list ends before target
+            return 0.0
+        return self.weight * self.max_weights[self.block] * _BOUND_MARGIN
+
+    def block_end(self):
+        if self.block == len(self.last_ids):
+            return float("inf")
+        return self.last_ids[self.block]
+
+
+class BlockMaxScorer:
+    """
+    Top-k BM25 over an ArticleIndex with block-max WAND pruning.
+
+    Each keyword's ascending ids are split into blocks of block_size ids,
+    and each block keeps its last id and the highest length weight in it,
+    so a block's best possible score is idf times that weight. A candidate
+    is only scored once the best possible scores of the lists reaching it
+    could beat the current k-th score, and whole blocks are skipped when
+    their maxima cannot. Block metadata is built per keyword on first use.
+    Scores equal those of bm25_top_k.
+    """
+
+    def __init__(self, index, block_size=BLOCK_SIZE):
+        self.index = index
+        self.block_size = block_size
+        articles = index.table
+        self.total = len(articles)
+        average_length = articles.average_length()
+        self.weights = array(
+            "d", [length_weight(length, average_length) for length in articles.lengths]
+        )
+        self._blocks = {}
+
+    def blocks(self, keyword):
+        """Returns keyword's (ids, last id per block, max weight per block)"""
+        # Only the block metadata is kept, a compressed index's ids stay
+        # under its own decoded cache
+        ids = self.index.lookup_ids(keyword)
+        blocks = self._blocks.get(keyword)
+        if blocks is None:
+            weights = self.weights
+            last_ids = array("I")
+            max_weights = array("d")
+            for start in range(0, len(ids), self.block_size):
+                block = ids[start : start + self.block_size]
+                last_ids.append(block[-1])
+                max_weights.append(max(weights[title_id] for title_id in block))
+            blocks = self._blocks[keyword] = (last_ids, max_weights)
+        return (ids,) + blocks
+
+    def top_k(self, keywords, k):
+        """Returns the k best (id, score) pairs for keywords, best first"""
+        if k <= 0:
+            return []
+        cursors = []
+        for order, keyword in enumerate(dict.fromkeys(keywords)):
+            ids, last_ids, max_weights = self.blocks(keyword)
+            if len(ids):
+                weight = idf(len(ids), self.total)
+                cursors.append(_Cursor(order, ids, weight, last_ids, max_weights))
+        weights = self.weights
+        heap = []
+        while cursors:
+            cursors.sort(key=lambda cursor: cursor.title_id)
+            threshold = heap[0][0] if len(heap) == k else -1.0
+            # The pivot is the first id whose lists could together beat the
+            # threshold, no id before it can
+            bound = 0.0
+            pivot = None
+            for position, cursor in enumerate(cursors):
+                bound += cursor.max_score
+                if bound > threshold:
+                    pivot = position
+                    break
+            if pivot is None:
+                break
+            pivot_id = cursors[pivot].title_id
+            while pivot + 1 < len(cursors) and cursors[pivot + 1].title_id == pivot_id:
+                pivot += 1
+            reaching = cursors[: pivot + 1]
+            block_bound = sum(cursor.block_max(pivot_id) for cursor in reaching)
+            if block_bound > threshold:
+                if cursors[0].title_id == pivot_id:
+                    # Every list up to the pivot is on it, score it in query
+                    # keyword order, like bm25_scores does
+                    score = 0.0
+                    for cursor in sorted(reaching, key=lambda cursor: cursor.order):
+                        score += cursor.weight * weights[pivot_id]
+                    entry = (score, -pivot_id)
+                    if len(heap) < k:
+                        heappush(heap, entry)
+                    elif entry > heap[0]:
+                        heapreplace(heap, entry)
+                    target = pivot_id + 1
+                else:
+                    target = pivot_id
+            else:
+                # No id up to the end of the current blocks can beat the
+                # threshold, nor any before the next list's id
+                target = min(cursor.block_end() for cursor in reaching) + 1
+                if pivot + 1 < len(cursors):
+                    target = min(target, cursors[pivot + 1].title_id)
+            cursors = [
+                cursor
+                for cursor in cursors
+                if cursor.title_id >= target or cursor.advance(target)
+            ]
+        return _best_first(heap)
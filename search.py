@@ -1,16 +1,49 @@
 from nntplib import ArticleInfo
 from unittest import result
-from wiki import article_metadata, ask_search, ask_advanced_search
+from wiki import article_metadata, ask_search, ask_advanced_searches
+from index import ArticleIndex
+from table import ArticleTable
+from planner import QueryPlan
+from postings import union_all
+from query import boolean_search, is_boolean_query, parse_query, positive_terms
+from ranking import bm25_top_k, rank_ids
+from vocabulary import EXPANSION_LIMIT, Vocabulary, is_wildcard
+from fuzzy import MAX_DISTANCE, edit_distance
+from normalize import normalize
+from title_index import TitleIndex
+from snapshot import load_snapshot_index, write_snapshot
+from loader import load_index
+from mapped_index import MappedIndex, write_mapped_index
 from datetime import *
+import os
+import threading
 import time
 
+# Process-wide indexes shared by every function below, built on first use
+_indexes = {}
+_indexes_lock = threading.Lock()
+# Indexes whose filters run over article ids rather than titles
+_ID_INDEXES = (ArticleIndex, ArticleTable)
+_timings = {
+    "build_seconds": 0.0,
+    "builds": 0,
+    "snapshot_loads": 0,
+    "query_seconds": 0.0,
+    "queries": 0,
+}
 
-def keyword_to_titles(metadata):
+
+def keyword_to_titles(metadata, normalized=False):
+    # With normalized, keywords are stored NFKC casefolded, see normalize.py
     keyword_dictionary = {}
     for article in metadata:
         for word in article[4]:
+            if normalized:
+                word = normalize(word)
             if word in keyword_dictionary:
-                keyword_dictionary[word].append(article[0])
+                # "Music" and "music" in one article post its title once
+                if not normalized or keyword_dictionary[word][-1] != article[0]:
+                    keyword_dictionary[word].append(article[0])
             else:
                 keyword_dictionary[word] = [article[0]]
     return keyword_dictionary
@@ -27,26 +60,262 @@ def title_to_info(metadata):
     return title_dictionary
 
 
-def search(keyword, keyword_to_titles):
-    for key_word in keyword_to_titles:
-        if keyword == key_word:
-            return keyword_to_titles[key_word]
-    return []
+def load_indexes(
+    snapshot_path=None, mapped_path=None, normalized=False, metadata_path=None
+):
+    """
+    Returns the shared (keyword_to_titles, title_to_info) pair, building it once
+
+    Args:
+      snapshot_path - optional snapshot file to load the indexes from, it is
+        written after building from the metadata when missing, damaged or
+        normalized otherwise
+      mapped_path - optional mapped index file to query in place instead of
+        holding the indexes in memory, it is written when missing
+      normalized - whether keywords and authors match NFKC casefolded, only
+        takes effect when the indexes are built or written
+      metadata_path - optional .jsonl or .tsv metadata file to stream the
+        articles from when building, instead of wiki's METADATA
+    """
+    if "keyword_to_titles" not in _indexes:
+        with _indexes_lock:
+            if "keyword_to_titles" not in _indexes:
+                if mapped_path is not None:
+                    _indexes.update(
+                        _map_indexes(mapped_path, normalized, metadata_path)
+                    )
+                else:
+                    _indexes.update(
+                        _build_indexes(snapshot_path, normalized, metadata_path)
+                    )
+    return _indexes["keyword_to_titles"], _indexes["title_to_info"]
+
+
+def _map_indexes(mapped_path, normalized=False, metadata_path=None):
+    start = time.perf_counter()
+    index = None
+    if os.path.exists(mapped_path):
+        try:
+            index = MappedIndex(mapped_path)
+        except ValueError:
+            index = None
+        # A file normalized otherwise is rewritten, not silently mismatched
+        if index is not None and index.normalized != normalized:
+            index.close()
+            index = None
+    if index is None:
+        if metadata_path is not None:
+            built = load_index(metadata_path, normalized=normalized)
+            write_mapped_index(mapped_path, built, built.info(), normalized)
+        else:
+            metadata = article_metadata()
+            write_mapped_index(
+                mapped_path,
+                keyword_to_titles(metadata, normalized),
+                title_to_info(metadata),
+                normalized,
+            )
+        index = MappedIndex(mapped_path)
+    _timings["build_seconds"] += time.perf_counter() - start
+    _timings["builds"] += 1
+    return {"keyword_to_titles": index, "title_to_info": index.info()}
+
+
+def _build_indexes(snapshot_path, normalized=False, metadata_path=None):
+    start = time.perf_counter()
+    index = None
+    if snapshot_path is not None and os.path.exists(snapshot_path):
+        try:
+            index = load_snapshot_index(snapshot_path)
+            _timings["snapshot_loads"] += 1
+        except ValueError:
+            index = None
+        # A snapshot normalized otherwise is rebuilt, not silently mismatched
+        if index is not None and index.normalized != normalized:
+            index = None
+    if index is None:
+        if metadata_path is not None:
+            index = load_index(metadata_path, normalized=normalized)
+        else:
+            index = ArticleIndex.from_metadata(
+                article_metadata(), normalized=normalized
+            )
+        if snapshot_path is not None:
+            write_snapshot(snapshot_path, index)
+    _timings["build_seconds"] += time.perf_counter() - start
+    _timings["builds"] += 1
+    # The id based index serves as both dictionaries
+    return {"keyword_to_titles": index, "title_to_info": index}
+
+
+def invalidate_indexes():
+    """Drops the shared indexes so the next query rebuilds them"""
+    with _indexes_lock:
+        _indexes.clear()
+
+
+def index_timings():
+    """Returns cumulative index build cost and per-query cost, in seconds"""
+    timings = dict(_timings)
+    timings["seconds_per_query"] = (
+        timings["query_seconds"] / timings["queries"] if timings["queries"] else 0.0
+    )
+    return timings
+
+
+def _record_query(start):
+    _timings["query_seconds"] += time.perf_counter() - start
+    _timings["queries"] += 1
+
+
+def _shared_keywords(keyword_to_titles):
+    return load_indexes()[0] if keyword_to_titles is None else keyword_to_titles
+
+
+def _shared_info(title_to_info):
+    return load_indexes()[1] if title_to_info is None else title_to_info
+
+
+def search(keyword, keyword_to_titles=None):
+    # Works with keyword_to_titles' dictionary, a KeywordIndex, an ArticleIndex
+    # or a MappedIndex. A keyword with "*" is a wildcard search.
+    if is_wildcard(keyword):
+        return wildcard_search(keyword, keyword_to_titles)
+    return _shared_keywords(keyword_to_titles).get(keyword, [])
 
 
-def article_length(max_length, article_titles, title_to_info):
+def wildcard_search(pattern, keyword_to_titles=None, limit=EXPANSION_LIMIT):
+    """
+    Returns the titles containing any keyword matching pattern
+
+    pattern is a prefix such as "canad*" or has "*" anywhere, like "s*ng".
+    It expands to at most limit keywords. Titles come in article order from
+    an ArticleIndex or MappedIndex, otherwise in keyword order.
+    """
+    keyword_to_titles = _shared_keywords(keyword_to_titles)
+    pattern = _stored_form(pattern, keyword_to_titles)
+    keywords = _vocabulary(keyword_to_titles).expand(pattern, limit)
+    if hasattr(keyword_to_titles, "lookup_ids"):
+        return keyword_to_titles.titles_for_ids(
+            union_all([keyword_to_titles.lookup_ids(keyword) for keyword in keywords])
+        )
+    titles = {}
+    for keyword in keywords:
+        titles.update(dict.fromkeys(keyword_to_titles[keyword]))
+    return list(titles)
+
+
+def fuzzy_search(keyword, keyword_to_titles=None, max_distance=MAX_DISTANCE):
+    """
+    Returns the titles of the keywords closest to a possibly misspelled keyword
+
+    Keywords within max_distance edits are considered and only the closest
+    of them are used, so an exact match wins over any typo. Titles come in
+    article order from an ArticleIndex or MappedIndex, otherwise in keyword
+    order.
+    """
+    keyword_to_titles = _shared_keywords(keyword_to_titles)
+    matches = fuzzy_keywords(keyword, keyword_to_titles, max_distance)
+    keywords = [match for distance, match in matches if distance == matches[0][0]]
+    if hasattr(keyword_to_titles, "lookup_ids"):
+        return keyword_to_titles.titles_for_ids(
+            union_all([keyword_to_titles.lookup_ids(match) for match in keywords])
+        )
+    titles = {}
+    for match in keywords:
+        titles.update(dict.fromkeys(keyword_to_titles[match]))
+    return list(titles)
+
+
+def fuzzy_keywords(keyword, keyword_to_titles=None, max_distance=MAX_DISTANCE):
+    """Returns (distance, keyword) pairs within max_distance edits, closest first"""
+    keyword_to_titles = _shared_keywords(keyword_to_titles)
+    keyword = _stored_form(keyword, keyword_to_titles)
+    if hasattr(keyword_to_titles, "fuzzy_index"):
+        return keyword_to_titles.fuzzy_index().lookup(keyword, max_distance)
+    # Dictionaries have no index of their own, a bounded scan is cheaper than
+    # building one per call
+    matches = []
+    for candidate in keyword_to_titles.keys():
+        distance = edit_distance(keyword, candidate, max_distance)
+        if distance <= max_distance:
+            matches.append((distance, candidate))
+    return sorted(matches)
+
+
+def title_search(text, title_to_info=None, whole_words=False):
+    """
+    Returns the titles containing every whitespace separated part of text
+
+    Parts match case-insensitively anywhere in a title, so "edo tok" finds
+    "Edogawa, Tokyo", or only as whole words with whole_words. Titles come
+    in article order.
+    """
+    title_to_info = _shared_info(title_to_info)
+    if hasattr(title_to_info, "title_index"):
+        index = title_to_info.title_index()
+        ids = index.match_words(text) if whole_words else index.match(text)
+        return title_to_info.titles_for_ids(ids)
+    # Dictionaries have no title index of their own, one is built per call
+    titles = list(title_to_info)
+    index = TitleIndex(titles)
+    ids = index.match_words(text) if whole_words else index.match(text)
+    return [titles[title_id] for title_id in ids]
+
+
+def _stored_form(keyword, keyword_to_titles):
+    # Normalized indexes store keywords NFKC casefolded, so patterns and typo
+    # lookups that bypass their keyword accessors are normalized here
+    if getattr(keyword_to_titles, "normalized", False):
+        return normalize(keyword)
+    return keyword
+
+
+def _vocabulary(keyword_to_titles):
+    # Dictionaries have no vocabulary of their own, theirs is sorted per call
+    if hasattr(keyword_to_titles, "vocabulary"):
+        return keyword_to_titles.vocabulary()
+    return Vocabulary(keyword_to_titles.keys())
+
+
+def _expand_keywords(keywords, keyword_to_titles):
+    expanded = []
+    for keyword in keywords:
+        if is_wildcard(keyword):
+            pattern = _stored_form(keyword, keyword_to_titles)
+            expanded.extend(_vocabulary(keyword_to_titles).expand(pattern))
+        else:
+            expanded.append(keyword)
+    return expanded
+
+
+def article_length(max_length, article_titles, title_to_info=None, min_length=None):
+    # Either bound may be None to leave that side of the range open
+    title_to_info = _shared_info(title_to_info)
+    if isinstance(title_to_info, _ID_INDEXES):
+        index = title_to_info
+        ids = index.ids_for_titles(article_titles)
+        return index.titles_for_ids(index.filter_length(ids, max_length, min_length))
+    wanted = set(article_titles)
     less_than_max_length = []
     for article_title in title_to_info:
-        if article_title in article_titles:
-            if title_to_info[article_title]["length"] <= max_length:
+        if article_title in wanted:
+            length = title_to_info[article_title]["length"]
+            if (max_length is None or length <= max_length) and (
+                min_length is None or length >= min_length
+            ):
                 less_than_max_length.append(article_title)
     return less_than_max_length
 
 
-def key_by_author(article_titles, title_to_info):
+def key_by_author(article_titles, title_to_info=None):
+    title_to_info = _shared_info(title_to_info)
+    if isinstance(title_to_info, _ID_INDEXES):
+        return title_to_info.key_by_author(title_to_info.ids_for_titles(article_titles))
+    wanted = set(article_titles)
     author_dictionary = {}
     for article_title in title_to_info:
-        if article_title in article_titles:
+        if article_title in wanted:
             if title_to_info[article_title]["author"] not in author_dictionary:
                 author_dictionary[title_to_info[article_title]["author"]] = [
                     article_title
@@ -58,70 +327,320 @@ def key_by_author(article_titles, title_to_info):
     return author_dictionary
 
 
-def filter_to_author(author, article_titles, title_to_info):
+def filter_to_author(author, article_titles, title_to_info=None):
+    title_to_info = _shared_info(title_to_info)
+    if isinstance(title_to_info, _ID_INDEXES):
+        index = title_to_info
+        ids = index.ids_for_titles(article_titles)
+        return index.titles_for_ids(index.filter_author(ids, author))
+    wanted = set(article_titles)
     author_articles = []
     for article_title in title_to_info:
-        if article_title in article_titles:
+        if article_title in wanted:
             if title_to_info[article_title]["author"] == author:
                 author_articles.append(article_title)
     return author_articles
 
 
-def filter_out(keyword, article_titles, keyword_to_titles):
-    does_not_contain_keyword = article_titles.copy()
-    for key_word in keyword_to_titles:
-        if keyword == key_word:
-            for article in keyword_to_titles[key_word]:
-                if article in article_titles:
-                    does_not_contain_keyword.remove(article)
-    return does_not_contain_keyword
+def filter_out(keyword, article_titles, keyword_to_titles=None):
+    # keyword may also be a list of keywords, to exclude them all in one pass,
+    # and patterns such as "dan*" exclude every keyword they match.
+    # article_titles' order is kept.
+    keyword_to_titles = _shared_keywords(keyword_to_titles)
+    keywords = [keyword] if isinstance(keyword, str) else keyword
+    keywords = _expand_keywords(keywords, keyword_to_titles)
+    if isinstance(keyword_to_titles, ArticleIndex):
+        excluded = keyword_to_titles.excluded_ids(keywords)
+        title_ids = keyword_to_titles.title_ids
+        return [
+            title for title in article_titles if title_ids.get(title) not in excluded
+        ]
+    excluded = set()
+    for key_word in keywords:
+        excluded.update(keyword_to_titles.get(key_word, ()))
+    return [title for title in article_titles if title not in excluded]
 
 
-def articles_from_year(year, article_titles, title_to_info):
+def articles_from_year(year, article_titles, title_to_info=None):
+    title_to_info = _shared_info(title_to_info)
+    if isinstance(title_to_info, _ID_INDEXES):
+        index = title_to_info
+        ids = index.ids_for_titles(article_titles)
+        return index.titles_for_ids(index.filter_year(ids, year))
+    wanted = set(article_titles)
     from_year = []
     for article_title in title_to_info:
-        if article_title in article_titles:
-            if year == int(
-                datetime.utcfromtimestamp(
-                    title_to_info[article_title]["timestamp"]
-                ).strftime("%Y")
-            ):
+        if article_title in wanted:
+            timestamp = title_to_info[article_title]["timestamp"]
+            if year == datetime.fromtimestamp(timestamp, timezone.utc).year:
                 from_year.append(article_title)
     return from_year
 
 
+def ranked_search(keywords, k=10, keyword_to_titles=None, title_to_info=None):
+    """
+    Returns the k articles most relevant to keywords, best first
+
+    keywords is a list or a whitespace separated string. Articles matching
+    any of them are scored with BM25: rarer keywords, more matched keywords
+    and shorter articles rank higher. Ties keep article order.
+    """
+    keyword_to_titles = _shared_keywords(keyword_to_titles)
+    title_to_info = _shared_info(title_to_info)
+    if isinstance(keywords, str):
+        keywords = keywords.split()
+    keywords = _expand_keywords(keywords, keyword_to_titles)
+    if isinstance(keyword_to_titles, ArticleIndex):
+        ranked = rank_ids(keyword_to_titles, keywords, k)
+        return keyword_to_titles.titles_for_ids([title_id for title_id, _ in ranked])
+    if isinstance(keyword_to_titles, MappedIndex):
+        return _rank_mapped(keywords, k, keyword_to_titles)
+    return _rank_titles(keywords, k, keyword_to_titles, title_to_info)
+
+
+def _rank_mapped(keywords, k, index, titles=None):
+    # Scores the mapped postings and length column by id, only the titles
+    # returned, and any candidates, are looked up
+    candidates = None
+    if titles is not None:
+        candidates = {index.title_id(title) for title in titles}
+    ranked = bm25_top_k(
+        [
+            index.lookup_ids(keyword)
+            for keyword in dict.fromkeys(index.normalize_keyword(k) for k in keywords)
+        ],
+        index.lengths,
+        index.average_length(),
+        index.title_count,
+        k,
+        candidates,
+    )
+    return index.titles_for_ids([title_id for title_id, _ in ranked])
+
+
+def _rank_titles(keywords, k, keyword_to_titles, title_to_info, titles=None):
+    # Ranks over positions in title_to_info, the order article ids follow
+    ordered = list(title_to_info)
+    positions = {title: position for position, title in enumerate(ordered)}
+    lengths = [title_to_info[title]["length"] for title in ordered]
+    postings = [
+        sorted(
+            positions[title]
+            for title in keyword_to_titles.get(keyword, [])
+            if title in positions
+        )
+        for keyword in dict.fromkeys(
+            _stored_form(keyword, keyword_to_titles) for keyword in keywords
+        )
+    ]
+    candidates = None
+    if titles is not None:
+        candidates = {positions[title] for title in titles if title in positions}
+    ranked = bm25_top_k(
+        postings,
+        lengths,
+        sum(lengths) / len(lengths) if lengths else 0.0,
+        len(lengths),
+        k,
+        candidates,
+    )
+    return [ordered[position] for position, _ in ranked]
+
+
+def _boolean_titles(tree, keyword_to_titles, title_to_info):
+    # Evaluates a parse tree over title sets, for indexes without article ids.
+    # A bare NOT is taken against every article in title_to_info.
+    kind = tree[0]
+    if kind == "term":
+        return set(search(tree[1], keyword_to_titles))
+    if kind == "or":
+        return set().union(
+            *[
+                _boolean_titles(child, keyword_to_titles, title_to_info)
+                for child in tree[1]
+            ]
+        )
+    if kind == "not":
+        return set(title_to_info).difference(
+            _boolean_titles(tree[1], keyword_to_titles, title_to_info)
+        )
+    included = [child for child in tree[1] if child[0] != "not"]
+    excluded = [child[1] for child in tree[1] if child[0] == "not"]
+    if included:
+        titles = set.intersection(
+            *[
+                _boolean_titles(child, keyword_to_titles, title_to_info)
+                for child in included
+            ]
+        )
+    else:
+        titles = set(title_to_info)
+    for child in excluded:
+        titles.difference_update(
+            _boolean_titles(child, keyword_to_titles, title_to_info)
+        )
+    return titles
+
+
+class Query:
+    """
+    One keyword search with any number of chained filters, for example
+
+      Query("music").max_length(5000).author("Burna Boy").exclude("dance").titles()
+
+    With an ArticleIndex every filter is fused into one evaluation planned by
+    planner.QueryPlan: the most selective condition is fetched from its index
+    and the others are applied from most to least selective, each through
+    its index or a column scan, whichever is estimated cheaper. explain()
+    shows the plan. Other indexes apply the filters one at a time through
+    the functions above, and a dictionary or KeywordIndex evaluates boolean
+    queries over sets of titles.
+    """
+
+    def __init__(self, keyword, keyword_to_titles=None, title_to_info=None):
+        self.keyword = keyword
+        self.keyword_to_titles = _shared_keywords(keyword_to_titles)
+        self.title_to_info = _shared_info(title_to_info)
+        self.filters = []
+
+    def max_length(self, max_length):
+        return self.length(max_length=max_length)
+
+    def length(self, max_length=None, min_length=None):
+        self.filters.append(("length", (min_length, max_length)))
+        return self
+
+    def author(self, author):
+        self.filters.append(("author", author))
+        return self
+
+    def exclude(self, *keywords):
+        self.filters.append(("exclude", keywords))
+        return self
+
+    def year(self, year):
+        self.filters.append(("year", year))
+        return self
+
+    def plan(self):
+        """Returns the QueryPlan evaluating this query over an ArticleIndex"""
+        if not isinstance(self.keyword_to_titles, ArticleIndex):
+            raise TypeError("plan() needs an ArticleIndex")
+        return QueryPlan(self.keyword_to_titles, self.keyword, self.filters)
+
+    def explain(self):
+        """Returns the chosen evaluation order and access paths as text"""
+        return self.plan().explain()
+
+    def ids(self):
+        """Returns the ascending ids of the matching articles"""
+        return self.plan().execute()
+
+    def titles(self):
+        """Returns the titles of the matching articles"""
+        if isinstance(self.keyword_to_titles, ArticleIndex):
+            return self.keyword_to_titles.titles_for_ids(self.ids())
+        if is_boolean_query(self.keyword) and hasattr(
+            self.keyword_to_titles, "lookup_ids"
+        ):
+            articles = boolean_search(self.keyword, self.keyword_to_titles)
+        elif is_boolean_query(self.keyword):
+            # Dictionaries have no ids, matches come in title_to_info's order
+            matches = _boolean_titles(
+                parse_query(self.keyword), self.keyword_to_titles, self.title_to_info
+            )
+            articles = [title for title in self.title_to_info if title in matches]
+        else:
+            articles = search(self.keyword, self.keyword_to_titles)
+        for kind, value in self.filters:
+            if kind == "length":
+                articles = article_length(
+                    value[1], articles, self.title_to_info, value[0]
+                )
+            elif kind == "author":
+                articles = filter_to_author(value, articles, self.title_to_info)
+            elif kind == "exclude":
+                articles = filter_out(list(value), articles, self.keyword_to_titles)
+            else:
+                articles = articles_from_year(value, articles, self.title_to_info)
+        return articles
+
+    def ranked(self, k=10):
+        """Returns the k matching articles most relevant to the keyword, best first"""
+        if is_boolean_query(self.keyword):
+            keywords = positive_terms(parse_query(self.keyword))
+        else:
+            keywords = [self.keyword]
+        keywords = _expand_keywords(keywords, self.keyword_to_titles)
+        if isinstance(self.keyword_to_titles, ArticleIndex):
+            index = self.keyword_to_titles
+            ranked = rank_ids(index, keywords, k, self.ids())
+            return index.titles_for_ids([title_id for title_id, _ in ranked])
+        if isinstance(self.keyword_to_titles, MappedIndex):
+            return _rank_mapped(keywords, k, self.keyword_to_titles, self.titles())
+        return _rank_titles(
+            keywords, k, self.keyword_to_titles, self.title_to_info, self.titles()
+        )
+
+    def by_author(self):
+        """Returns the matching articles as a dictionary keyed by author"""
+        if isinstance(self.keyword_to_titles, ArticleIndex):
+            return self.keyword_to_titles.key_by_author(self.ids())
+        return key_by_author(self.titles(), self.title_to_info)
+
+
 # Prints out articles based on searched keyword and advanced options
 def display_result():
-    # Preprocess all metadata to dictionaries
-    keyword_to_titles_dict = keyword_to_titles(article_metadata())
-    title_to_info_dict = title_to_info(article_metadata())
-
-    # Stores list of articles returned from searching user's keyword
-    articles = search(ask_search(), keyword_to_titles_dict)
-
-    # advanced stores user's chosen advanced option (1-7)
-    # value stores user's response in being asked the advanced option
-    advanced, value = ask_advanced_search()
-
-    if advanced == 1:
-        # value stores max length of articles
-        # Update articles to contain only ones not exceeding the maximum length
-        articles = article_length(value, articles, title_to_info_dict)
-    if advanced == 2:
-        # Update articles to be a dictionary keyed by author
-        articles = key_by_author(articles, title_to_info_dict)
-    elif advanced == 3:
-        # value stores author name
-        # Update article metadata to only contain titles and timestamps
-        articles = filter_to_author(value, articles, title_to_info_dict)
-    elif advanced == 4:
-        # value stores a second keyword
-        # Filter articles to exclude those containing the new keyword.
-        articles = filter_out(value, articles, keyword_to_titles_dict)
-    elif advanced == 5:
-        # value stores year as an int
-        # Update article metadata to contain only articles from that year
-        articles = articles_from_year(value, articles, title_to_info_dict)
+    # Shared dictionaries, only built from the metadata on the first query
+    keyword_to_titles_dict, title_to_info_dict = load_indexes()
+
+    keyword = ask_search()
+
+    # Each search is [advanced, value]: advanced is the user's chosen advanced
+    # option (1-7) and value their response to that option's question
+    searches = ask_advanced_searches()
+
+    start = time.perf_counter()
+
+    # Chains every chosen filter onto the keyword search, the keyword may also
+    # be a boolean query such as "music AND NOT dance"
+    query = Query(keyword, keyword_to_titles_dict, title_to_info_dict)
+    keyed_by_author = False
+    top = None
+    for advanced, value in searches:
+        if advanced == 1:
+            # value stores max length of articles
+            query.max_length(value)
+        elif advanced == 2:
+            # Articles are returned as a dictionary keyed by author
+            keyed_by_author = True
+        elif advanced == 3:
+            # value stores author name
+            query.author(value)
+        elif advanced == 4:
+            # value stores a keyword to exclude
+            query.exclude(value)
+        elif advanced == 5:
+            # value stores year as an int
+            query.year(value)
+        elif advanced == 7:
+            # value stores how many of the most relevant articles to show
+            top = value
+
+    try:
+        if top is not None:
+            articles = query.ranked(top)
+            if keyed_by_author:
+                articles = key_by_author(articles, title_to_info_dict)
+        elif keyed_by_author:
+            articles = query.by_author()
+        else:
+            articles = query.titles()
+    except ValueError:
+        # A malformed boolean query matches nothing
+        articles = []
+
+    _record_query(start)
 
     print()
 
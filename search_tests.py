@@ -8,6 +8,15 @@ from search import (
     filter_to_author,
     filter_out,
     articles_from_year,
+    Query,
+    load_indexes,
+    invalidate_indexes,
+    index_timings,
+    ranked_search,
+    wildcard_search,
+    fuzzy_search,
+    fuzzy_keywords,
+    title_search,
 )
 from search_tests_helper import (
     get_print,
@@ -16,6 +25,45 @@ from search_tests_helper import (
     print_advanced_option,
 )
 from wiki import article_metadata
+from index import KeywordIndex, ArticleIndex
+from snapshot import (
+    dumps,
+    loads,
+    loads_index,
+    load_snapshot,
+    load_snapshot_index,
+)
+from mapped_index import MappedIndex, write_mapped_index
+from postings import (
+    encode_postings,
+    decode_postings,
+    intersect,
+    gallop,
+    intersect_all,
+    union_all,
+    difference,
+)
+from table import ArticleTable
+from query import parse_query, boolean_search, is_boolean_query
+from planner import QueryPlan
+from ranking import BlockMaxScorer, bm25_top_k, idf, rank_ids, top_k
+from vocabulary import Vocabulary
+from fuzzy import BKTree, DeleteIndex, deletes, edit_distance
+from title_index import TitleIndex
+from normalize import normalize
+from segments import SegmentedIndex
+from wal import DurableIndex, WriteAheadLog, encode_record, read_log
+from loader import load_index, read_chunks, read_metadata, write_metadata
+from dump import extract_keywords, parse_timestamp, read_dump, strip_markup
+import bz2
+import dump
+import gzip
+import table
+import os
+import random
+import re
+import tempfile
+import threading
 from unittest.mock import patch
 from unittest import TestCase, main
 
@@ -418,6 +466,1419 @@ class TestSearch(unittest.TestCase):
             article_from_year_2009_music,
         )
 
+    def test_keyword_index_unit_test(self):
+        index = KeywordIndex(keyword_to_titles(article_metadata()))
+        self.assertEqual(index.lookup("missing keyword"), [])
+        self.assertEqual(index.lookup(""), [])
+        self.assertNotIn("Dance", index)
+        self.assertEqual(
+            index.lookup("dance"),
+            search("dance", keyword_to_titles(article_metadata())),
+        )
+        self.assertEqual(search("dance", index), index.lookup("dance"))
+        self.assertEqual(search("Dance", index), [])
+        self.assertEqual(len(index), len(keyword_to_titles(article_metadata())))
+        self.assertEqual(
+            filter_out("pop", search("dance", index), index),
+            ["Old-time music", "1936 in music", "Indian classical music"],
+        )
+
+    def test_shared_indexes_unit_test(self):
+        invalidate_indexes()
+        builds = index_timings()["builds"]
+        keyword_index, info = load_indexes()
+        self.assertIs(load_indexes()[0], keyword_index)
+        self.assertEqual(index_timings()["builds"], builds + 1)
+        self.assertEqual(info.info(), title_to_info(article_metadata()))
+        self.assertEqual(search("dance"), search("dance", keyword_index))
+        self.assertEqual(
+            article_length(5000, search("music")),
+            [
+                "Kevin Cadogan",
+                "Tim Arnold (musician)",
+                "List of gospel musicians",
+                "Texture (music)",
+            ],
+        )
+        invalidate_indexes()
+        self.assertIsNot(load_indexes()[0], keyword_index)
+        self.assertEqual(index_timings()["builds"], builds + 2)
+
+    def test_snapshot_unit_test(self):
+        keywords = keyword_to_titles(article_metadata())
+        info = title_to_info(article_metadata())
+        self.assertEqual(loads(dumps(keywords, info)), (keywords, info))
+        self.assertEqual(loads(dumps({}, {})), ({}, {}))
+
+        data = bytearray(dumps(keywords, info))
+        data[-1] ^= 0xFF
+        with self.assertRaises(ValueError):
+            loads(bytes(data))
+        with self.assertRaises(ValueError):
+            loads(b"not a snapshot at all")
+        with self.assertRaises(ValueError):
+            loads(dumps(keywords, info)[:-1])
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "indexes.snapshot")
+            invalidate_indexes()
+            load_indexes(path)
+            self.assertEqual(load_snapshot(path), (keywords, info))
+            invalidate_indexes()
+            loads_before = index_timings()["snapshot_loads"]
+            self.assertEqual(load_indexes(path)[1].info(), info)
+            self.assertEqual(index_timings()["snapshot_loads"], loads_before + 1)
+            invalidate_indexes()
+
+            # Snapshots record normalization, asking otherwise rebuilds
+            self.assertFalse(load_snapshot_index(path).normalized)
+            music = search("music", keywords)
+            self.assertEqual(
+                search("MUSIC", load_indexes(path, normalized=True)[0]), music
+            )
+            self.assertTrue(load_snapshot_index(path).normalized)
+            invalidate_indexes()
+            self.assertEqual(search("MUSIC", load_indexes(path)[0]), [])
+            self.assertFalse(load_snapshot_index(path).normalized)
+            invalidate_indexes()
+
+        # The id layout loads straight into an ArticleIndex, edits included
+        index = ArticleIndex.from_metadata(article_metadata())
+        for removed in ([], ["Kevin Cadogan", "Rock music"]):
+            for title in removed:
+                index.remove_article(title)
+            for compress in (False, True):
+                loaded = loads_index(dumps(index), compress)
+                self.assertEqual(dict(loaded.items()), dict(index.items()))
+                self.assertEqual(dict(loaded.info()), dict(index.info()))
+                self.assertEqual(
+                    loaded.titles_for_ids(loaded.table.length_range(3000, 9000)),
+                    index.titles_for_ids(index.table.length_range(3000, 9000)),
+                )
+                edited = ArticleIndex.from_indexes(dict(index.items()), index.info())
+                for edit in (edited, loaded):
+                    edit.update_article("French pop music", "Ann", 0, 10, ["zz"])
+                    edit.add_article("Rock", "Ann", 0, 10, ["zz", "music"])
+                    edit.remove_article("Edogawa, Tokyo")
+                self.assertEqual(dict(loaded.items()), dict(edited.items()))
+                self.assertEqual(dict(loaded.info()), dict(edited.info()))
+                self.assertEqual(loaded["zz"], ["French pop music", "Rock"])
+
+        # Postings out of title order, or repeated, are sorted on load
+        loaded = loads_index(dumps({"b": ["B", "A", "B"]}, {"A": info["Rock music"]}))
+        self.assertEqual(loaded["b"], ["A", "B"])
+        self.assertEqual(
+            loaded.info()["B"], {"author": "", "timestamp": 0, "length": 0}
+        )
+
+    def test_mapped_index_unit_test(self):
+        keywords = keyword_to_titles(article_metadata())
+        info = title_to_info(article_metadata())
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "indexes.mapped")
+            write_mapped_index(path, keywords, info)
+            with MappedIndex(path) as index:
+                self.assertEqual(search("dance", index), search("dance", keywords))
+                self.assertEqual(search("Dance", index), [])
+                self.assertEqual(search("", index), [])
+                self.assertEqual(sorted(index), sorted(keywords))
+                self.assertEqual(dict(index.info()), info)
+                self.assertIsNone(index.title_id("Not an article"))
+                self.assertEqual(
+                    article_length(5000, search("music", index), index.info()),
+                    article_length(5000, search("music", keywords), info),
+                )
+                self.assertEqual(
+                    key_by_author(search("canada", index), index.info()),
+                    key_by_author(search("canada", keywords), info),
+                )
+
+            invalidate_indexes()
+            mapped_path = os.path.join(directory, "shared.mapped")
+            self.assertIsInstance(load_indexes(mapped_path=mapped_path)[0], MappedIndex)
+            self.assertTrue(os.path.exists(mapped_path))
+            self.assertEqual(search("dance"), search("dance", keywords))
+            invalidate_indexes()
+
+            with open(path, "r+b") as damaged:
+                damaged.write(b"XXXX")
+            with self.assertRaises(ValueError):
+                MappedIndex(path)
+            # Damaged or differently normalized files are rewritten, not used
+            for mapped_path, normalized in [(path, False), (mapped_path, True)]:
+                invalidate_indexes()
+                try:
+                    index = load_indexes(
+                        mapped_path=mapped_path, normalized=normalized
+                    )[0]
+                    self.assertEqual(index.normalized, normalized)
+                    self.assertEqual(
+                        search("Dance"), search("dance", keywords) if normalized else []
+                    )
+                finally:
+                    invalidate_indexes()
+                with MappedIndex(mapped_path) as index:
+                    self.assertEqual(index.normalized, normalized)
+
+    def test_article_index_unit_test(self):
+        keywords = keyword_to_titles(article_metadata())
+        info = title_to_info(article_metadata())
+        index = ArticleIndex.from_metadata(article_metadata())
+        self.assertEqual(index.info(), info)
+        self.assertEqual(dict(index.items()), keywords)
+        self.assertEqual(ArticleIndex.from_indexes(keywords, info).info(), index.info())
+        self.assertEqual(list(index.lookup_ids("")), [])
+        self.assertEqual(
+            list(index.lookup_ids("music")), sorted(index.lookup_ids("music"))
+        )
+        for keyword in ["", "music", "dance", "canada", "pop", "soccer"]:
+            titles = search(keyword, keywords)
+            self.assertEqual(search(keyword, index), titles)
+            self.assertEqual(
+                article_length(5000, titles, index), article_length(5000, titles, info)
+            )
+            self.assertEqual(key_by_author(titles, index), key_by_author(titles, info))
+            self.assertEqual(
+                filter_to_author("Burna Boy", titles, index),
+                filter_to_author("Burna Boy", titles, info),
+            )
+            self.assertEqual(
+                filter_out("dance", titles, index),
+                filter_out("dance", titles, keywords),
+            )
+            self.assertEqual(
+                articles_from_year(2009, titles, index),
+                articles_from_year(2009, titles, info),
+            )
+        self.assertEqual(articles_from_year("", search("music", index), index), [])
+
+    def test_compressed_postings_unit_test(self):
+        self.assertEqual(encode_postings([]), b"")
+        self.assertEqual(list(decode_postings(b"")), [])
+        self.assertEqual(encode_postings([1, 2, 130]), bytes([1, 1, 0x80, 0x01]))
+        for ids in [[0], [5, 6, 7, 8], [0, 127, 128, 16511, 2**32 - 1]]:
+            self.assertEqual(list(decode_postings(encode_postings(ids))), ids)
+        with self.assertRaises(ValueError):
+            encode_postings([3, 2])
+
+        index = ArticleIndex.from_metadata(article_metadata())
+        compressed = ArticleIndex.from_metadata(article_metadata(), compress=True)
+        self.assertEqual(dict(compressed.items()), dict(index.items()))
+        for keyword in ["", "music", "dance", "the"]:
+            self.assertEqual(compressed.lookup_ids(keyword), index.lookup_ids(keyword))
+            self.assertEqual(
+                filter_out("pop", search(keyword, compressed), compressed),
+                filter_out("pop", search(keyword, index), index),
+            )
+
+    def test_article_table_unit_test(self):
+        info = title_to_info(article_metadata())
+        articles = ArticleTable.from_metadata(article_metadata())
+        self.assertEqual(articles.info(), info)
+        self.assertEqual(len(articles), len(info))
+        self.assertEqual(
+            len(articles.author_names), len(set(a[1] for a in article_metadata()))
+        )
+        for numpy in [table.numpy, None]:
+            with patch.object(table, "numpy", numpy):
+                for keyword in ["", "music", "dance", "canada", "pop"]:
+                    titles = search(keyword, keyword_to_titles(article_metadata()))
+                    self.assertEqual(
+                        article_length(5000, titles, articles),
+                        article_length(5000, titles, info),
+                    )
+                    self.assertEqual(
+                        filter_to_author("Burna Boy", titles, articles),
+                        filter_to_author("Burna Boy", titles, info),
+                    )
+                    self.assertEqual(
+                        articles_from_year(2009, titles, articles),
+                        articles_from_year(2009, titles, info),
+                    )
+                    self.assertEqual(
+                        key_by_author(titles, articles), key_by_author(titles, info)
+                    )
+                self.assertEqual(filter_to_author("Erioluwa", titles, articles), [])
+                self.assertEqual(articles_from_year("", titles, articles), [])
+
+    def test_year_index_unit_test(self):
+        self.assertEqual(list(intersect([], [1, 2])), [])
+        self.assertEqual(list(intersect([1, 3, 5, 7], [3, 4, 5, 6])), [3, 5])
+        self.assertEqual(list(intersect([7], list(range(100)))), [7])
+        self.assertEqual(list(intersect(list(range(0, 100, 3)), [99, 100])), [99])
+
+        articles = ArticleTable.from_metadata(article_metadata())
+        title_id = articles.title_ids["List of Canadian musicians"]
+        self.assertEqual(
+            (
+                articles.years[title_id],
+                articles.months[title_id],
+                articles.days[title_id],
+            ),
+            (2007, 6, 12),
+        )
+        self.assertEqual(
+            sum(len(ids) for ids in articles.year_ids.values()), len(articles)
+        )
+        for year, ids in articles.year_ids.items():
+            self.assertEqual(list(ids), sorted(ids))
+            self.assertTrue(all(articles.years[i] == year for i in ids))
+
+        articles.append("List of Canadian musicians", "Jack Johnson", 1260577388, 1)
+        self.assertEqual(articles.years[title_id], 2009)
+        self.assertNotIn(title_id, articles.year_ids[2007])
+        self.assertIn(title_id, articles.year_ids[2009])
+        music = articles.ids_for_titles(
+            search("music", keyword_to_titles(article_metadata()))
+        )
+        self.assertEqual(
+            list(articles.filter_year(music, 2009)),
+            [i for i in music if articles.years[i] == 2009],
+        )
+        self.assertEqual(list(articles.filter_year(music, 1800)), [])
+
+    def test_length_index_unit_test(self):
+        info = title_to_info(article_metadata())
+        articles = ArticleTable.from_metadata(article_metadata())
+        self.assertEqual(
+            list(articles.sorted_lengths), sorted(i["length"] for i in info.values())
+        )
+        self.assertEqual(
+            [articles.lengths[i] for i in articles.length_ids],
+            list(articles.sorted_lengths),
+        )
+        everything = list(range(len(articles)))
+        for low, high in [(None, 5000), (5000, None), (3000, 9000), (9000, 3000)]:
+            expected = [
+                i
+                for i in everything
+                if (low is None or articles.lengths[i] >= low)
+                and (high is None or articles.lengths[i] <= high)
+            ]
+            self.assertEqual(list(articles.length_range(low, high)), expected)
+            self.assertEqual(
+                list(articles.filter_length(everything, high, low)), expected
+            )
+            self.assertEqual(
+                list(articles.filter_length(everything[::7], high, low)),
+                [i for i in expected if i % 7 == 0],
+            )
+
+        music = search("music", keyword_to_titles(article_metadata()))
+        self.assertEqual(
+            article_length(9000, music, articles, min_length=3000),
+            article_length(9000, music, info, min_length=3000),
+        )
+        self.assertEqual(
+            article_length(None, music, info, min_length=20000),
+            [t for t in info if t in music and info[t]["length"] >= 20000],
+        )
+
+        title_id = articles.title_ids["Kevin Cadogan"]
+        articles.append("Kevin Cadogan", "Burna Boy", 1181623340, 99999999)
+        self.assertEqual(articles.length_ids[-1], title_id)
+        self.assertEqual(list(articles.length_range(99999999)), [title_id])
+        for numpy in [table.numpy, None]:
+            with patch.object(table, "numpy", numpy):
+                self.assertEqual(
+                    list(articles.filter_length(everything, None, 99999999)), [title_id]
+                )
+        self.assertEqual(len(articles.length_ids), len(articles))
+
+        # Edits before the first length query land in the one sort
+        articles = ArticleTable.from_metadata(article_metadata())
+        articles.append("Kevin Cadogan", "Burna Boy", 1181623340, 99999999)
+        articles.remove(articles.title_ids["Rock music"])
+        self.assertEqual(
+            list(articles.length_ids),
+            sorted(articles.all_ids(), key=lambda i: (articles.lengths[i], i)),
+        )
+        self.assertEqual(list(articles.length_range(99999999)), [title_id])
+
+    def test_author_index_unit_test(self):
+        info = title_to_info(article_metadata())
+        articles = ArticleTable.from_metadata(article_metadata())
+        for author in set(i["author"] for i in info.values()):
+            self.assertEqual(
+                articles.titles_for_ids(articles.ids_by_author(author)),
+                [t for t in info if info[t]["author"] == author],
+            )
+        self.assertEqual(list(articles.ids_by_author("Erioluwa")), [])
+
+        music = search("music", keyword_to_titles(article_metadata()))
+        ids = articles.ids_for_titles(music)
+        for numpy in [table.numpy, None]:
+            with patch.object(table, "numpy", numpy):
+                self.assertEqual(
+                    articles.titles_for_ids(articles.filter_author(ids, "Burna Boy")),
+                    filter_to_author("Burna Boy", music, info),
+                )
+
+        title_id = articles.title_ids["French pop music"]
+        articles.append("French pop music", "Erioluwa", 1172208041, 5569)
+        self.assertEqual(list(articles.ids_by_author("Erioluwa")), [title_id])
+        self.assertNotIn(title_id, articles.ids_by_author("Mack Johnson"))
+        self.assertEqual(
+            key_by_author(music, articles)["Erioluwa"], ["French pop music"]
+        )
+
+    def test_filter_out_many_unit_test(self):
+        keywords = keyword_to_titles(article_metadata())
+        index = ArticleIndex.from_metadata(article_metadata())
+        music = search("music", keywords)
+        expected = [
+            title
+            for title in music
+            if title not in keywords["dance"] and title not in keywords["pop"]
+        ]
+        self.assertEqual(filter_out(["dance", "pop"], music, keywords), expected)
+        self.assertEqual(filter_out(["dance", "pop"], music, index), expected)
+        self.assertEqual(
+            filter_out(["dance", "pop"], music, keywords),
+            filter_out("pop", filter_out("dance", music, keywords), keywords),
+        )
+        self.assertEqual(filter_out([], music, keywords), music)
+        self.assertEqual(filter_out(["Dance", ""], music, index), music)
+        shuffled = music[::-1]
+        self.assertEqual(
+            filter_out("dance", shuffled, keywords),
+            filter_out("dance", music, keywords)[::-1],
+        )
+        self.assertEqual(
+            index.titles_for_ids(
+                index.exclude(index.lookup_ids("music"), ["dance", "pop"])
+            ),
+            expected,
+        )
+
+    def test_boolean_query_unit_test(self):
+        self.assertEqual(
+            parse_query("music AND jazz"),
+            ("and", [("term", "music"), ("term", "jazz")]),
+        )
+        self.assertEqual(
+            parse_query("pop OR rock music"),
+            ("or", [("term", "pop"), ("and", [("term", "rock"), ("term", "music")])]),
+        )
+        self.assertEqual(
+            parse_query("music NOT (dance OR pop)"),
+            (
+                "and",
+                [
+                    ("term", "music"),
+                    ("not", ("or", [("term", "dance"), ("term", "pop")])),
+                ],
+            ),
+        )
+        self.assertEqual(parse_query("and"), ("term", "and"))
+        for malformed in ["", "music AND", "OR pop", "(music", "music )"]:
+            with self.assertRaises(ValueError):
+                parse_query(malformed)
+        self.assertTrue(is_boolean_query("music NOT dance"))
+        self.assertFalse(is_boolean_query("music"))
+
+        keywords = keyword_to_titles(article_metadata())
+        index = ArticleIndex.from_metadata(article_metadata())
+        info = title_to_info(article_metadata())
+
+        def expected(matches):
+            return [title for title in info if matches(title)]
+
+        self.assertEqual(
+            boolean_search("music AND dance", index),
+            expected(lambda t: t in keywords["music"] and t in keywords["dance"]),
+        )
+        self.assertEqual(
+            boolean_search("pop OR rock", index),
+            expected(lambda t: t in keywords["pop"] or t in keywords["rock"]),
+        )
+        self.assertEqual(
+            boolean_search("music NOT dance", index),
+            filter_out("dance", search("music", keywords), keywords),
+        )
+        self.assertEqual(
+            boolean_search("NOT the", index),
+            expected(lambda t: t not in keywords["the"]),
+        )
+        self.assertEqual(boolean_search("music AND nosuchkeyword", index), [])
+        self.assertEqual(
+            boolean_search("nosuchkeyword OR dance", index), search("dance", keywords)
+        )
+        # Dictionaries have no ids, queries over them match over title sets
+        for text in [
+            "music AND dance",
+            "pop OR rock",
+            "music NOT (dance OR pop)",
+            "NOT the",
+            "canad* OR nosuchkeyword",
+        ]:
+            for dictionary in (keywords, KeywordIndex(keywords)):
+                self.assertEqual(
+                    Query(text, dictionary, info).titles(), boolean_search(text, index)
+                )
+
+        ids = list(range(0, 1000, 3))
+        self.assertEqual(gallop(ids, 0), 0)
+        self.assertEqual(gallop(ids, 301), 101)
+        self.assertEqual(gallop(ids, 300, 50), 100)
+        self.assertEqual(gallop(ids, 5000), len(ids))
+        self.assertEqual(list(intersect_all([ids, [3, 4, 999], range(1000)])), [3, 999])
+        self.assertEqual(list(union_all([[1, 5], [], [2, 5]])), [1, 2, 5])
+        self.assertEqual(list(difference([1, 2, 3, 4], [2, 4, 6])), [1, 3])
+        self.assertEqual(list(difference(ids, [3]))[:2], [0, 6])
+
+    def test_query_pipeline_unit_test(self):
+        keywords = keyword_to_titles(article_metadata())
+        info = title_to_info(article_metadata())
+        index = ArticleIndex.from_metadata(article_metadata())
+        for keyword in ["", "music", "dance", "canada", "music NOT dance"]:
+            for sources in [(keywords, info), (index, index)]:
+                if sources[0] is keywords and keyword == "music NOT dance":
+                    continue
+                if is_boolean_query(keyword):
+                    titles = boolean_search(keyword, index)
+                else:
+                    titles = search(keyword, keywords)
+                chained = filter_out(
+                    "pop",
+                    articles_from_year(
+                        2009, filter_to_author("RussBot", titles, info), info
+                    ),
+                    keywords,
+                )
+                chained = article_length(20000, chained, info, min_length=1000)
+                query = (
+                    Query(keyword, *sources)
+                    .author("RussBot")
+                    .year(2009)
+                    .exclude("pop")
+                    .length(20000, 1000)
+                )
+                self.assertEqual(query.titles(), chained)
+                self.assertEqual(query.by_author(), key_by_author(chained, info))
+
+        self.assertEqual(
+            Query("music", index).max_length(5000).titles(),
+            article_length(5000, search("music", keywords), info),
+        )
+        self.assertEqual(
+            Query("music", index).exclude("dance", "pop").titles(),
+            filter_out(["dance", "pop"], search("music", keywords), keywords),
+        )
+        self.assertEqual(Query("music", index).year("").titles(), [])
+        self.assertEqual(
+            Query("music", index).author("Burna Boy").author("RussBot").titles(), []
+        )
+        self.assertEqual(Query("music", index).titles(), search("music", keywords))
+        with self.assertRaises(ValueError):
+            Query("music AND", index).titles()
+
+        # Results are the caller's to change, never the index's own arrays
+        ids = Query("music", index).ids()
+        self.assertIsNot(ids, index.postings["music"])
+        ids.append(len(index.table.titles))
+        self.assertEqual(Query("music", index).titles(), search("music", keywords))
+        author_ids = index.table.ids_by_author("RussBot")
+        author_ids.append(len(index.table.titles))
+        self.assertNotIn(len(index.table.titles), index.table.ids_by_author("RussBot"))
+        self.assertEqual(index.table.author_count("RussBot"), len(author_ids) - 1)
+
+    def test_query_planner_unit_test(self):
+        keywords = keyword_to_titles(article_metadata())
+        info = title_to_info(article_metadata())
+        index = ArticleIndex.from_metadata(article_metadata())
+        for keyword in ["music", "dance", "missing", "music OR pop"]:
+            for author in ["RussBot", "Burna Boy", "Nobody"]:
+                query = (
+                    Query(keyword, index)
+                    .author(author)
+                    .length(30000, 100)
+                    .exclude("pop")
+                    .year(2009)
+                )
+                if is_boolean_query(keyword):
+                    titles = boolean_search(keyword, index)
+                else:
+                    titles = search(keyword, keywords)
+                chained = filter_to_author(author, titles, info)
+                chained = article_length(30000, chained, info, min_length=100)
+                chained = filter_out("pop", chained, keywords)
+                chained = articles_from_year(2009, chained, info)
+                self.assertEqual(index.titles_for_ids(query.ids()), chained)
+
+        # The rare author drives the plan, the common keyword only filters it
+        plan = QueryPlan(index, "music", [("author", "Burna Boy")])
+        self.assertEqual(plan.steps[0].action, "fetch")
+        self.assertIn("author = 'Burna Boy'", plan.steps[0].predicate.description)
+        self.assertEqual(plan.steps[1].predicate.description, "keyword 'music'")
+        self.assertEqual(
+            list(plan.execute()),
+            list(index.filter_author(index.lookup_ids("music"), "Burna Boy")),
+        )
+        # Exclusions keep most articles, so they come after the other filters
+        plan = QueryPlan(
+            index, "music", [("exclude", ("pop",)), ("length", (None, 5000))]
+        )
+        self.assertEqual([step.action for step in plan.steps][-1], "exclude")
+        explained = Query("music", index).author("Burna Boy").year(2009).explain()
+        self.assertIn("fetch", explained)
+        self.assertIn("year = 2009", explained)
+        self.assertEqual(len(explained.splitlines()), 4)
+        with self.assertRaises(TypeError):
+            Query("music", keywords, info).explain()
+
+    def test_ranked_search_unit_test(self):
+        keywords = keyword_to_titles(article_metadata())
+        info = title_to_info(article_metadata())
+        index = ArticleIndex.from_metadata(article_metadata())
+        for query in ["music", "music dance", ["canada", "music"], "missing", ""]:
+            for k in [0, 1, 5, 200]:
+                ranked = ranked_search(query, k, index, index)
+                self.assertEqual(ranked, ranked_search(query, k, keywords, info))
+                self.assertEqual(len(ranked), len(set(ranked)))
+                self.assertLessEqual(len(ranked), k)
+
+        # A mapped index ranks by id, without decoding every title
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "indexes.mapped")
+            write_mapped_index(path, keywords, info)
+            with MappedIndex(path) as mapped:
+                for query in ["music", "music dance", "canad* pop", "missing"]:
+                    with patch.object(mapped, "title", wraps=mapped.title) as title:
+                        ranked = ranked_search(query, 5, mapped, mapped.info())
+                    self.assertEqual(ranked, ranked_search(query, 5, index, index))
+                    self.assertLessEqual(title.call_count, 5)
+                    self.assertEqual(
+                        Query(query, mapped, mapped.info()).year(2009).ranked(3),
+                        Query(query, index).year(2009).ranked(3),
+                    )
+
+        # Every article matching the query is ranked once k is large enough
+        self.assertEqual(
+            sorted(ranked_search("music dance", 200, index, index)),
+            sorted(set(search("music", keywords) + search("dance", keywords))),
+        )
+        # Matching both keywords beats matching one, shorter beats longer
+        small = ArticleIndex.from_metadata(
+            [
+                ["One", "Ann", 1172208041, 1000, ["music", "pop"]],
+                ["Both", "Ann", 1172208041, 1000, ["music", "dance"]],
+                ["Long both", "Ann", 1172208041, 9000, ["music", "dance"]],
+                ["Other", "Ann", 1172208041, 1000, ["jazz"]],
+            ]
+        )
+        self.assertEqual(
+            ranked_search("music dance", 3, small, small), ["Both", "Long both", "One"]
+        )
+        ranked = ranked_search("music", 200, index, index)
+        lengths = [info[title]["length"] for title in ranked]
+        self.assertEqual(lengths, sorted(lengths))
+        # Rarer keywords weigh more
+        self.assertGreater(idf(1, 100), idf(50, 100))
+
+        self.assertEqual(
+            top_k([(3, 1.0), (1, 2.0), (2, 1.0), (0, 0.5)], 3),
+            [
+                (1, 2.0),
+                (2, 1.0),
+                (3, 1.0),
+            ],
+        )
+        self.assertEqual(top_k([(3, 1.0)], 0), [])
+
+        query = Query("music", index).year(2009)
+        filtered = query.titles()
+        ranked = query.ranked(3)
+        self.assertEqual(ranked, Query("music", keywords, info).year(2009).ranked(3))
+        self.assertTrue(set(ranked) <= set(filtered))
+        # Boolean queries rank their matches by the keywords not under a NOT
+        query = Query("music NOT dance", index)
+        self.assertEqual(
+            query.ranked(100),
+            [
+                title
+                for title in ranked_search("music", 100, index, index)
+                if title in set(query.titles())
+            ],
+        )
+
+    def test_block_max_unit_test(self):
+        index = ArticleIndex.from_metadata(article_metadata())
+        articles = index.table
+        queries = [
+            ["music"],
+            ["music", "dance"],
+            ["the", "music", "canada", "pop"],
+            ["dance", "missing"],
+            ["missing"],
+            [],
+        ]
+        for block_size in [1, 2, 3, 64]:
+            scorer = BlockMaxScorer(index, block_size)
+            ids, last_ids, max_weights = scorer.blocks("music")
+            self.assertEqual(list(ids), list(index.lookup_ids("music")))
+            self.assertEqual(len(last_ids), -(-len(ids) // block_size))
+            self.assertEqual(last_ids[-1], ids[-1])
+            self.assertEqual(max(max_weights), max(scorer.weights[i] for i in ids))
+            for keywords in queries:
+                for k in [0, 1, 3, 10, 200]:
+                    self.assertEqual(
+                        scorer.top_k(keywords, k),
+                        bm25_top_k(
+                            [index.lookup_ids(keyword) for keyword in keywords],
+                            articles.lengths,
+                            articles.average_length(),
+                            len(articles),
+                            k,
+                        ),
+                    )
+
+        # The shared scorer is rebuilt once the index changes
+        scorer = index.block_max()
+        self.assertIs(index.block_max(), scorer)
+        index._add("Tiny music", "Ann", 1172208041, 1, ["music"])
+        self.assertIsNot(index.block_max(), scorer)
+        self.assertEqual(ranked_search("music", 1, index, index), ["Tiny music"])
+
+    def test_wildcard_search_unit_test(self):
+        vocabulary = Vocabulary(["song", "sing", "songs", "so", "sang", "canada", "s"])
+        self.assertEqual(vocabulary.complete("so"), ["so", "song", "songs"])
+        self.assertEqual(vocabulary.complete("so", limit=2), ["so", "song"])
+        self.assertEqual(vocabulary.complete("x"), [])
+        self.assertEqual(len(vocabulary.complete("")), 7)
+        self.assertEqual(vocabulary.expand("song*"), ["song", "songs"])
+        self.assertEqual(vocabulary.expand("s*ng"), ["sang", "sing", "song"])
+        self.assertEqual(vocabulary.expand("*ng*"), ["sang", "sing", "song", "songs"])
+        self.assertEqual(vocabulary.expand("s**"), vocabulary.complete("s"))
+        self.assertEqual(vocabulary.expand("s*ng", limit=1), ["sang"])
+        self.assertEqual(vocabulary.expand("song"), ["song"])
+        self.assertEqual(vocabulary.expand("son"), [])
+        self.assertEqual(vocabulary.expand("c.n*"), [])
+        self.assertIn("so", vocabulary)
+        self.assertNotIn("son", vocabulary)
+        vocabulary.add("son")
+        vocabulary.add("son")
+        vocabulary.remove("song")
+        vocabulary.remove("missing")
+        self.assertEqual(vocabulary.complete("so"), ["so", "son", "songs"])
+
+        keywords = keyword_to_titles(article_metadata())
+        info = title_to_info(article_metadata())
+        index = ArticleIndex.from_metadata(article_metadata())
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "index.map")
+            write_mapped_index(path, keywords, info)
+            with MappedIndex(path) as mapped:
+                for pattern in ["canad*", "mus*", "s*ng", "*ing", "zzz*", "music"]:
+                    expected = set()
+                    for keyword, titles in keywords.items():
+                        if re.fullmatch(pattern.replace("*", ".*"), keyword):
+                            expected.update(titles)
+                    titles = search(pattern, index)
+                    self.assertEqual(set(titles), expected)
+                    self.assertEqual(titles, search(pattern, mapped))
+                    self.assertEqual(sorted(titles), sorted(search(pattern, keywords)))
+                    self.assertEqual(
+                        titles, index.titles_for_ids(index.ids_for_titles(titles))
+                    )
+                self.assertEqual(
+                    mapped.vocabulary().expand("mus*"),
+                    index.vocabulary().expand("mus*"),
+                )
+        self.assertEqual(
+            wildcard_search("mus*", index, limit=1), search("music", keywords)
+        )
+        # Expansion is capped, however much of the vocabulary matches
+        self.assertGreater(len(keywords), 1000)
+        self.assertEqual(len(index.vocabulary().expand("*")), 1000)
+        self.assertEqual(
+            Query("canad* NOT music", index).titles(),
+            [
+                title
+                for title in search("canad*", index)
+                if title not in search("music", keywords)
+            ],
+        )
+        self.assertEqual(
+            Query("canad*", index).year(2009).titles(),
+            articles_from_year(2009, search("canad*", index), info),
+        )
+
+        # Excluded patterns drop every keyword they match
+        dance = set(wildcard_search("dan*", keywords))
+        expected = [t for t in search("music", keywords) if t not in dance]
+        self.assertLess(len(expected), len(search("music", keywords)))
+        for dictionary in (keywords, index):
+            self.assertEqual(
+                filter_out("dan*", search("music", keywords), dictionary), expected
+            )
+            self.assertEqual(
+                Query("music", dictionary, info).exclude("dan*").titles(), expected
+            )
+        self.assertIn("'dan*'", Query("music", index).exclude("dan*").explain())
+
+        # Keywords added later are found by the kept up to date vocabulary
+        index._add("New", "Ann", 1172208041, 10, ["canadiana"])
+        self.assertIn("canadiana", index.vocabulary().complete("canad"))
+
+    def test_fuzzy_search_unit_test(self):
+        self.assertEqual(edit_distance("", ""), 0)
+        self.assertEqual(edit_distance("music", ""), 5)
+        self.assertEqual(edit_distance("kitten", "sitting"), 3)
+        self.assertEqual(edit_distance("sitting", "kitten"), 3)
+        self.assertEqual(edit_distance("musci", "music"), 2)
+        self.assertEqual(edit_distance("canda", "canada"), 1)
+        self.assertEqual(edit_distance("kitten", "sitting", limit=1), 2)
+        self.assertEqual(edit_distance("a", "abcd", limit=2), 3)
+        self.assertEqual(deletes("abc", 1), {"abc", "bc", "ac", "ab"})
+        self.assertEqual(len(deletes("abc", 5)), 8)
+
+        keywords = keyword_to_titles(article_metadata())
+        info = title_to_info(article_metadata())
+        index = ArticleIndex.from_metadata(article_metadata())
+        tree = BKTree(keywords)
+        deleted = DeleteIndex(keywords)
+        self.assertEqual(len(tree), len(keywords))
+        self.assertEqual(len(deleted), len(keywords))
+        for query in ["canda", "musci", "music", "dnace", "x", "", "rockk", "zzzzzz"]:
+            for max_distance in [0, 1, 2]:
+                expected = sorted(
+                    (edit_distance(query, keyword), keyword)
+                    for keyword in keywords
+                    if edit_distance(query, keyword) <= max_distance
+                )
+                self.assertEqual(tree.lookup(query, max_distance), expected)
+                self.assertEqual(deleted.lookup(query, max_distance), expected)
+                self.assertEqual(
+                    fuzzy_keywords(query, keywords, max_distance), expected
+                )
+                self.assertEqual(fuzzy_keywords(query, index, max_distance), expected)
+        with self.assertRaises(ValueError):
+            deleted.lookup("music", 3)
+        # Removing keywords leaves the index as if they were never added
+        rebuilt = DeleteIndex(keyword for keyword in keywords if "a" not in keyword)
+        for keyword in keywords:
+            if "a" in keyword:
+                deleted.remove(keyword)
+        deleted.remove("missing")
+        self.assertEqual(deleted._variants, rebuilt._variants)
+        self.assertEqual(len(deleted), len(rebuilt))
+
+        self.assertEqual(fuzzy_search("canda", index), search("canada", keywords))
+        self.assertEqual(fuzzy_search("music", index), search("music", keywords))
+        self.assertEqual(fuzzy_search("zzzzzz", index), [])
+        self.assertEqual(
+            sorted(fuzzy_search("dnace", index)),
+            sorted(fuzzy_search("dnace", keywords)),
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "index.map")
+            write_mapped_index(path, keywords, info)
+            with MappedIndex(path) as mapped:
+                self.assertEqual(
+                    fuzzy_search("canda", mapped), search("canada", keywords)
+                )
+                self.assertEqual(
+                    fuzzy_keywords("musci", mapped), fuzzy_keywords("musci", index)
+                )
+
+        # Keywords added after the first lookup are found too
+        fuzzy_search("canda", index)
+        index._add("New", "Ann", 1172208041, 10, ["cando"])
+        self.assertIn((1, "cando"), fuzzy_keywords("canda", index))
+
+    def test_title_search_unit_test(self):
+        info = title_to_info(article_metadata())
+        index = ArticleIndex.from_metadata(article_metadata())
+        titles = list(info)
+        titles_index = TitleIndex(titles)
+        self.assertEqual(len(titles_index), len(titles))
+        queries = ["edo tok", "TOKYO", "in music", "ky", "x", "(musician)", "é", ""]
+        queries += [title[2:7] for title in titles[::7]]
+        for query in queries:
+            parts = query.casefold().split()
+            expected = [
+                title
+                for title in titles
+                if parts and all(part in title.casefold() for part in parts)
+            ]
+            self.assertEqual(title_search(query, index), expected)
+            self.assertEqual(title_search(query, info), expected)
+            self.assertEqual(
+                [titles[title_id] for title_id in titles_index.match(query)], expected
+            )
+        self.assertEqual(title_search("Edogawa, Tokyo", index), ["Edogawa, Tokyo"])
+        self.assertEqual(title_search("tokyo edogawa", index), ["Edogawa, Tokyo"])
+        self.assertEqual(title_search("kyoto", index), [])
+
+        self.assertEqual(
+            title_search("music in", index, whole_words=True),
+            [
+                title
+                for title in titles
+                if {"music", "in"} <= set(re.findall(r"\w+", title.casefold()))
+            ],
+        )
+        self.assertEqual(title_search("tok", index, whole_words=True), [])
+        self.assertEqual(
+            title_search("tokyo", info, whole_words=True), ["Edogawa, Tokyo"]
+        )
+        # Trigram candidates are a superset of the matches
+        self.assertTrue(
+            set(titles_index.match("music")) <= set(titles_index.candidates(["music"]))
+        )
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "index.map")
+            write_mapped_index(path, keyword_to_titles(article_metadata()), info)
+            with MappedIndex(path) as mapped:
+                self.assertEqual(
+                    title_search("in music", mapped.info()),
+                    title_search("in music", index),
+                )
+
+        # Titles added after the first search are found too
+        title_search("tokyo", index)
+        index._add("Tokyo Tower", "Ann", 1172208041, 10, [])
+        self.assertEqual(
+            title_search("tokyo", index), ["Edogawa, Tokyo", "Tokyo Tower"]
+        )
+
+    def test_normalized_search_unit_test(self):
+        self.assertEqual(normalize("ＭＵＳＩＣ"), "music")
+        self.assertEqual(normalize("Straße"), "strasse")
+        self.assertEqual(normalize("ﬁle"), "file")
+        metadata = [
+            ["A", "Jack Johnson", 1, 10, ["Music", "music", "ﬁle"]],
+            ["B", "jack johnson", 2, 20, ["music"]],
+            ["C", "Ann", 3, 30, ["ｍｕｓｉｃ", "Rock"]],
+        ]
+        # Matching stays exact unless normalization is asked for
+        plain = ArticleIndex.from_metadata(metadata)
+        self.assertEqual(search("Music", plain), ["A"])
+        self.assertEqual(filter_to_author("jack johnson", ["A", "B"], plain), ["B"])
+
+        index = ArticleIndex.from_metadata(metadata, normalized=True)
+        for keyword in ["music", "Music", "MUSIC", "ｍｕｓｉｃ"]:
+            self.assertEqual(search(keyword, index), ["A", "B", "C"])
+        self.assertEqual(search("file", index), ["A"])
+        self.assertEqual(index.document_frequency("Music"), 3)
+        self.assertEqual(sorted(index), ["file", "music", "rock"])
+        self.assertEqual(search("ROCK*", index), ["C"])
+        self.assertEqual(fuzzy_search("ROKC", index), ["C"])
+        self.assertEqual(
+            filter_to_author("JACK JOHNSON", ["A", "B", "C"], index), ["A", "B"]
+        )
+        # Authors keep the first spelling seen
+        self.assertEqual(
+            key_by_author(["A", "B", "C"], index),
+            {"Jack Johnson": ["A", "B"], "Ann": ["C"]},
+        )
+        self.assertEqual(Query("MuSiC", index).author("ann").titles(), ["C"])
+
+        keywords = keyword_to_titles(metadata, normalized=True)
+        self.assertEqual(
+            keywords, {"music": ["A", "B", "C"], "file": ["A"], "rock": ["C"]}
+        )
+        keywords = KeywordIndex(keyword_to_titles(metadata), normalized=True)
+        self.assertEqual(search("MUSIC", keywords), ["A", "B", "C"])
+        self.assertEqual(search("Mus*", keywords), ["A", "B", "C"])
+        # Merged variants go back in article order given title_to_info
+        variants = {"Music": ["B", "C"], "music": ["A", "B"]}
+        keywords = KeywordIndex(variants, normalized=True)
+        self.assertEqual(search("music", keywords), ["B", "C", "A"])
+        keywords = KeywordIndex(variants, True, title_to_info(metadata))
+        self.assertEqual(search("music", keywords), ["A", "B", "C"])
+        # Variants of one keyword weigh like it once, so the shorter A wins
+        variants = ["Rock", "ROCK", "rock", "file"]
+        self.assertEqual(
+            rank_ids(index, variants, 2), rank_ids(index, ["rock", "file"], 2)
+        )
+        self.assertEqual(ranked_search(variants, 2, index), ["A", "C"])
+        keywords = KeywordIndex(keyword_to_titles(metadata), normalized=True)
+        self.assertEqual(
+            ranked_search(variants, 2, keywords, title_to_info(metadata)), ["A", "C"]
+        )
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "index.map")
+            info = title_to_info(metadata)
+            write_mapped_index(path, keyword_to_titles(metadata), info, normalized=True)
+            with MappedIndex(path) as mapped:
+                self.assertTrue(mapped.normalized)
+                self.assertEqual(search("ＭＵＳＩＣ", mapped), ["A", "B", "C"])
+                self.assertEqual(search("mu*", mapped), ["A", "B", "C"])
+                self.assertEqual(ranked_search(variants, 2, mapped), ["A", "C"])
+            write_mapped_index(path, keyword_to_titles(metadata), info)
+            with MappedIndex(path) as mapped:
+                self.assertFalse(mapped.normalized)
+                self.assertEqual(search("music", mapped), ["A", "B"])
+
+    def test_incremental_index_unit_test(self):
+        rng = random.Random(7)
+        # One article per title, a repeated title would merge in a rebuild
+        unique = list(
+            {article[0]: list(article) for article in article_metadata()}.values()
+        )
+        metadata = unique[:70]
+        vocabulary = sorted({word for article in metadata for word in article[4]})
+        for compress in (False, True):
+            index = ArticleIndex.from_metadata(metadata, compress=compress)
+            # Built structures have to follow the edits too, not be rebuilt
+            sorted_keywords = index.vocabulary()
+            fuzzy = index.fuzzy_index()
+            index.title_index()
+            index.block_max()
+            current = [list(article) for article in metadata]
+            spare = [list(article) for article in unique[70:]]
+            for step in range(300):
+                action = rng.random()
+                if action < 0.3 and spare:
+                    article = spare.pop()
+                    index.add_article(*article)
+                    current.append(article)
+                elif action < 0.6:
+                    position = rng.randrange(len(current))
+                    article = current[position]
+                    article = [
+                        article[0],
+                        rng.choice(["Jack Johnson", article[1]]),
+                        article[2] + rng.choice([0, 10**8]),
+                        rng.randint(100, 50000),
+                        article[4][: rng.randint(0, len(article[4]))]
+                        + rng.sample(vocabulary, 3),
+                    ]
+                    index.update_article(*article)
+                    current[position] = article
+                else:
+                    article = current.pop(rng.randrange(len(current)))
+                    index.remove_article(article[0])
+                    # Removed titles can come back later, under a new id
+                    spare.insert(0, article)
+
+            rebuilt = ArticleIndex.from_metadata(current)
+            self.assertIs(index.vocabulary(), sorted_keywords)
+            self.assertIs(index.fuzzy_index(), fuzzy)
+            self.assertEqual(sorted_keywords.keywords, rebuilt.vocabulary().keywords)
+            self.assertEqual(dict(index.items()), dict(rebuilt.items()))
+            self.assertEqual(dict(index.info()), dict(rebuilt.info()))
+            self.assertEqual(len(index.table), len(current))
+            titles = [article[0] for article in current]
+            for keyword in ["music", "the", "canada", "mus*", "dancr"]:
+                self.assertEqual(search(keyword, index), search(keyword, rebuilt))
+                self.assertEqual(
+                    fuzzy_search(keyword, index), fuzzy_search(keyword, rebuilt)
+                )
+                self.assertEqual(
+                    ranked_search(keyword + " song", 10, index, index),
+                    ranked_search(keyword + " song", 10, rebuilt, rebuilt),
+                )
+            for text in ["NOT music", "music AND NOT the", "song OR dance"]:
+                self.assertEqual(
+                    boolean_search(text, index), boolean_search(text, rebuilt)
+                )
+            for text in ["in music", "tokyo", "a"]:
+                self.assertEqual(title_search(text, index), title_search(text, rebuilt))
+            self.assertEqual(
+                article_length(5000, titles, index, 1000),
+                article_length(5000, titles, rebuilt, 1000),
+            )
+            self.assertEqual(
+                filter_to_author("Jack Johnson", titles, index),
+                filter_to_author("Jack Johnson", titles, rebuilt),
+            )
+            self.assertEqual(
+                articles_from_year(2009, titles, index),
+                articles_from_year(2009, titles, rebuilt),
+            )
+            self.assertEqual(
+                Query("music", index).max_length(20000).exclude("the").titles(),
+                Query("music", rebuilt).max_length(20000).exclude("the").titles(),
+            )
+
+        # The title index is first built after the removal
+        index = ArticleIndex.from_metadata(
+            [
+                ["Edogawa, Tokyo", "Ann", 0, 10, ["tokyo"]],
+                ["Tokyo Drift", "Ann", 0, 10, ["tokyo"]],
+            ]
+        )
+        index.remove_article("Edogawa, Tokyo")
+        self.assertEqual(title_search("tokyo", index), ["Tokyo Drift"])
+        index.add_article("Edogawa, Tokyo", "Ann", 0, 10, ["tokyo"])
+        self.assertEqual(
+            title_search("tokyo", index), ["Tokyo Drift", "Edogawa, Tokyo"]
+        )
+
+        # Stored keywords share the posting keys' string objects
+        index = ArticleIndex.from_metadata(
+            [[title, "Ann", 0, 10, ["".join(["mu", "sic"])]] for title in "AB"]
+        )
+        key = next(iter(index.postings))
+        self.assertTrue(all(keywords[0] is key for keywords in index.article_keywords))
+
+        index = ArticleIndex.from_metadata(metadata[:2])
+        with self.assertRaises(ValueError):
+            index.add_article(*metadata[0])
+        with self.assertRaises(KeyError):
+            index.update_article("Missing", "Ann", 0, 0, [])
+        with self.assertRaises(KeyError):
+            index.remove_article("Missing")
+
+    def test_segmented_index_unit_test(self):
+        rng = random.Random(11)
+        metadata = article_metadata()
+        keywords = ["music", "the", "canada", "dance", "song"]
+
+        def check(segmented, current):
+            rebuilt = ArticleIndex.from_metadata(list(current.values()))
+            for keyword in keywords:
+                self.assertEqual(
+                    sorted(search(keyword, segmented)), sorted(search(keyword, rebuilt))
+                )
+            self.assertEqual(dict(segmented.info()), dict(rebuilt.info()))
+            titles = list(current)
+            self.assertEqual(
+                sorted(article_length(5000, titles, segmented.info())),
+                sorted(article_length(5000, titles, rebuilt)),
+            )
+
+        def edit(segmented, current, steps):
+            for _ in range(steps):
+                article = rng.choice(metadata)
+                if rng.random() < 0.2:
+                    segmented.remove_article(article[0])
+                    current.pop(article[0], None)
+                else:
+                    article = [
+                        article[0],
+                        rng.choice([article[1], "Ann"]),
+                        article[2],
+                        rng.randint(100, 20000),
+                        rng.sample(article[4], len(article[4]) // 2),
+                    ]
+                    segmented.add_article(*article)
+                    current[article[0]] = article
+
+        with tempfile.TemporaryDirectory() as directory:
+            current = {article[0]: list(article) for article in metadata}
+            segmented = SegmentedIndex.from_indexes(
+                directory,
+                keyword_to_titles(metadata),
+                title_to_info(metadata),
+                memtable_limit=20,
+                max_segments=3,
+                merge_factor=2,
+                background=False,
+            )
+            check(segmented, current)
+            edit(segmented, current, 500)
+            self.assertGreater(len(segmented.segments), 3)
+            check(segmented, current)
+            while len(segmented.segments) > 3:
+                self.assertTrue(segmented.merge())
+            check(segmented, current)
+            segmented.close()
+
+            # Reopening recovers the segments, tombstones included
+            segmented = SegmentedIndex(directory, background=False)
+            check(segmented, current)
+            # A merge cut short before removing its inputs is finished on open
+            saved = {}
+            for name in os.listdir(directory):
+                with open(os.path.join(directory, name), "rb") as segment_file:
+                    saved[name] = segment_file.read()
+            while segmented.merge():
+                pass
+            self.assertEqual(len(segmented.segments), 1)
+            segmented.close()
+            for name, data in saved.items():
+                with open(os.path.join(directory, name), "wb") as segment_file:
+                    segment_file.write(data)
+            with SegmentedIndex(directory, background=False) as segmented:
+                self.assertEqual(len(segmented.segments), 1)
+                check(segmented, current)
+
+            with self.assertRaises(ValueError):
+                SegmentedIndex.from_indexes(directory, {}, {}, background=False)
+
+        # Merges in the background keep up with writes
+        with tempfile.TemporaryDirectory() as directory:
+            current = {}
+            with SegmentedIndex(
+                directory, memtable_limit=10, max_segments=2, merge_factor=2
+            ) as segmented:
+                edit(segmented, current, 1000)
+                check(segmented, current)
+            with SegmentedIndex(directory, background=False) as segmented:
+                check(segmented, current)
+
+    def test_write_ahead_log_unit_test(self):
+        metadata = article_metadata()
+        rng = random.Random(13)
+
+        def edit(durable, current, steps):
+            for _ in range(steps):
+                article = rng.choice(metadata)
+                if article[0] not in current:
+                    durable.add_article(*article)
+                    current[article[0]] = list(article)
+                elif rng.random() < 0.3:
+                    durable.remove_article(article[0])
+                    del current[article[0]]
+                else:
+                    article = [article[0], "Ann", article[2], 42, article[4][:3]]
+                    durable.update_article(*article)
+                    current[article[0]] = article
+
+        def check(durable, current):
+            rebuilt = ArticleIndex.from_metadata(list(current.values()))
+            self.assertEqual(dict(durable.index.info()), dict(rebuilt.info()))
+            self.assertEqual(
+                {k: sorted(v) for k, v in durable.index.items()},
+                {k: sorted(v) for k, v in rebuilt.items()},
+            )
+
+        with tempfile.TemporaryDirectory() as directory:
+            snapshot_path = os.path.join(directory, "index.snapshot")
+            log_path = os.path.join(directory, "index.log")
+            current = {article[0]: list(article) for article in metadata[:50]}
+            with DurableIndex(snapshot_path, log_path, metadata[:50]) as durable:
+                durable.checkpoint()
+                edit(durable, current, 200)
+                # A rejected edit is not logged
+                with self.assertRaises(KeyError):
+                    durable.remove_article("Missing")
+            with DurableIndex(snapshot_path, log_path) as durable:
+                self.assertEqual(durable.replayed, 200)
+                check(durable, current)
+
+            # A torn last record is dropped and cut off before new appends
+            operations, size = read_log(log_path)
+            with open(log_path, "ab") as log_file:
+                log_file.write(encode_record(["remove", metadata[0][0]])[:-3])
+            self.assertEqual(read_log(log_path), (operations, size))
+            with DurableIndex(snapshot_path, log_path) as durable:
+                check(durable, current)
+                edit(durable, current, 20)
+            self.assertEqual(len(read_log(log_path)[0]), 220)
+            self.assertEqual(os.path.getsize(log_path), read_log(log_path)[1])
+
+            # A corrupted record ends the log
+            with open(log_path, "r+b") as log_file:
+                log_file.seek(size - 2)
+                log_file.write(b"\xff")
+            self.assertEqual(len(read_log(log_path)[0]), 199)
+
+        with tempfile.TemporaryDirectory() as directory:
+            snapshot_path = os.path.join(directory, "index.snapshot")
+            log_path = os.path.join(directory, "index.log")
+            current = {}
+            with DurableIndex(snapshot_path, log_path) as durable:
+                edit(durable, current, 100)
+                with open(log_path, "rb") as log_file:
+                    saved = log_file.read()
+                durable.checkpoint()
+                self.assertEqual(os.path.getsize(log_path), 0)
+            with DurableIndex(snapshot_path, log_path) as durable:
+                self.assertEqual(durable.replayed, 0)
+                check(durable, current)
+            # A crash between the snapshot and emptying the log replays
+            # edits the snapshot already holds
+            with open(log_path, "wb") as log_file:
+                log_file.write(saved)
+            with DurableIndex(snapshot_path, log_path) as durable:
+                self.assertEqual(durable.replayed, 100)
+                check(durable, current)
+
+            # Concurrent appends share fsyncs
+            with WriteAheadLog(log_path) as log:
+                log.reset()
+                threads = [
+                    threading.Thread(
+                        target=lambda n=n: [
+                            log.append(["remove", "%d-%d" % (n, i)]) for i in range(50)
+                        ]
+                    )
+                    for n in range(8)
+                ]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                self.assertLessEqual(log.commits, 400)
+            operations, _ = read_log(log_path)
+            self.assertEqual(len(operations), 400)
+            for n in range(8):
+                self.assertEqual(
+                    [o[1] for o in operations if o[1].startswith("%d-" % n)],
+                    ["%d-%d" % (n, i) for i in range(50)],
+                )
+
+            # After a failed sync nothing more is reported durable
+            with WriteAheadLog(log_path) as log:
+                log.reset()
+                with patch("wal.os.fsync", side_effect=OSError("sync failed")):
+                    with self.assertRaises(OSError):
+                        log.append(["remove", "A"])
+                with self.assertRaises(OSError):
+                    log.append(["remove", "B"])
+                with self.assertRaises(OSError):
+                    log.reset()
+            self.assertEqual(read_log(log_path)[0], [["remove", "A"]])
+
+            title = next(iter(current))
+            with DurableIndex(snapshot_path, log_path) as durable:
+                with patch("wal.os.fsync", side_effect=OSError("sync failed")):
+                    with self.assertRaises(OSError):
+                        durable.remove_article(title)
+                with self.assertRaises(OSError):
+                    durable.add_article("A", "Ann", 0, 10, ["music"])
+                with self.assertRaises(OSError):
+                    durable.checkpoint()
+                self.assertNotIn("A", durable.index.title_ids)
+            # Reopening recovers what reached the log
+            with DurableIndex(snapshot_path, log_path) as durable:
+                self.assertNotIn(title, durable.index.title_ids)
+                durable.add_article("A", "Ann", 0, 10, ["music"])
+            with DurableIndex(snapshot_path, log_path) as durable:
+                self.assertIn("A", durable.index.title_ids)
+
+    def test_streaming_loader_unit_test(self):
+        metadata = [list(article) for article in article_metadata()]
+        expected = ArticleIndex.from_metadata(metadata)
+        with tempfile.TemporaryDirectory() as directory:
+            for name in ["articles.jsonl", "articles.tsv", "articles.jsonl.gz"]:
+                path = os.path.join(directory, name)
+                write_metadata(path, metadata)
+                self.assertEqual(list(read_metadata(path)), metadata)
+                chunks = list(read_chunks(path, 40))
+                self.assertEqual([len(chunk) for chunk in chunks], [40, 40, 19])
+                reports = []
+                index = load_index(
+                    path, 40, lambda rows, rate: reports.append((rows, rate))
+                )
+                self.assertEqual([rows for rows, _ in reports], [40, 80, 99])
+                self.assertTrue(all(rate > 0 for _, rate in reports))
+                self.assertEqual(dict(index.items()), dict(expected.items()))
+                self.assertEqual(dict(index.info()), dict(expected.info()))
+
+            path = os.path.join(directory, "objects.jsonl")
+            with open(path, "w", encoding="utf-8") as metadata_file:
+                metadata_file.write(
+                    '{"title": "A", "author": "Ann", "timestamp": 1, '
+                    '"length": 2, "keywords": ["x"]}\n\n'
+                )
+                metadata_file.write('["B", "Bo", 3, 4, []]\n')
+                metadata_file.write('["C", "Cy", 5]\n')
+            records = read_metadata(path)
+            self.assertEqual(next(records), ["A", "Ann", 1, 2, ["x"]])
+            self.assertEqual(next(records), ["B", "Bo", 3, 4, []])
+            with self.assertRaisesRegex(ValueError, "line 4"):
+                next(records)
+
+            with self.assertRaises(ValueError):
+                write_metadata(
+                    os.path.join(directory, "bad.tsv"), [["A\tB", "", 0, 0, []]]
+                )
+            with self.assertRaises(ValueError):
+                list(read_metadata(os.path.join(directory, "articles.csv")))
+
+            # The shared indexes can be built from a file
+            path = os.path.join(directory, "small.tsv")
+            write_metadata(path, metadata[:10])
+            invalidate_indexes()
+            try:
+                keyword_index, info = load_indexes(metadata_path=path)
+                self.assertEqual(list(info.info()), [a[0] for a in metadata[:10]])
+            finally:
+                invalidate_indexes()
+
+    def test_dump_parser_unit_test(self):
+        self.assertEqual(
+            strip_markup(
+                "a {{b {{c}} d}} [[e|f]] [[g]] [[File:h.jpg|i]] <ref>j</ref>"
+            ).split(),
+            ["a", "f", "g"],
+        )
+        self.assertEqual(
+            extract_keywords("Tokyo ward, '''TOKYO''' [[Tokyo]] wards ward in a 2008"),
+            ["tokyo", "ward"],
+        )
+        self.assertEqual(parse_timestamp("2008-09-28T13:04:01Z"), 1222607041)
+        history = """<mediawiki xmlns="http://www.mediawiki.org/xml/export-0.10/">
+          <siteinfo><sitename>Wikipedia</sitename></siteinfo>
+          <page>
+            <title>Edogawa, Tokyo</title><ns>0</ns><id>1</id>
+            <revision>
+              <timestamp>2001-01-01T00:00:00Z</timestamp>
+              <contributor><username>Old</username></contributor>
+              <text xml:space="preserve">old text</text>
+            </revision>
+            <revision>
+              <timestamp>2008-09-28T13:04:01Z</timestamp>
+              <contributor><ip>10.0.0.1</ip></contributor>
+              <text xml:space="preserve">'''Edogawa''' is a [[Special wards of Tokyo|ward]] of [[Tokyo]]. {{Infobox {{flag|Japan}}}} Edogawa ward &amp; Tokyo&lt;ref&gt;Tokyo&lt;/ref&gt;. [[Category:Tokyo]] [http://example.org Edogawa]</text>
+            </revision>
+          </page>
+          <page>
+            <title>Talk:Edogawa</title><ns>1</ns>
+            <revision>
+              <timestamp>2008-09-28T13:04:01Z</timestamp>
+              <contributor><username>Ann</username></contributor>
+              <text>talk talk</text>
+            </revision>
+          </page>
+          <page>
+            <title>Edogawa ward</title><ns>0</ns><redirect title="Edogawa, Tokyo" />
+            <revision>
+              <timestamp>2008-09-28T13:04:01Z</timestamp>
+              <contributor><username>Ann</username></contributor>
+              <text>#REDIRECT [[Edogawa, Tokyo]]</text>
+            </revision>
+          </page>
+        </mediawiki>"""
+        # Length counts the characters of the unescaped wikitext
+        edogawa = ["Edogawa, Tokyo", "10.0.0.1", 1222607041, 177]
+        edogawa.append(["edogawa", "ward", "tokyo"])
+        with tempfile.TemporaryDirectory() as directory:
+            for name, opener in [
+                ("dump.xml", open),
+                ("dump.xml.bz2", bz2.open),
+                ("dump.xml.gz", gzip.open),
+            ]:
+                path = os.path.join(directory, name)
+                with opener(path, "wt", encoding="utf-8") as dump_file:
+                    dump_file.write(history)
+                self.assertEqual(list(read_dump(path)), [edogawa])
+                self.assertEqual(list(read_metadata(path)), [edogawa])
+            self.assertEqual(
+                [record[0] for record in read_dump(path, (0, 1), redirects=True)],
+                ["Edogawa, Tokyo", "Talk:Edogawa", "Edogawa ward"],
+            )
+            # Only the latest revision of a page is still held when it is read
+            revisions = []
+            page_record = dump._page_record
+
+            def counting_page_record(page, namespaces, redirects):
+                revisions.append(len(page.findall("{*}revision")))
+                return page_record(page, namespaces, redirects)
+
+            with patch("dump._page_record", counting_page_record):
+                self.assertEqual(list(read_dump(path)), [edogawa])
+            self.assertEqual(revisions, [1, 1, 1])
+            index = load_index(path)
+            self.assertEqual(search("ward", index), ["Edogawa, Tokyo"])
+            self.assertEqual(
+                filter_to_author("10.0.0.1", ["Edogawa, Tokyo"], index),
+                ["Edogawa, Tokyo"],
+            )
+            self.assertEqual(
+                articles_from_year(2008, ["Edogawa, Tokyo"], index), ["Edogawa, Tokyo"]
+            )
+            with self.assertRaises(ValueError):
+                write_metadata(path, [edogawa])
+
     #####################
     # INTEGRATION TESTS #
     #####################
@@ -521,6 +1982,95 @@ class TestSearch(unittest.TestCase):
 
         self.assertEqual(output, expected)
 
+    @patch("builtins.input")
+    def test_boolean_query_integration_test(self, input_mock):
+        keyword = "dance NOT pop"
+        advanced_option = 6
+        advanced_response = ""
+
+        output = get_print(input_mock, [keyword, advanced_option, advanced_response])
+        expected = (
+            print_basic()
+            + keyword
+            + "\n"
+            + print_advanced()
+            + str(advanced_option)
+            + "\n\nHere are your articles: ['Old-time music', '1936 in music', 'Indian classical music']\n"
+        )
+
+        self.assertEqual(output, expected)
+
+    @patch("builtins.input")
+    def test_combined_advanced_integration_test(self, input_mock):
+        keyword = "music"
+        advanced_options = "5,4,2"
+        year = 2009
+        excluded = "dance"
+
+        output = get_print(input_mock, [keyword, advanced_options, year, excluded])
+        expected = (
+            print_basic()
+            + keyword
+            + "\n"
+            + print_advanced()
+            + advanced_options
+            + "\n"
+            + print_advanced_option(5)
+            + str(year)
+            + "\n"
+            + print_advanced_option(4)
+            + excluded
+            + "\n\nHere are your articles: {'Gary King': ['1922 in music'], 'Mack Johnson': ['Rock music', '1962 in country music'], 'Nihonjoe': ['Steve Perry (musician)']}\n"
+        )
+
+        self.assertEqual(output, expected)
+
+    @patch("builtins.input")
+    def test_ranked_integration_test(self, input_mock):
+        keyword = "music"
+        advanced_options = "5,7"
+        year = 2009
+        top = 3
+
+        output = get_print(input_mock, [keyword, advanced_options, year, top])
+        expected = (
+            print_basic()
+            + keyword
+            + "\n"
+            + print_advanced()
+            + advanced_options
+            + "\n"
+            + print_advanced_option(5)
+            + str(year)
+            + "\n"
+            + print_advanced_option(7)
+            + str(top)
+            + "\n\nHere are your articles: ['1962 in country music', '1922 in music', 'Steve Perry (musician)']\n"
+        )
+
+        self.assertEqual(output, expected)
+
+    @patch("builtins.input")
+    def test_wildcard_integration_test(self, input_mock):
+        keyword = "canad*"
+        advanced_option = 5
+        year = 2009
+
+        output = get_print(input_mock, [keyword, advanced_option, year])
+        expected = (
+            print_basic()
+            + keyword
+            + "\n"
+            + print_advanced()
+            + str(advanced_option)
+            + "\n"
+            + print_advanced_option(advanced_option)
+            + str(year)
+            + "\n\nHere are your articles: ['2009 in music']\n"
+        )
+
+        self.assertEqual(output, expected)
+
 
 # Write tests above this line. Do not remove.
 if __name__ == "__main__":
@@ -0,0 +1,434 @@
+from collections.abc import Mapping
+import json
+import os
+import re
+import threading
+
+from index import ArticleIndex
+from mapped_index import MappedIndex, write_mapped_index
+from storage import write_atomically
+
+# Log-structured index for a continuously edited corpus. Writes go to an
+# in-memory ArticleIndex, the memtable, which is flushed to an immutable
+# mapped segment once it holds MEMTABLE_LIMIT articles. A segment is named
+# after the range of flushes it covers, segment-<low>-<high>.map, and its
+# .tombstones sidecar lists the titles deleted before it was written, which
+# older segments may still hold. A background thread merges the adjacent run
+# of MERGE_FACTOR segments holding the fewest articles whenever there are
+# more than MAX_SEGMENTS, so a query never reads more than a few of them.
+MEMTABLE_LIMIT = 10_000
+MAX_SEGMENTS = 8
+MERGE_FACTOR = 4
+_SEGMENT_NAME = re.compile(r"segment-(\d+)-(\d+)\.map$")
+
+
+def _tombstones_path(path):
+    return path[: -len(".map")] + ".tombstones"
+
+
+def _write_tombstones(path, titles):
+    write_atomically(path, json.dumps(sorted(titles)).encode("utf-8"))
+
+
+def _read_tombstones(path):
+    with open(path, encoding="utf-8") as tombstones_file:
+        return set(json.load(tombstones_file))
+
+
+class _Segment:
+    """One mapped segment and the ids in it that newer writes replaced"""
+
+    def __init__(self, path, low, high, tombstones):
+        self.path = path
+        self.low = low
+        self.high = high
+        self.tombstones = tombstones
+        self.index = MappedIndex(path)
+        self.deleted = set()
+        # Queries still reading the segment, it is closed once a merge has
+        # retired it and the last of them is done
+        self.readers = 0
+        self.retired = False
+
+    def discard(self, title):
+        title_id = self.index.title_id(title)
+        if title_id is not None:
+            self.deleted.add(title_id)
+
+    def titles(self, keyword):
+        index = self.index
+        deleted = self.deleted
+        with index.lookup_ids(keyword) as ids:
+            return [
+                index.title(title_id) for title_id in ids if title_id not in deleted
+            ]
+
+    def live_titles(self):
+        index = self.index
+        deleted = self.deleted
+        return [
+            index.title(title_id)
+            for title_id in range(index.title_count)
+            if title_id not in deleted
+        ]
+
+    def info(self, title_id):
+        return {
+            "author": self.index.author(title_id),
+            "timestamp": self.index.timestamp(title_id),
+            "length": self.index.length(title_id),
+        }
+
+    def __len__(self):
+        return self.index.title_count - len(self.deleted)
+
+    def remove(self):
+        self.index.close()
+        os.remove(self.path)
+        os.remove(_tombstones_path(self.path))
+
+
+class SegmentedIndex:
+    """
+    Keyword and article index split into a memtable and immutable segments.
+
+    Behaves like keyword_to_titles' dictionary for search(), and info()
+    returns a view that behaves like title_to_info's dictionary. Writes are
+    blind, as in any log-structured store: add_article replaces an article
+    with the same title and remove_article leaves a tombstone, so neither
+    has to look for the article first. Either marks the title's id deleted
+    in every segment holding it, one binary search per segment.
+
+    Queries only hold the lock while listing the segments and reading the
+    memtable, never while reading a segment, and flushes and merges write
+    their files without it. Titles come oldest segment first, in article
+    order within each.
+    """
+
+    def __init__(
+        self,
+        directory,
+        memtable_limit=MEMTABLE_LIMIT,
+        max_segments=MAX_SEGMENTS,
+        merge_factor=MERGE_FACTOR,
+        normalized=False,
+        background=True,
+    ):
+        self.directory = directory
+        self.memtable_limit = memtable_limit
+        self.max_segments = max_segments
+        self.merge_factor = merge_factor
+        self.normalized = normalized
+        # Guards the segment list and the memtable, only ever held briefly
+        self._lock = threading.Lock()
+        # Orders writers and flushes
+        self._write_lock = threading.Lock()
+        # Only one merge runs at a time
+        self._merge_lock = threading.Lock()
+        self._merge_needed = threading.Condition(self._lock)
+        self._closed = False
+        os.makedirs(directory, exist_ok=True)
+        self.segments = self._open_segments()
+        self._sequence = self.segments[-1].high + 1 if self.segments else 0
+        self._memtable = ArticleIndex(normalized=normalized)
+        self._tombstones = set()
+        self._merger = None
+        if background:
+            self._merger = threading.Thread(target=self._merge_loop, daemon=True)
+            self._merger.start()
+
+    @classmethod
+    def from_indexes(cls, directory, keyword_to_titles, title_to_info, **options):
+        """Writes both dictionaries as the first segment of a new index"""
+        index = cls(directory, **options)
+        if index.segments:
+            index.close()
+            raise ValueError("%s already holds segments" % directory)
+        with index._write_lock:
+            path = index._segment_path(0, 0)
+            _write_tombstones(_tombstones_path(path), ())
+            write_mapped_index(path, keyword_to_titles, title_to_info, index.normalized)
+            with index._lock:
+                index.segments.append(_Segment(path, 0, 0, set()))
+                index._sequence = 1
+        return index
+
+    def _segment_path(self, low, high):
+        return os.path.join(self.directory, "segment-%06d-%06d.map" % (low, high))
+
+    def _open_segments(self):
+        ranges = []
+        for name in os.listdir(self.directory):
+            match = _SEGMENT_NAME.match(name)
+            if match is not None:
+                ranges.append((int(match.group(1)), int(match.group(2))))
+        # A merge that was cut short leaves its inputs next to its output,
+        # whose range covers theirs
+        ranges.sort(key=lambda bounds: (bounds[0], -bounds[1]))
+        segments = []
+        for low, high in ranges:
+            path = self._segment_path(low, high)
+            if segments and high <= segments[-1].high:
+                os.remove(path)
+                os.remove(_tombstones_path(path))
+                continue
+            tombstones = _read_tombstones(_tombstones_path(path))
+            segments.append(_Segment(path, low, high, tombstones))
+        # Titles written or deleted later shadow their older copies
+        shadowed = set()
+        for segment in reversed(segments):
+            titles = segment.index.titles_for_ids(range(segment.index.title_count))
+            for title_id, title in enumerate(titles):
+                if title in shadowed:
+                    segment.deleted.add(title_id)
+            shadowed.update(titles)
+            shadowed.update(segment.tombstones)
+        return segments
+
+    def add_article(self, title, author, timestamp, length, keywords):
+        """Indexes an article, replacing any indexed article with its title"""
+        with self._write_lock:
+            with self._lock:
+                for segment in self.segments:
+                    segment.discard(title)
+                if title in self._memtable.title_ids:
+                    self._memtable.update_article(
+                        title, author, timestamp, length, keywords
+                    )
+                else:
+                    self._memtable.add_article(
+                        title, author, timestamp, length, keywords
+                    )
+                self._tombstones.discard(title)
+            if len(self._memtable.title_ids) >= self.memtable_limit:
+                self._flush()
+
+    def update_article(self, title, author, timestamp, length, keywords):
+        """Replaces an article, the same blind write as add_article"""
+        self.add_article(title, author, timestamp, length, keywords)
+
+    def remove_article(self, title):
+        """Deletes an article, doing nothing when title is not indexed"""
+        with self._write_lock:
+            with self._lock:
+                for segment in self.segments:
+                    segment.discard(title)
+                if title in self._memtable.title_ids:
+                    self._memtable.remove_article(title)
+                self._tombstones.add(title)
+            if len(self._tombstones) >= self.memtable_limit:
+                self._flush()
+
+    def flush(self):
+        """Writes the memtable out as a new segment"""
+        with self._write_lock:
+            self._flush()
+
+    def _flush(self):
+        # Writers are held off by the write lock, so the memtable cannot
+        # change while it is written and queries keep reading it meanwhile
+        memtable = self._memtable
+        if not memtable.title_ids and not self._tombstones:
+            return
+        path = self._segment_path(self._sequence, self._sequence)
+        _write_tombstones(_tombstones_path(path), self._tombstones)
+        write_mapped_index(path, memtable, memtable.info(), self.normalized)
+        segment = _Segment(path, self._sequence, self._sequence, self._tombstones)
+        with self._lock:
+            self.segments.append(segment)
+            self._memtable = ArticleIndex(normalized=self.normalized)
+            self._tombstones = set()
+            self._sequence += 1
+            if len(self.segments) > self.max_segments:
+                self._merge_needed.notify()
+
+    def _merge_loop(self):
+        while True:
+            with self._lock:
+                while not self._closed and len(self.segments) <= self.max_segments:
+                    self._merge_needed.wait()
+                if self._closed:
+                    return
+            self.merge()
+
+    def merge(self):
+        """
+        Merges the adjacent run of segments holding the fewest articles
+
+        Returns whether there was more than one segment to merge. Titles
+        deleted while the merge runs are carried over to its output.
+        """
+        with self._merge_lock:
+            with self._lock:
+                if len(self.segments) < 2:
+                    return False
+                width = min(self.merge_factor, len(self.segments))
+                start = min(
+                    range(len(self.segments) - width + 1),
+                    key=lambda i: sum(len(s) for s in self.segments[i : i + width]),
+                )
+                window = self.segments[start : start + width]
+                deleted = [set(segment.deleted) for segment in window]
+                for segment in window:
+                    segment.readers += 1
+                # Tombstones only matter to older segments
+                tombstones = set()
+                if start > 0:
+                    for segment in window:
+                        tombstones.update(segment.tombstones)
+            try:
+                path = self._merge_window(window, deleted, tombstones)
+            finally:
+                self._release(window)
+            merged = _Segment(path, window[0].low, window[-1].high, tombstones)
+            with self._lock:
+                for segment, before in zip(window, deleted):
+                    for title_id in segment.deleted - before:
+                        merged.discard(segment.index.title(title_id))
+                start = self.segments.index(window[0])
+                self.segments[start : start + width] = [merged]
+                for segment in window:
+                    segment.retired = True
+                    if not segment.readers:
+                        segment.remove()
+            return True
+
+    def _merge_window(self, window, deleted, tombstones):
+        keyword_to_titles = {}
+        title_to_info = {}
+        for segment, removed in zip(window, deleted):
+            index = segment.index
+            for title_id in range(index.title_count):
+                if title_id not in removed:
+                    title_to_info[index.title(title_id)] = segment.info(title_id)
+            for keyword in index:
+                with index.lookup_ids(keyword) as ids:
+                    titles = [index.title(i) for i in ids if i not in removed]
+                if titles:
+                    keyword_to_titles.setdefault(keyword, []).extend(titles)
+        path = self._segment_path(window[0].low, window[-1].high)
+        _write_tombstones(_tombstones_path(path), tombstones)
+        write_mapped_index(path, keyword_to_titles, title_to_info, self.normalized)
+        return path
+
+    def _acquire(self):
+        # Must be called with the lock held
+        segments = list(self.segments)
+        for segment in segments:
+            segment.readers += 1
+        return segments
+
+    def _release(self, segments):
+        with self._lock:
+            for segment in segments:
+                segment.readers -= 1
+                if segment.retired and not segment.readers:
+                    segment.remove()
+
+    def close(self):
+        """Flushes the memtable, stops merging and closes every segment"""
+        with self._lock:
+            self._closed = True
+            self._merge_needed.notify()
+        if self._merger is not None:
+            self._merger.join()
+        self.flush()
+        with self._lock:
+            for segment in self.segments:
+                segment.index.close()
+            self.segments = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def info(self):
+        """Returns a read-only title_to_info style view over the index"""
+        return SegmentedInfo(self)
+
+    def get(self, keyword, default=None):
+        with self._lock:
+            segments = self._acquire()
+            recent = self._memtable.get(keyword, [])
+        try:
+            titles = []
+            for segment in segments:
+                titles.extend(segment.titles(keyword))
+        finally:
+            self._release(segments)
+        titles.extend(recent)
+        return titles if titles else default
+
+    def __getitem__(self, keyword):
+        titles = self.get(keyword)
+        if titles is None:
+            raise KeyError(keyword)
+        return titles
+
+    def __contains__(self, keyword):
+        return self.get(keyword) is not None
+
+    def keys(self):
+        # Keywords whose every article was deleted may still be listed
+        with self._lock:
+            segments = self._acquire()
+            keywords = dict.fromkeys(self._memtable)
+        try:
+            for segment in segments:
+                keywords.update(dict.fromkeys(segment.index))
+        finally:
+            self._release(segments)
+        return keywords.keys()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+
+class SegmentedInfo(Mapping):
+    """title -> {"author", "timestamp", "length"} view over a SegmentedIndex"""
+
+    def __init__(self, index):
+        self._index = index
+
+    def __getitem__(self, title):
+        index = self._index
+        with index._lock:
+            if title in index._memtable.title_ids:
+                return index._memtable.info()[title]
+            segments = index._acquire()
+        try:
+            # The newest segment holding the title decides, an older copy
+            # was replaced or deleted since
+            for segment in reversed(segments):
+                title_id = segment.index.title_id(title)
+                if title_id is not None:
+                    if title_id in segment.deleted:
+                        break
+                    return segment.info(title_id)
+        finally:
+            index._release(segments)
+        raise KeyError(title)
+
+    def _titles(self):
+        index = self._index
+        with index._lock:
+            segments = index._acquire()
+            recent = list(index._memtable.title_ids)
+        try:
+            titles = []
+            for segment in segments:
+                titles.extend(segment.live_titles())
+        finally:
+            index._release(segments)
+        return titles + recent
+
+    def __iter__(self):
+        return iter(self._titles())
+
+    def __len__(self):
+        return len(self._titles())
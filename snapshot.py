@@ -0,0 +1,321 @@
+from array import array
+import struct
+import sys
+import zlib
+
+from index import ArticleIndex
+from postings import decode_postings
+from storage import packed, write_atomically
+from table import ArticleTable
+
+# Snapshot file layout (little endian):
+#   header:  magic, format version, flags, crc32 of payload, payload size
+#   payload: counts, then NUL-separated title/author/keyword string blobs,
+#            then packed author id, timestamp, length, posting count and
+#            posting (title id) columns
+# Titles are stored in id order, so an ArticleIndex loads straight from the
+# columns and its postings, without going through title dictionaries.
+MAGIC = b"ASES"
+VERSION = 2
+# Keywords and authors were stored NFKC casefolded, see normalize.py
+FLAG_NORMALIZED = 1
+# Every posting list is strictly ascending
+FLAG_ASCENDING = 2
+_HEADER = struct.Struct("<4sHHIQ")
+_COUNTS = struct.Struct("<IIIIIQQQ")
+_SEPARATOR = "\0"
+
+
+def _join(strings, kind):
+    for string in strings:
+        if _SEPARATOR in string:
+            raise ValueError("%s %r contains a NUL character" % (kind, string))
+    return _SEPARATOR.join(strings).encode("utf-8")
+
+
+def _split(blob, count):
+    return str(blob, "utf-8").split(_SEPARATOR) if count else []
+
+
+def _unpacked(typecode, payload, offset, count):
+    column = array(typecode)
+    end = offset + count * column.itemsize
+    column.frombytes(payload[offset:end])
+    if sys.byteorder == "big":
+        column.byteswap()
+    return column, end
+
+
+def _dict_columns(keyword_to_titles, title_to_info):
+    titles = list(title_to_info)
+    title_ids = {title: title_id for title_id, title in enumerate(titles)}
+    for postings in keyword_to_titles.values():
+        for title in postings:
+            if title not in title_ids:
+                title_ids[title] = len(titles)
+                titles.append(title)
+
+    authors = []
+    author_ids = {}
+    author_column = []
+    for info in title_to_info.values():
+        if info["author"] not in author_ids:
+            author_ids[info["author"]] = len(authors)
+            authors.append(info["author"])
+        author_column.append(author_ids[info["author"]])
+
+    keywords = list(keyword_to_titles)
+    posting_counts = [len(keyword_to_titles[keyword]) for keyword in keywords]
+    postings = array("I")
+    ascending = True
+    for keyword in keywords:
+        ids = [title_ids[title] for title in keyword_to_titles[keyword]]
+        ascending = ascending and all(a < b for a, b in zip(ids, ids[1:]))
+        postings.extend(ids)
+    return (
+        titles,
+        authors,
+        author_column,
+        [info["timestamp"] for info in title_to_info.values()],
+        [info["length"] for info in title_to_info.values()],
+        keywords,
+        posting_counts,
+        postings,
+        ascending,
+    )
+
+
+def _index_columns(index):
+    table = index.table
+    ids = table.all_ids()
+    keywords = list(index.postings)
+    posting_counts = array("I", [index.frequencies[k] for k in keywords])
+    postings = array("I")
+    # Removed articles leave gaps, the live ids are renumbered densely
+    position = None
+    if table.removed:
+        position = {title_id: n for n, title_id in enumerate(ids)}
+    for keyword in keywords:
+        keyword_ids = index.postings[keyword]
+        if index.compressed:
+            keyword_ids = decode_postings(keyword_ids)
+        if position is not None:
+            keyword_ids = [position[title_id] for title_id in keyword_ids]
+        postings.extend(keyword_ids)
+    if position is None:
+        columns = table.authors, table.timestamps, table.lengths
+    else:
+        columns = [
+            [column[i] for i in ids]
+            for column in (table.authors, table.timestamps, table.lengths)
+        ]
+    return (
+        table.titles_for_ids(ids),
+        table.author_names,
+        *columns,
+        keywords,
+        posting_counts,
+        postings,
+        True,
+    )
+
+
+def dumps(keyword_to_titles, title_to_info=None, normalized=False):
+    """
+    Serializes both indexes to snapshot bytes
+
+    Without title_to_info, keyword_to_titles is an ArticleIndex, written
+    straight from its id columns and with its own normalized setting.
+    """
+    if title_to_info is None:
+        normalized = keyword_to_titles.normalized
+        columns = _index_columns(keyword_to_titles)
+    else:
+        columns = _dict_columns(keyword_to_titles, title_to_info)
+    (
+        titles,
+        authors,
+        author_column,
+        timestamps,
+        lengths,
+        keywords,
+        posting_counts,
+        postings,
+        ascending,
+    ) = columns
+
+    title_blob = _join(titles, "title")
+    author_blob = _join(authors, "author")
+    keyword_blob = _join(keywords, "keyword")
+    payload = b"".join(
+        [
+            _COUNTS.pack(
+                len(titles),
+                len(author_column),
+                len(authors),
+                len(keywords),
+                len(postings),
+                len(title_blob),
+                len(author_blob),
+                len(keyword_blob),
+            ),
+            title_blob,
+            author_blob,
+            keyword_blob,
+            packed("I", author_column),
+            packed("q", timestamps),
+            packed("q", lengths),
+            packed("I", posting_counts),
+            packed("I", postings),
+        ]
+    )
+    flags = (FLAG_NORMALIZED if normalized else 0) | (
+        FLAG_ASCENDING if ascending else 0
+    )
+    header = _HEADER.pack(MAGIC, VERSION, flags, zlib.crc32(payload), len(payload))
+    return header + payload
+
+
+def _read(data):
+    # Returns the header flags and the stored columns
+    if len(data) < _HEADER.size:
+        raise ValueError("snapshot is truncated")
+    magic, version, flags, checksum, size = _HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("not an index snapshot")
+    if version != VERSION:
+        raise ValueError("unsupported snapshot version %d" % version)
+    payload = memoryview(data)[_HEADER.size :]
+    if len(payload) != size:
+        raise ValueError("snapshot is truncated")
+    if zlib.crc32(payload) != checksum:
+        raise ValueError("snapshot checksum mismatch")
+
+    (
+        title_count,
+        info_count,
+        author_count,
+        keyword_count,
+        posting_count,
+        title_bytes,
+        author_bytes,
+        keyword_bytes,
+    ) = _COUNTS.unpack_from(payload)
+    offset = _COUNTS.size
+    titles = _split(payload[offset : offset + title_bytes], title_count)
+    offset += title_bytes
+    authors = _split(payload[offset : offset + author_bytes], author_count)
+    offset += author_bytes
+    keywords = _split(payload[offset : offset + keyword_bytes], keyword_count)
+    offset += keyword_bytes
+
+    author_column, offset = _unpacked("I", payload, offset, info_count)
+    timestamps, offset = _unpacked("q", payload, offset, info_count)
+    lengths, offset = _unpacked("q", payload, offset, info_count)
+    posting_counts, offset = _unpacked("I", payload, offset, keyword_count)
+    postings, offset = _unpacked("I", payload, offset, posting_count)
+    return flags, (
+        titles,
+        authors,
+        author_column,
+        timestamps,
+        lengths,
+        keywords,
+        posting_counts,
+        postings,
+    )
+
+
+def loads(data):
+    """Returns the (keyword_to_titles, title_to_info) pair stored in snapshot bytes"""
+    _, columns = _read(data)
+    (
+        titles,
+        authors,
+        author_column,
+        timestamps,
+        lengths,
+        keywords,
+        posting_counts,
+        postings,
+    ) = columns
+
+    title_to_info = {}
+    for title_id in range(len(author_column)):
+        title_to_info[titles[title_id]] = {
+            "author": authors[author_column[title_id]],
+            "timestamp": timestamps[title_id],
+            "length": lengths[title_id],
+        }
+
+    keyword_to_titles = {}
+    title_at = titles.__getitem__
+    start = 0
+    for keyword, count in zip(keywords, posting_counts):
+        keyword_to_titles[keyword] = list(
+            map(title_at, postings[start : start + count])
+        )
+        start += count
+    return keyword_to_titles, title_to_info
+
+
+def loads_index(data, compress=False):
+    """
+    Returns the ArticleIndex stored in snapshot bytes
+
+    The index is normalized if the snapshot was written from a normalized
+    one. Titles keep their stored ids and each keyword's ids are sliced
+    straight out of the posting column.
+    """
+    flags, columns = _read(data)
+    (
+        titles,
+        authors,
+        author_column,
+        timestamps,
+        lengths,
+        keywords,
+        posting_counts,
+        postings,
+    ) = columns
+    # Titles only found in keyword_to_titles have no info
+    missing = len(titles) - len(author_column)
+    if missing:
+        author_column.extend([len(authors)] * missing)
+        authors.append("")
+        timestamps.extend([0] * missing)
+        lengths.extend([0] * missing)
+    table = ArticleTable.from_columns(
+        titles,
+        authors,
+        author_column,
+        timestamps,
+        lengths,
+        bool(flags & FLAG_NORMALIZED),
+    )
+    keyword_ids = {}
+    start = 0
+    for keyword, count in zip(keywords, posting_counts):
+        ids = postings[start : start + count]
+        if not flags & FLAG_ASCENDING:
+            ids = array("I", sorted(set(ids)))
+        keyword_ids[keyword] = ids
+        start += count
+    return ArticleIndex.from_table(table, keyword_ids, compress)
+
+
+def write_snapshot(path, keyword_to_titles, title_to_info=None, normalized=False):
+    """Atomically writes both indexes, or an ArticleIndex, to a snapshot file"""
+    write_atomically(path, dumps(keyword_to_titles, title_to_info, normalized))
+
+
+def load_snapshot(path):
+    """Reads a snapshot file, raising ValueError if it is damaged or incompatible"""
+    with open(path, "rb") as snapshot_file:
+        return loads(snapshot_file.read())
+
+
+def load_snapshot_index(path, compress=False):
+    """Reads a snapshot file into an ArticleIndex, see loads_index"""
+    with open(path, "rb") as snapshot_file:
+        return loads_index(snapshot_file.read(), compress)
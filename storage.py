@@ -0,0 +1,39 @@
+from array import array
+import os
+import sys
+
+
+def packed(typecode, values):
+    """Returns values as a little endian column of typecode"""
+    column = array(typecode, values)
+    if sys.byteorder == "big":
+        column.byteswap()
+    return column.tobytes()
+
+
+def write_atomically(path, data):
+    """
+    Replaces the file at path with data, all or nothing
+
+    data goes to a temporary file that is synced before it is renamed over
+    path, and the directory is synced after, so the new file survives a
+    crash once this returns.
+    """
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "wb") as temporary_file:
+        temporary_file.write(data)
+        temporary_file.flush()
+        os.fsync(temporary_file.fileno())
+    os.replace(temporary_path, path)
+    _sync_directory(path)
+
+
+def _sync_directory(path):
+    # Makes the rename durable. Windows cannot open a directory to sync it.
+    if os.name == "nt":
+        return
+    directory = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(directory)
+    finally:
+        os.close(directory)
@@ -0,0 +1,378 @@
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections.abc import Mapping
+from datetime import datetime, timezone
+from normalize import normalize
+from postings import intersect
+
+try:
+    import numpy
+except ImportError:  # NumPy is optional, filters fall back to array scans
+    numpy = None
+
+
+def _id_array(ids):
+    # Filters hand ids around as array('I'), whatever produced them
+    if isinstance(ids, array) and ids.typecode == "I":
+        return ids
+    if numpy is not None and isinstance(ids, numpy.ndarray):
+        return array("I", ids.astype(numpy.uint32).tobytes())
+    return array("I", ids)
+
+
+class ArticleTable:
+    """
+    Columnar article info, one entry per article id.
+
+    Titles are kept in a list, authors are dictionary encoded into an
+    array('I') of author codes, with author_ids mapping each code to its
+    ascending article ids, and timestamps and lengths are array('q')
+    columns. The UTC year, month and day of each timestamp are derived once,
+    when the article is stored, and year_ids maps each year to its ascending
+    article ids. length_ids holds every article id sorted by length, next to
+    the matching sorted_lengths, for binary searched length ranges, and
+    total_length keeps their sum for ranking. New articles are only sorted
+    into the length index on the first length query after them, so a bulk
+    build sorts once rather than inserting article by article. With NumPy installed the
+    filters evaluate vectorized masks over the candidate ids, otherwise they
+    scan the columns in Python. A normalized table matches authors NFKC
+    casefolded, keeping the first spelling seen of each as its name.
+    Removed articles leave their column entries behind, their ids are never
+    reused, but are dropped from title_ids and every id index.
+    """
+
+    def __init__(self, normalized=False):
+        self.normalized = normalized
+        self.titles = []
+        self.title_ids = {}
+        self.author_names = []
+        self.author_codes = {}
+        self.authors = array("I")
+        self.author_ids = {}
+        self.timestamps = array("q")
+        self.lengths = array("q")
+        self.years = array("H")
+        self.months = array("B")
+        self.days = array("B")
+        self.year_ids = {}
+        self._length_ids = array("I")
+        self._sorted_lengths = array("q")
+        # Ids from here on are not in the length index yet
+        self._unsorted_from = 0
+        self.total_length = 0
+        self.removed = set()
+
+    @classmethod
+    def from_metadata(cls, metadata, normalized=False):
+        table = cls(normalized)
+        for article in metadata:
+            table.append(article[0], article[1], article[2], article[3])
+        return table
+
+    @classmethod
+    def from_columns(
+        cls, titles, author_names, authors, timestamps, lengths, normalized=False
+    ):
+        """
+        Builds a table from id ordered columns, as stored in a snapshot
+
+        titles must be distinct, and authors holds each article's position in
+        author_names.
+        """
+        table = cls(normalized)
+        table.titles = list(titles)
+        table.title_ids = {title: title_id for title_id, title in enumerate(titles)}
+        # Spellings that share a key, in a normalized table, share a code
+        codes = []
+        for author in author_names:
+            key = table.author_key(author)
+            code = table.author_codes.get(key)
+            if code is None:
+                code = table.author_codes[key] = len(table.author_names)
+                table.author_names.append(author)
+            codes.append(code)
+        table.authors = array("I", [codes[author] for author in authors])
+        table.timestamps = array("q", timestamps)
+        table.lengths = array("q", lengths)
+        for title_id, code in enumerate(table.authors):
+            table.author_ids.setdefault(code, array("I")).append(title_id)
+        for title_id, timestamp in enumerate(table.timestamps):
+            date = datetime.fromtimestamp(timestamp, timezone.utc)
+            table.years.append(date.year)
+            table.months.append(date.month)
+            table.days.append(date.day)
+            table.year_ids.setdefault(date.year, array("I")).append(title_id)
+        table.total_length = sum(table.lengths)
+        return table
+
+    def append(self, title, author, timestamp, length):
+        """
+        Stores an article and returns its id
+
+        A repeated title keeps its id and takes the latest info, like
+        title_to_info does.
+        """
+        key = self.author_key(author)
+        code = self.author_codes.get(key)
+        if code is None:
+            code = self.author_codes[key] = len(self.author_names)
+            self.author_names.append(author)
+        date = datetime.fromtimestamp(timestamp, timezone.utc)
+        title_id = self.title_ids.get(title)
+        if title_id is None:
+            title_id = self.title_ids[title] = len(self.titles)
+            self.titles.append(title)
+            self.authors.append(code)
+            self.author_ids.setdefault(code, array("I")).append(title_id)
+            self.timestamps.append(timestamp)
+            self.lengths.append(length)
+            self.years.append(date.year)
+            self.months.append(date.month)
+            self.days.append(date.day)
+            self.year_ids.setdefault(date.year, array("I")).append(title_id)
+            self.total_length += length
+        else:
+            if self.years[title_id] != date.year:
+                year_ids = self.year_ids[self.years[title_id]]
+                del year_ids[bisect_left(year_ids, title_id)]
+                insort(self.year_ids.setdefault(date.year, array("I")), title_id)
+            if self.authors[title_id] != code:
+                author_ids = self.author_ids[self.authors[title_id]]
+                del author_ids[bisect_left(author_ids, title_id)]
+                insort(self.author_ids.setdefault(code, array("I")), title_id)
+            if self.lengths[title_id] != length:
+                if title_id < self._unsorted_from:
+                    self._remove_length(title_id)
+                    self._insert_length(title_id, length)
+                self.total_length += length - self.lengths[title_id]
+            self.authors[title_id] = code
+            self.timestamps[title_id] = timestamp
+            self.lengths[title_id] = length
+            self.years[title_id] = date.year
+            self.months[title_id] = date.month
+            self.days[title_id] = date.day
+        return title_id
+
+    def remove(self, title_id):
+        """Drops an article from the id indexes and title lookups"""
+        del self.title_ids[self.titles[title_id]]
+        author_ids = self.author_ids[self.authors[title_id]]
+        del author_ids[bisect_left(author_ids, title_id)]
+        year_ids = self.year_ids[self.years[title_id]]
+        del year_ids[bisect_left(year_ids, title_id)]
+        if title_id < self._unsorted_from:
+            self._remove_length(title_id)
+        self.total_length -= self.lengths[title_id]
+        self.removed.add(title_id)
+
+    def all_ids(self):
+        """Returns the ascending ids of every stored article"""
+        if not self.removed:
+            return range(len(self.titles))
+        removed = self.removed
+        return array("I", [i for i in range(len(self.titles)) if i not in removed])
+
+    @property
+    def length_ids(self):
+        self._sort_lengths()
+        return self._length_ids
+
+    @property
+    def sorted_lengths(self):
+        self._sort_lengths()
+        return self._sorted_lengths
+
+    def _sort_lengths(self):
+        start = self._unsorted_from
+        if start == len(self.titles):
+            return
+        self._unsorted_from = len(self.titles)
+        removed = self.removed
+        new_ids = [i for i in range(start, len(self.titles)) if i not in removed]
+        # A few edits are inserted in place, a bulk build is sorted once
+        if len(new_ids) < 64:
+            for title_id in new_ids:
+                self._insert_length(title_id, self.lengths[title_id])
+            return
+        # New ids are all above the sorted ones and a stable sort keeps each
+        # group ascending, so equal lengths stay in id order
+        lengths = self.lengths
+        ids = self._length_ids.tolist() + new_ids
+        ids.sort(key=lengths.__getitem__)
+        self._length_ids = array("I", ids)
+        self._sorted_lengths = array("q", [lengths[i] for i in ids])
+
+    def _insert_length(self, title_id, length):
+        # Equal lengths stay in id order
+        low = bisect_left(self._sorted_lengths, length)
+        high = bisect_right(self._sorted_lengths, length)
+        position = bisect_left(self._length_ids, title_id, low, high)
+        self._sorted_lengths.insert(position, length)
+        self._length_ids.insert(position, title_id)
+
+    def _remove_length(self, title_id):
+        length = self.lengths[title_id]
+        low = bisect_left(self._sorted_lengths, length)
+        high = bisect_right(self._sorted_lengths, length)
+        position = bisect_left(self._length_ids, title_id, low, high)
+        del self._sorted_lengths[position]
+        del self._length_ids[position]
+
+    def _length_bounds(self, min_length, max_length):
+        low = 0 if min_length is None else bisect_left(self.sorted_lengths, min_length)
+        high = (
+            len(self.sorted_lengths)
+            if max_length is None
+            else bisect_right(self.sorted_lengths, max_length)
+        )
+        return low, max(low, high)
+
+    def length_range(self, min_length=None, max_length=None):
+        """Returns the ascending ids with min_length <= length <= max_length"""
+        low, high = self._length_bounds(min_length, max_length)
+        return array("I", sorted(self.length_ids[low:high]))
+
+    def average_length(self):
+        return self.total_length / len(self.title_ids) if self.title_ids else 0.0
+
+    def author_key(self, author):
+        """Returns the form author is looked up under"""
+        return normalize(author) if self.normalized else author
+
+    def _author_postings(self, author):
+        # The table's own array, callers must not change it
+        code = self.author_codes.get(self.author_key(author))
+        if code is None:
+            return array("I")
+        return self.author_ids[code]
+
+    def ids_by_author(self, author):
+        """Returns the ascending ids of articles last edited by author, a copy"""
+        return array("I", self._author_postings(author))
+
+    def author_count(self, author):
+        """Returns how many articles author last edited"""
+        return len(self._author_postings(author))
+
+    def author(self, title_id):
+        return self.author_names[self.authors[title_id]]
+
+    def ids_for_titles(self, titles):
+        """Returns the ascending ids of the known titles in titles"""
+        title_ids = self.title_ids
+        return array("I", sorted({title_ids[t] for t in titles if t in title_ids}))
+
+    def titles_for_ids(self, ids):
+        titles = self.titles
+        return [titles[title_id] for title_id in ids]
+
+    def _select(self, ids, column, dtype, test):
+        # Copies the selected ids out before the column view is dropped, an
+        # array cannot grow while NumPy is viewing its buffer
+        candidates = numpy.frombuffer(_id_array(ids), dtype=numpy.uint32)
+        values = numpy.frombuffer(column, dtype=dtype)[candidates]
+        return _id_array(candidates[test(values)])
+
+    def length_count(self, min_length=None, max_length=None):
+        """Returns how many articles have min_length <= length <= max_length"""
+        low, high = self._length_bounds(min_length, max_length)
+        return high - low
+
+    def scan_length(self, ids, max_length, min_length=None):
+        """Tests each candidate's length rather than using the length index"""
+        if max_length is None:
+            max_length = self.sorted_lengths[-1] if self.sorted_lengths else 0
+        if min_length is None:
+            min_length = self.sorted_lengths[0] if self.sorted_lengths else 0
+        if numpy is not None and len(ids):
+            return self._select(
+                ids,
+                self.lengths,
+                numpy.int64,
+                lambda lengths: (min_length <= lengths) & (lengths <= max_length),
+            )
+        lengths = self.lengths
+        return array("I", [i for i in ids if min_length <= lengths[i] <= max_length])
+
+    def scan_author(self, ids, author):
+        """Tests each candidate's author rather than using the author index"""
+        code = self.author_codes.get(self.author_key(author))
+        if code is None:
+            return array("I")
+        if numpy is not None and len(ids):
+            return self._select(ids, self.authors, numpy.uint32, lambda a: a == code)
+        authors = self.authors
+        return array("I", [i for i in ids if authors[i] == code])
+
+    def scan_year(self, ids, year):
+        """Tests each candidate's year rather than using the year index"""
+        if not isinstance(year, int):
+            return array("I")
+        if numpy is not None and len(ids):
+            return self._select(ids, self.years, numpy.uint16, lambda y: y == year)
+        years = self.years
+        return array("I", [i for i in ids if years[i] == year])
+
+    def filter_length(self, ids, max_length, min_length=None):
+        """Returns the ids in ids with min_length <= length <= max_length"""
+        # Testing a candidate is far cheaper than sorting and intersecting a
+        # range id, so the range is only used when it is much smaller
+        count = self.length_count(min_length, max_length)
+        if count * (256 if numpy is not None else 16) < len(ids):
+            return intersect(_id_array(ids), self.length_range(min_length, max_length))
+        return self.scan_length(ids, max_length, min_length)
+
+    def filter_author(self, ids, author):
+        author_ids = self._author_postings(author)
+        if numpy is not None and len(author_ids) * 8 >= len(ids):
+            return self.scan_author(ids, author)
+        return intersect(_id_array(ids), author_ids)
+
+    def filter_year(self, ids, year):
+        # Uses the precomputed years, no timestamp is converted per query
+        if numpy is not None:
+            return self.scan_year(ids, year)
+        return intersect(_id_array(ids), self.year_ids.get(year, ()))
+
+    def key_by_author(self, ids):
+        """Returns a dictionary of author -> titles over ids, in one pass"""
+        # Grouped by author code first, names are only looked up per group
+        groups = {}
+        authors = self.authors
+        titles = self.titles
+        for title_id in ids:
+            code = authors[title_id]
+            group = groups.get(code)
+            if group is None:
+                groups[code] = [titles[title_id]]
+            else:
+                group.append(titles[title_id])
+        return {self.author_names[code]: group for code, group in groups.items()}
+
+    def info(self):
+        """Returns a read-only title_to_info style view over the table"""
+        return ArticleInfo(self)
+
+    def __len__(self):
+        return len(self.title_ids)
+
+
+class ArticleInfo(Mapping):
+    """title -> {"author", "timestamp", "length"} view over an ArticleTable"""
+
+    def __init__(self, table):
+        self._table = table
+
+    def __getitem__(self, title):
+        title_id = self._table.title_ids[title]
+        return {
+            "author": self._table.author(title_id),
+            "timestamp": self._table.timestamps[title_id],
+            "length": self._table.lengths[title_id],
+        }
+
+    def __iter__(self):
+        return iter(self._table.title_ids)
+
+    def __len__(self):
+        return len(self._table.title_ids)
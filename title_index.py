@@ -0,0 +1,113 @@
+from array import array
+from bisect import bisect_left
+import re
+
+from postings import intersect_all, union_all
+
+# Titles are matched case-insensitively. Each title is padded with these
+# markers before its trigrams are taken, so titles shorter than three
+# characters still have trigrams and every one or two character substring
+# lies inside one.
+_START = "\x02"
+_END = "\x03"
+_WORDS = re.compile(r"\w+")
+
+
+def _trigrams(text):
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+class TitleIndex:
+    """
+    Word and trigram postings over article titles.
+
+    Titles are casefolded and split into words, each word mapping to the
+    ascending ids of the titles containing it, and into character trigrams,
+    each mapping likewise. Substrings of three or more characters can only
+    be in titles holding all of their trigrams, so those postings are
+    intersected, smallest first, and just the surviving candidates are
+    checked. Shorter substrings gather the postings of the trigrams
+    containing them. No lookup scans every title.
+    """
+
+    def __init__(self, titles=()):
+        self.folded = []
+        self.words = {}
+        self.trigrams = {}
+        for title in titles:
+            self.add(title)
+
+    def add(self, title):
+        """Indexes title under the next id and returns that id"""
+        title_id = len(self.folded)
+        folded = title.casefold()
+        self.folded.append(folded)
+        for word in set(_WORDS.findall(folded)):
+            self.words.setdefault(word, array("I")).append(title_id)
+        for trigram in _trigrams(_START + folded + _END):
+            self.trigrams.setdefault(trigram, array("I")).append(title_id)
+        return title_id
+
+    def remove(self, title_id):
+        """Drops title_id from every posting, its id is not reused"""
+        folded = self.folded[title_id]
+        for word in set(_WORDS.findall(folded)):
+            self._unpost(self.words, word, title_id)
+        for trigram in _trigrams(_START + folded + _END):
+            self._unpost(self.trigrams, trigram, title_id)
+        # Matches no part, so the id can never be verified again
+        self.folded[title_id] = ""
+
+    @staticmethod
+    def _unpost(postings, key, title_id):
+        ids = postings[key]
+        del ids[bisect_left(ids, title_id)]
+        if not ids:
+            del postings[key]
+
+    def match_words(self, text):
+        """Returns the ascending ids of titles containing every word of text"""
+        words = set(_WORDS.findall(text.casefold()))
+        if not words:
+            return array("I")
+        return intersect_all([self.words.get(word, array("I")) for word in words])
+
+    def candidates(self, parts):
+        """Returns ascending ids of titles that may contain every casefolded part"""
+        trigrams = set()
+        for part in parts:
+            trigrams.update(_trigrams(part))
+        if trigrams:
+            return intersect_all(
+                [self.trigrams.get(trigram, array("I")) for trigram in trigrams]
+            )
+        # Parts shorter than three characters sit inside some padded trigram
+        # of every title holding them, only the trigram keys are scanned
+        part = max(parts, key=len)
+        return union_all(
+            [ids for trigram, ids in self.trigrams.items() if part in trigram]
+        )
+
+    def match(self, text):
+        """
+        Returns the ascending ids of titles containing every part of text
+
+        text is split on whitespace and each part is matched as a
+        case-insensitive substring, so "edo tok" finds "Edogawa, Tokyo".
+        """
+        parts = text.casefold().split()
+        if not parts:
+            return array("I")
+        ids = self.candidates(parts)
+        folded = self.folded
+        return array(
+            "I",
+            [
+                title_id
+                for title_id in ids
+                if all(part in folded[title_id] for part in parts)
+            ],
+        )
+
+    def __len__(self):
+        return len(self.folded)
@@ -0,0 +1,83 @@
+from bisect import bisect_left, insort
+import re
+
+# Most keywords a prefix or wildcard expands to, so a short pattern such as
+# "s*" cannot turn one query into a union over much of the vocabulary
+EXPANSION_LIMIT = 1000
+# Sorts after every character, so prefix + _LAST bounds the prefix's range
+_LAST = "\U0010ffff"
+
+
+def is_wildcard(keyword):
+    """Returns whether keyword is a pattern such as "canad*" or "s*ng" """
+    return "*" in keyword
+
+
+class Vocabulary:
+    """
+    Sorted keywords for prefix and wildcard expansion.
+
+    A prefix is two binary searches over the sorted keywords, so expanding it
+    costs O(log V + matches). A pattern with "*" inside or at the start is
+    matched against the range of its literal prefix, the text before the
+    first "*". keywords may be any sorted sequence, like a mapped index's
+    keyword table, when presorted is set.
+    """
+
+    def __init__(self, keywords=(), presorted=False):
+        self.keywords = keywords if presorted else sorted(set(keywords))
+
+    def add(self, keyword):
+        """Inserts keyword in order, the keywords have to be a list"""
+        if keyword not in self:
+            insort(self.keywords, keyword)
+
+    def remove(self, keyword):
+        """Deletes keyword if present, the keywords have to be a list"""
+        position = bisect_left(self.keywords, keyword)
+        if position < len(self.keywords) and self.keywords[position] == keyword:
+            del self.keywords[position]
+
+    def prefix_range(self, prefix):
+        """Returns the (low, high) positions of the keywords starting with prefix"""
+        low = bisect_left(self.keywords, prefix)
+        if not prefix:
+            return low, len(self.keywords)
+        return low, bisect_left(self.keywords, prefix + _LAST, low)
+
+    def complete(self, prefix, limit=EXPANSION_LIMIT):
+        """Returns up to limit keywords starting with prefix, in sorted order"""
+        low, high = self.prefix_range(prefix)
+        return [
+            self.keywords[position] for position in range(low, min(high, low + limit))
+        ]
+
+    def expand(self, pattern, limit=EXPANSION_LIMIT):
+        """
+        Returns up to limit keywords matching pattern, in sorted order
+
+        "*" matches any run of characters, everything else matches itself. A
+        pattern without "*" expands to itself when it is a keyword.
+        """
+        prefix, star, rest = pattern.partition("*")
+        if not star:
+            return [pattern] if pattern in self else []
+        if not rest.strip("*"):
+            return self.complete(prefix, limit)
+        matcher = re.compile(".*".join(re.escape(part) for part in pattern.split("*")))
+        matches = []
+        low, high = self.prefix_range(prefix)
+        for position in range(low, high):
+            keyword = self.keywords[position]
+            if matcher.fullmatch(keyword):
+                matches.append(keyword)
+                if len(matches) == limit:
+                    break
+        return matches
+
+    def __contains__(self, keyword):
+        position = bisect_left(self.keywords, keyword)
+        return position < len(self.keywords) and self.keywords[position] == keyword
+
+    def __len__(self):
+        return len(self.keywords)
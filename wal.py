@@ -0,0 +1,239 @@
+import json
+import os
+import struct
+import threading
+import zlib
+
+from index import ArticleIndex
+from snapshot import load_snapshot_index, write_snapshot
+
+# Append-only log of article edits. Each record is its payload's size and
+# crc32 followed by the payload, a JSON list holding the operation name and
+# its arguments:
+#   ["add", title, author, timestamp, length, keywords]
+#   ["update", title, author, timestamp, length, keywords]
+#   ["remove", title]
+# A crash can leave the last record torn, reading stops at the first record
+# that is short or fails its checksum.
+_RECORD = struct.Struct("<II")
+
+
+def encode_record(operation):
+    """Returns the log record for an operation list"""
+    payload = json.dumps(operation, ensure_ascii=False).encode("utf-8")
+    return _RECORD.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def read_log(path):
+    """
+    Returns (operations, size), the operations of every intact record and
+    the number of bytes they take up. A missing log holds no operations.
+    """
+    try:
+        with open(path, "rb") as log_file:
+            data = log_file.read()
+    except FileNotFoundError:
+        return [], 0
+    operations = []
+    offset = 0
+    while offset + _RECORD.size <= len(data):
+        size, checksum = _RECORD.unpack_from(data, offset)
+        start = offset + _RECORD.size
+        payload = data[start : start + size]
+        if len(payload) != size or zlib.crc32(payload) != checksum:
+            break
+        operations.append(json.loads(payload))
+        offset = start + size
+    return operations, offset
+
+
+class WriteAheadLog:
+    """
+    Append-only, checksummed log file with group commit.
+
+    append() returns once its record is on disk. While one thread writes and
+    fsyncs a batch, records appended meanwhile queue up and the next thread
+    to find the log idle commits them all with a single fsync, so concurrent
+    writers share the cost of syncing. Records are written in append order.
+
+    A failed write or sync leaves the log unusable, as there is no telling
+    which records reached the disk. Every waiting and later call raises
+    OSError, and reopening the log recovers whatever was committed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # A torn record left by a crash is cut off, so appends follow the
+        # last intact one
+        _, size = read_log(path)
+        self._file = open(path, "ab")
+        self._file.truncate(size)
+        self._lock = threading.Lock()
+        self._committed = threading.Condition(self._lock)
+        self._pending = []
+        self._appended = 0
+        self._durable = 0
+        self._writing = False
+        self.commits = 0
+        # The error that made the log unusable, if any
+        self.failed = None
+
+    def check(self):
+        """Raises OSError if an earlier write or sync failed"""
+        if self.failed is not None:
+            raise OSError("write-ahead log %s failed" % self.path) from self.failed
+
+    def write(self, operation):
+        """Queues an operation's record and returns its sequence number"""
+        record = encode_record(operation)
+        with self._lock:
+            self.check()
+            self._pending.append(record)
+            self._appended += 1
+            return self._appended
+
+    def wait(self, sequence):
+        """Returns once every record up to sequence is on disk"""
+        with self._lock:
+            while self._durable < sequence:
+                self.check()
+                if self._writing:
+                    self._committed.wait()
+                    continue
+                batch = self._pending
+                self._pending = []
+                last = self._appended
+                self._writing = True
+                self._lock.release()
+                try:
+                    self._file.write(b"".join(batch))
+                    self._file.flush()
+                    os.fsync(self._file.fileno())
+                except BaseException as error:
+                    self._lock.acquire()
+                    self.failed = error
+                    raise
+                else:
+                    self._lock.acquire()
+                    self._durable = last
+                    self.commits += 1
+                finally:
+                    self._writing = False
+                    self._committed.notify_all()
+
+    def append(self, operation):
+        """Writes an operation's record and returns once it is on disk"""
+        self.wait(self.write(operation))
+
+    def reset(self):
+        """Empties the log, once its operations are in a snapshot"""
+        with self._lock:
+            while self._writing:
+                self._committed.wait()
+            self.check()
+            self._file.truncate(0)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._pending = []
+            self._durable = self._appended
+
+    def close(self):
+        try:
+            if self.failed is None:
+                self.wait(self._appended)
+        finally:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def apply_operation(index, operation, replay=False):
+    """
+    Applies a logged operation to an ArticleIndex
+
+    With replay, adds of indexed titles update them and removes of unknown
+    titles are skipped, so replaying a log whose start is already in the
+    snapshot ends in the same state.
+    """
+    name, arguments = operation[0], operation[1:]
+    if name not in ("add", "update", "remove"):
+        raise ValueError("unknown log operation %r" % (name,))
+    if replay:
+        if name == "remove":
+            if arguments[0] not in index.title_ids:
+                return
+        else:
+            name = "update" if arguments[0] in index.title_ids else "add"
+    if name == "add":
+        index.add_article(*arguments)
+    elif name == "update":
+        index.update_article(*arguments)
+    else:
+        index.remove_article(*arguments)
+
+
+class DurableIndex:
+    """
+    ArticleIndex whose edits survive a crash.
+
+    Every edit is applied to the index and appended to a write-ahead log
+    before it returns. Opening replays the log onto the last snapshot, and
+    checkpoint() writes a new snapshot and empties the log. Edits are
+    applied in log order, but threads wait for their records to reach the
+    disk outside the index lock, so concurrent edits are group committed.
+    Once the log fails, the index may hold edits that never reached it, so
+    every later edit and checkpoint raises OSError. Reopening recovers the
+    committed state.
+    """
+
+    def __init__(self, snapshot_path, log_path, metadata=None):
+        self.snapshot_path = snapshot_path
+        self.log_path = log_path
+        if os.path.exists(snapshot_path):
+            self.index = load_snapshot_index(snapshot_path)
+        else:
+            self.index = ArticleIndex.from_metadata(metadata or [])
+        operations, _ = read_log(log_path)
+        for operation in operations:
+            apply_operation(self.index, operation, replay=True)
+        self.replayed = len(operations)
+        self.log = WriteAheadLog(log_path)
+        self._lock = threading.Lock()
+
+    def _edit(self, operation):
+        with self._lock:
+            self.log.check()
+            # Applied first, an edit the index rejects is never logged
+            apply_operation(self.index, operation)
+            sequence = self.log.write(operation)
+        self.log.wait(sequence)
+
+    def add_article(self, title, author, timestamp, length, keywords):
+        self._edit(["add", title, author, timestamp, length, list(keywords)])
+
+    def update_article(self, title, author, timestamp, length, keywords):
+        self._edit(["update", title, author, timestamp, length, list(keywords)])
+
+    def remove_article(self, title):
+        self._edit(["remove", title])
+
+    def checkpoint(self):
+        """Snapshots the index and empties the log"""
+        with self._lock:
+            # A snapshot must not hold edits the failed log lost
+            self.log.check()
+            write_snapshot(self.snapshot_path, self.index)
+            self.log.reset()
+
+    def close(self):
+        self.log.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -8,7 +8,9 @@ ADVANCED = (
     "4. Filter out keyword\n"
     "5. Articles from year\n"
     "6. None\n"
-    "Please enter a number corresponding to which advanced search you would like to perform: "
+    "7. Rank by relevance\n"
+    "Please enter a number corresponding to which advanced search you would like to perform"
+    " (separate several numbers with commas to combine them): "
 )
 
 ADVANCED_TO_QUESTION = {
@@ -18,6 +20,7 @@ ADVANCED_TO_QUESTION = {
     4: "What keyword would you like to exclude from your search? ",
     5: "What year would you like articles from? ",
     6: "",
+    7: "How many of the most relevant articles would you like? ",
 }
 
 METADATA = [
@@ -5125,11 +5128,20 @@ def ask_search():
 
 
 def ask_advanced_search():
-    request = int(input(ADVANCED))
+    return _ask_advanced_answer(int(input(ADVANCED)))
+
+
+def ask_advanced_searches():
+    """Returns an [option, answer] pair per advanced search, several can be chosen"""
+    requests = input(ADVANCED).split(",")
+    return [_ask_advanced_answer(int(request)) for request in requests]
+
+
+def _ask_advanced_answer(request):
     answer = (
         input(ADVANCED_TO_QUESTION[request]) if request != 2 and request != 6 else ""
     )
-    if request == 1 or request == 5:
+    if request == 1 or request == 5 or request == 7:
         return [request, int(answer)]
     else:
         return [request, answer]